@@ -34,6 +34,65 @@ CERTEGO_BUFFALOGS_ALERT_MAX_DAYS = 45
 CERTEGO_BUFFALOGS_IP_MAX_DAYS = 45
 CERTEGO_BUFFALOGS_MOBILE_DEVICES = ["iOS", "Android", "Windows Phone"]
 
+# Rows deleted by each batch of the retention, committed one by one, and pause between the batches, to not stall the concurrent detection
+CERTEGO_BUFFALOGS_RETENTION_BATCH_SIZE = int(os.environ.get("BUFFALOGS_RETENTION_BATCH_SIZE", 10000))
+CERTEGO_BUFFALOGS_RETENTION_SLEEP_SECONDS = float(os.environ.get("BUFFALOGS_RETENTION_SLEEP_SECONDS", 0.1))
+# Optional monthly partitioning of the Login and Alert tables (enabled by the partition_tables command):
+# the partitions of the next PARTITIONS_MONTHS_AHEAD months are created in advance, and the expired ones are dropped (or only detached, to archive them)
+CERTEGO_BUFFALOGS_PARTITIONS_MONTHS_AHEAD = int(os.environ.get("BUFFALOGS_PARTITIONS_MONTHS_AHEAD", 3))
+CERTEGO_BUFFALOGS_PARTITIONS_DETACH_ONLY = os.environ.get("BUFFALOGS_PARTITIONS_DETACH_ONLY", "false").lower() == "true"
+
+# Maximum number of distinct user-agents whose parsing (device fingerprint and OS family) is cached by each process
+CERTEGO_BUFFALOGS_USER_AGENT_CACHE_SIZE = int(os.environ.get("BUFFALOGS_USER_AGENT_CACHE_SIZE", 4096))
+
+# Seconds after which each process checks if the cached Config snapshot is still up-to-date (the changes saved by the same process are applied immediately)
+CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS = int(os.environ.get("BUFFALOGS_CONFIG_CACHE_SECONDS", 30))
+
+# Maximum number of alerters notifying the alerts at the same time, and default maximum number of messages sent at the same time by each alerter
+# (overridden by the "max_workers" field of the alerter configuration in alerting.json)
+CERTEGO_BUFFALOGS_NOTIFY_MAX_WORKERS = int(os.environ.get("BUFFALOGS_NOTIFY_MAX_WORKERS", 4))
+CERTEGO_BUFFALOGS_ALERTER_MAX_WORKERS = int(os.environ.get("BUFFALOGS_ALERTER_MAX_WORKERS", 1))
+
+# Notification outbox: maximum number of alerts claimed by each alerter run, seconds after which the alerts claimed by a crashed run are claimed again,
+# maximum number of attempts to send an alert and delay (doubled after each failed attempt) before sending it again
+CERTEGO_BUFFALOGS_NOTIFY_BATCH_SIZE = int(os.environ.get("BUFFALOGS_NOTIFY_BATCH_SIZE", 1000))
+CERTEGO_BUFFALOGS_NOTIFY_LEASE_SECONDS = int(os.environ.get("BUFFALOGS_NOTIFY_LEASE_SECONDS", 600))
+CERTEGO_BUFFALOGS_NOTIFY_MAX_ATTEMPTS = int(os.environ.get("BUFFALOGS_NOTIFY_MAX_ATTEMPTS", 5))
+CERTEGO_BUFFALOGS_NOTIFY_RETRY_SECONDS = int(os.environ.get("BUFFALOGS_NOTIFY_RETRY_SECONDS", 300))
+# Seconds before the last enqueue of an alerter in which the new alerts are looked for, because the alerts of a detection transaction
+# are committed some time after their creation (the older alerts not notified yet are added only when start_date and end_date are given)
+CERTEGO_BUFFALOGS_NOTIFY_LOOKBACK_SECONDS = int(os.environ.get("BUFFALOGS_NOTIFY_LOOKBACK_SECONDS", 3600))
+
+# HTTP sessions shared by the alerters: maximum number of kept-alive connections for each destination and default timeout (in seconds) of the requests
+CERTEGO_BUFFALOGS_ALERTING_HTTP_POOL_SIZE = int(os.environ.get("BUFFALOGS_ALERTING_HTTP_POOL_SIZE", 10))
+CERTEGO_BUFFALOGS_ALERTING_HTTP_TIMEOUT = float(os.environ.get("BUFFALOGS_ALERTING_HTTP_TIMEOUT", 10))
+
+# Directory where the compiled alert templates are cached, shared by all the processes (if not set, they are cached only in memory by each process)
+CERTEGO_BUFFALOGS_TEMPLATES_BYTECODE_CACHE_PATH = os.environ.get("BUFFALOGS_TEMPLATES_BYTECODE_CACHE_PATH", None)
+
+# Number of logins of a user processed in a single transaction by the detection, before flushing the new rows to the DB
+CERTEGO_BUFFALOGS_DETECTION_BATCH_SIZE = int(os.environ.get("BUFFALOGS_DETECTION_BATCH_SIZE", 500))
+# Number of shards (Celery subtasks) among which the users are split by the detection (1 = serial detection in the BuffalogsProcessLogsTask).
+# The fan-out requires a Celery result backend supporting chords (e.g. Redis or Database)
+CERTEGO_BUFFALOGS_DETECTION_SHARDS = int(os.environ.get("BUFFALOGS_DETECTION_SHARDS", 1))
+# Seconds after which the windows dispatched to the shards and not completed (e.g. because a shard has failed) are dispatched again
+CERTEGO_BUFFALOGS_DETECTION_LEASE_SECONDS = int(os.environ.get("BUFFALOGS_DETECTION_LEASE_SECONDS", 3 * 3600))
+CERTEGO_BUFFALOGS_CELERY_RESULT_BACKEND = os.environ.get("BUFFALOGS_CELERY_RESULT_BACKEND", None)
+# Number of shards among which the users are split when the BuffalogsProcessLogsTask catches up a backlog (more than MAX_WINDOWS_PER_RUN windows),
+# if the Celery result backend is set: the backlog windows are detected in parallel even with DETECTION_SHARDS = 1
+CERTEGO_BUFFALOGS_BACKLOG_SHARDS = int(os.environ.get("BUFFALOGS_BACKLOG_SHARDS", 4))
+# Adaptive time windows of the BuffalogsProcessLogsTask: the windows (starting from WINDOW_MINUTES long) are split if they contain more than
+# WINDOW_TARGET_LOGINS logins and enlarged if they are quiet, between MIN_WINDOW_MINUTES and MAX_WINDOW_MINUTES.
+# At least MAX_WINDOWS_PER_RUN windows are processed by each run, or more if the backlog would need more than BACKLOG_DRAIN_RUNS runs to be drained
+# with windows of WINDOW_MINUTES. If MAX_BACKLOG_DAYS is set, the backlog older than MAX_BACKLOG_DAYS is skipped (and logged as lost data)
+CERTEGO_BUFFALOGS_WINDOW_MINUTES = 30
+CERTEGO_BUFFALOGS_MIN_WINDOW_MINUTES = 5
+CERTEGO_BUFFALOGS_MAX_WINDOW_MINUTES = 360
+CERTEGO_BUFFALOGS_WINDOW_TARGET_LOGINS = 20000
+CERTEGO_BUFFALOGS_MAX_WINDOWS_PER_RUN = 6
+CERTEGO_BUFFALOGS_BACKLOG_DRAIN_RUNS = 4
+CERTEGO_BUFFALOGS_MAX_BACKLOG_DAYS = int(os.environ["BUFFALOGS_MAX_BACKLOG_DAYS"]) if os.environ.get("BUFFALOGS_MAX_BACKLOG_DAYS") else None
+
 if CERTEGO_BUFFALOGS_ENVIRONMENT == ENVIRONMENT_DOCKER:
     CERTEGO_BUFFALOGS_DB_HOSTNAME = "postgres"
     CERTEGO_BUFFALOGS_CONFIG_PATH = "/opt/certego/config/"
@@ -218,6 +218,7 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = None
 
 # Celery config
 CELERY_BROKER_URL = CERTEGO_BUFFALOGS_RABBITMQ_URI
+CELERY_RESULT_BACKEND = CERTEGO_BUFFALOGS_CELERY_RESULT_BACKEND
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = "celery.beat:PersistentScheduler"
 
@@ -227,6 +228,7 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": crontab(minute=30),
     },
     "clean_models_periodically": {"task": "BuffalogsCleanModelsPeriodicallyTask", "schedule": crontab(hour=23, minute=59)},
+    "manage_partitions": {"task": "BuffalogsManagePartitionsTask", "schedule": crontab(hour=0, minute=30)},
     "notify_alerts": {"task": "NotifyAlertsTask", "schedule": crontab(minute=5)},
     "daily_alert_summary": {"task": "ScheduledAlertSummaryTask", "schedule": crontab(hour=0, minute=0), "args": ["daily"]},
     "weekly_alert_summary": {
@@ -5,7 +5,7 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from impossible_travel.constants import AlertTagValues
 from impossible_travel.forms import AlertAdminForm, ConfigAdminForm, TaskSettingsAdminForm, UserAdminForm
-from impossible_travel.models import Alert, Config, Login, TaskSettings, User, UsersIP
+from impossible_travel.models import Alert, Config, Login, NotificationDelivery, TaskSettings, User, UsersIP
 
 
 @admin.register(Login)
@@ -102,6 +102,14 @@ class AlertAdmin(admin.ModelAdmin):
         return obj.name
 
 
+@admin.register(NotificationDelivery)
+class NotificationDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("id", "alert", "alerter", "status", "attempts", "next_attempt_at", "last_error", "updated")
+    list_filter = ("alerter", "status")
+    search_fields = ("alert__id", "alerter")
+    raw_id_fields = ("alert",)
+
+
 @admin.register(TaskSettings)
 class TaskSettingsAdmin(admin.ModelAdmin):
     form = TaskSettingsAdminForm
@@ -64,4 +64,9 @@ class AlertFactory:
             BaseAlerting.SupportedAlerters.MATTERMOST: MattermostAlerting,
         }
 
-        return [alerter_map[alerter](config) for alerter, config in zip(self.active_alerters, self.alert_configs)]
+        alerters = []
+        for alerter, config in zip(self.active_alerters, self.alert_configs):
+            alerter_object = alerter_map[alerter](config)
+            alerter_object.max_workers = config.get("max_workers", alerter_object.max_workers)
+            alerters.append(alerter_object)
+        return alerters
@@ -2,10 +2,45 @@ import json
 import logging
 import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from enum import Enum
+from functools import lru_cache
+from typing import Callable, Iterable
 
 from django.conf import settings
-from jinja2 import Environment, FileSystemLoader
+from django.db import connection, transaction
+from django.db.models import Exists, F, Max, OuterRef, Q, QuerySet
+from django.utils import timezone
+from impossible_travel.alerting.http_client import get_http_session
+from impossible_travel.constants import NotificationDeliveryStatus
+from impossible_travel.models import Alert, NotificationDelivery
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+MARK_NOTIFIED_BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_template_environment(templates_path: str, bytecode_cache_path: str = None) -> Environment:
+    """Return the Jinja environment shared by all the alerters of the process, loading the templates from templates_path.
+    The compiled templates are cached by the environment and compiled again only if their file has been modified,
+    and the compiled bytecode is saved in bytecode_cache_path (if set), so it's reused by the other processes too
+
+    :param templates_path: directory of the alert templates
+    :type templates_path: str
+    :param bytecode_cache_path: directory of the compiled templates cache
+    :type bytecode_cache_path: str
+
+    :return: the Jinja environment
+    :rtype: Environment
+    """
+    bytecode_cache = None
+    if bytecode_cache_path:
+        os.makedirs(bytecode_cache_path, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_path)
+    return Environment(loader=FileSystemLoader(templates_path), auto_reload=True, bytecode_cache=bytecode_cache)
 
 
 class BaseAlerting(ABC):
@@ -30,6 +65,8 @@ class BaseAlerting(ABC):
     def __init__(self):
         super().__init__()
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        # maximum number of messages sent at the same time by the alerter (overridden by the "max_workers" field of its configuration)
+        self.max_workers = settings.CERTEGO_BUFFALOGS_ALERTER_MAX_WORKERS
 
     @abstractmethod
     def notify_alerts(self):
@@ -39,6 +76,146 @@ class BaseAlerting(ABC):
         """
         raise NotImplementedError
 
+    def run_concurrently(self, function: Callable, items: Iterable):
+        """Call the function on each item, in at most max_workers threads, so a slow message doesn't delay the following ones.
+        Each thread closes its own DB connection when it has finished
+
+        :param function: the function sending the message of an item, handling its own errors
+        :type function: Callable
+        :param items: the items to be sent
+        :type items: Iterable
+        """
+        if self.max_workers <= 1:
+            for item in items:
+                function(item)
+            return
+
+        def run(item):
+            try:
+                function(item)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.__class__.__name__) as executor:
+            # list() re-raises the unhandled exceptions of the threads
+            list(executor.map(run, items))
+
+    @staticmethod
+    def http_post(url: str, **kwargs):
+        """Send a POST request through the HTTP session shared by the alerters for the destination of the url, reusing its connections
+
+        :param url: the url of the request
+        :type url: str
+
+        :return: the response
+        :rtype: requests.Response
+        """
+        return get_http_session(url).post(url, **kwargs)
+
+    @staticmethod
+    def mark_notified(alerts: list, alerter_key: str):
+        """Mark the alerts as notified by the alerter, with an UPDATE for each batch of MARK_NOTIFIED_BATCH_SIZE alerts
+
+        :param alerts: the notified alerts
+        :type alerts: list of Alert objects
+        :param alerter_key: key of the alerter in the notified_status (e.g. "slack")
+        :type alerter_key: str
+        """
+        alerts = list(alerts)
+        for start in range(0, len(alerts), MARK_NOTIFIED_BATCH_SIZE):
+            batch = alerts[start : start + MARK_NOTIFIED_BATCH_SIZE]
+            pks = [alert.pk for alert in batch]
+            with transaction.atomic():
+                Alert.objects.filter(pk__in=pks).mark_notified(alerter_key)
+                NotificationDelivery.objects.filter(alerter=alerter_key, alert_id__in=pks).update(
+                    status=NotificationDeliveryStatus.SENT, last_error="", updated=timezone.now()
+                )
+            for alert in batch:
+                alert.notified_status[alerter_key] = True
+
+    @staticmethod
+    def mark_failed(alerts: list, alerter_key: str, error: Exception | str):
+        """Schedule a new attempt to send the alerts, after a delay doubled at each failed attempt,
+        or mark them as failed if they have reached the maximum number of attempts
+
+        :param alerts: the alerts that couldn't be sent
+        :type alerts: list of Alert objects
+        :param alerter_key: key of the alerter in the notified_status (e.g. "slack")
+        :type alerter_key: str
+        :param error: the error raised by the sending
+        :type error: Exception or str
+        """
+        now = timezone.now()
+        deliveries = NotificationDelivery.objects.filter(
+            alerter=alerter_key, alert_id__in=[alert.pk for alert in alerts], status=NotificationDeliveryStatus.PENDING
+        )
+        deliveries.filter(attempts__gte=settings.CERTEGO_BUFFALOGS_NOTIFY_MAX_ATTEMPTS).update(
+            status=NotificationDeliveryStatus.FAILED, last_error=str(error), updated=now
+        )
+        for attempts in set(deliveries.values_list("attempts", flat=True)):
+            delay = timedelta(seconds=settings.CERTEGO_BUFFALOGS_NOTIFY_RETRY_SECONDS * 2 ** max(attempts - 1, 0))
+            deliveries.filter(attempts=attempts).update(next_attempt_at=now + delay, last_error=str(error), updated=now)
+
+    @staticmethod
+    def get_alerts_to_notify(alerter_key: str, start_date: datetime = None, end_date: datetime = None, alerts: QuerySet = None) -> list:
+        """Add to the NotificationDelivery outbox the new alerts not notified yet by the alerter, then claim the pending deliveries
+        whose attempt is due, with SELECT ... FOR UPDATE SKIP LOCKED, so the concurrent workers claim different alerts.
+        The claimed deliveries are postponed by CERTEGO_BUFFALOGS_NOTIFY_LEASE_SECONDS, so they are claimed again if the worker dies before sending them.
+        The deliveries not marked within the lease of their last attempt (CERTEGO_BUFFALOGS_NOTIFY_MAX_ATTEMPTS) are marked as failed instead of being claimed again
+
+        :param alerter_key: key of the alerter in the notified_status (e.g. "slack")
+        :type alerter_key: str
+        :param start_date: if set with end_date, only the alerts created in the range are added to the outbox
+        :type start_date: datetime
+        :param end_date: if set with start_date, only the alerts created in the range are added to the outbox
+        :type end_date: datetime
+        :param alerts: the alerts that can be added to the outbox, by default the ones not marked as notified by the alerter
+        :type alerts: QuerySet
+
+        :return: the claimed alerts, at most CERTEGO_BUFFALOGS_NOTIFY_BATCH_SIZE
+        :rtype: list of Alert objects
+        """
+        if alerts is None:
+            alerts = Alert.objects.filter(Q(**{f"notified_status__{alerter_key}": False}) | ~Q(notified_status__has_key=alerter_key))
+        if start_date is not None and end_date is not None:
+            alerts = alerts.filter(created__range=(start_date, end_date))
+        else:
+            # watermark: only the alerts created since the last enqueue of the alerter (minus CERTEGO_BUFFALOGS_NOTIFY_LOOKBACK_SECONDS,
+            # for the alerts committed late) are checked, on the Alert.created index, instead of scanning the whole history
+            last_enqueue = NotificationDelivery.objects.filter(alerter=alerter_key).aggregate(last_enqueue=Max("created"))["last_enqueue"]
+            if last_enqueue is not None:
+                alerts = alerts.filter(created__gte=last_enqueue - timedelta(seconds=settings.CERTEGO_BUFFALOGS_NOTIFY_LOOKBACK_SECONDS))
+        # only the alerts without a delivery of the alerter are added, including the ones committed after alerts with a greater id
+        alerts = alerts.filter(~Exists(NotificationDelivery.objects.filter(alert_id=OuterRef("pk"), alerter=alerter_key)))
+        NotificationDelivery.objects.bulk_create(
+            [NotificationDelivery(alert_id=alert_id, alerter=alerter_key) for alert_id in alerts.values_list("id", flat=True)],
+            batch_size=MARK_NOTIFIED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+        now = timezone.now()
+        due = NotificationDelivery.objects.select_for_update(skip_locked=True).filter(
+            alerter=alerter_key, status=NotificationDeliveryStatus.PENDING, next_attempt_at__lte=now
+        )
+        with transaction.atomic():
+            # the deliveries whose lease has expired after the last attempt (e.g. the alerter raised an unexpected error) aren't claimed anymore
+            exhausted = list(due.filter(attempts__gte=settings.CERTEGO_BUFFALOGS_NOTIFY_MAX_ATTEMPTS).values_list("id", flat=True))
+            if exhausted:
+                NotificationDelivery.objects.filter(id__in=exhausted, last_error="").update(last_error="Not sent within the lease of the last attempt")
+                NotificationDelivery.objects.filter(id__in=exhausted).update(status=NotificationDeliveryStatus.FAILED, updated=now)
+                logger.warning(
+                    f"Notification of {len(exhausted)} alerts by {alerter_key} failed after {settings.CERTEGO_BUFFALOGS_NOTIFY_MAX_ATTEMPTS} attempts"
+                )
+            claimed = list(
+                due.filter(attempts__lt=settings.CERTEGO_BUFFALOGS_NOTIFY_MAX_ATTEMPTS)
+                .order_by("next_attempt_at")
+                .values_list("id", "alert_id")[: settings.CERTEGO_BUFFALOGS_NOTIFY_BATCH_SIZE]
+            )
+            NotificationDelivery.objects.filter(id__in=[delivery_id for delivery_id, _ in claimed]).update(
+                attempts=F("attempts") + 1, next_attempt_at=now + timedelta(seconds=settings.CERTEGO_BUFFALOGS_NOTIFY_LEASE_SECONDS), updated=now
+            )
+        return list(Alert.objects.filter(id__in=[alert_id for _, alert_id in claimed]).select_related("user").order_by("id"))
+
     @staticmethod
     def read_config(alerter_key: str):
         """
@@ -54,7 +231,10 @@ class BaseAlerting(ABC):
         """
         Format the alert message for notification.
         """
-        env = Environment(loader=FileSystemLoader(os.path.join(settings.CERTEGO_BUFFALOGS_CONFIG_PATH, "buffalogs/")))
+        env = get_template_environment(
+            os.path.join(settings.CERTEGO_BUFFALOGS_CONFIG_PATH, "buffalogs/"),
+            settings.CERTEGO_BUFFALOGS_TEMPLATES_BYTECODE_CACHE_PATH,
+        )
         template = env.get_template(template_path)
         alert_title = template.module.title(alert, **kwargs)
         alert_description = template.module.description(alert, **kwargs)
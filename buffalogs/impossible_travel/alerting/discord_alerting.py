@@ -7,9 +7,7 @@ except ImportError:
 from collections import defaultdict
 
 import backoff
-from django.db.models import Q
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class DiscordAlerting(BaseAlerting):
@@ -40,7 +38,7 @@ class DiscordAlerting(BaseAlerting):
         }
         headers = {"Content-Type": "application/json"}
 
-        resp = requests.post(self.webhook_url, headers=headers, data=json.dumps(alert_msg))
+        resp = self.http_post(self.webhook_url, headers=headers, data=json.dumps(alert_msg))
         resp.raise_for_status()
         return resp
 
@@ -65,27 +63,24 @@ class DiscordAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter((Q(notified_status__discord=False) | ~Q(notified_status__has_key="discord")))
-        if start_date is not None and end_date is not None:
-            alerts = Alert.objects.filter(
-                (Q(notified_status__discord=False) | ~Q(notified_status__has_key="discord")) & Q(created__range=(start_date, end_date))
-            )
+        alerts = self.get_alerts_to_notify("discord", start_date, end_date)
 
         grouped = defaultdict(list)
         for alert in alerts:
             key = (alert.user.username, alert.name)
             grouped[key].append(alert)
 
-        for (username, alert_name), group_alerts in grouped.items():
+        def notify_group(group):
+            (username, alert_name), group_alerts = group
             if len(group_alerts) == 1:
                 try:
                     alert = group_alerts[0]
                     self.send_message(alert=alert)
                     self.logger.info(f"Discord alert sent: {alert.name}")
-                    alert.notified_status["discord"] = True
-                    alert.save()
+                    self.mark_notified([alert], "discord")
                 except requests.RequestException as e:
                     self.logger.exception(f"Discord Notification Failed for {alert}: {str(e)}")
+                    self.mark_failed([alert], "discord", e)
 
             else:
                 alert = group_alerts[0]
@@ -94,8 +89,9 @@ class DiscordAlerting(BaseAlerting):
                     self.send_message(alert=None, alert_title=alert_title, alert_description=alert_description)
                     self.logger.info(f"Clubbed Discord Alert Sent: {alert_title}")
 
-                    for a in group_alerts:
-                        a.notified_status["discord"] = True
-                        a.save()
+                    self.mark_notified(group_alerts, "discord")
                 except requests.RequestException as e:
                     self.logger.exception(f"Clubbed Discord Alert Failed for {group_alerts}: {str(e)}")
+                    self.mark_failed(group_alerts, "discord", e)
+
+        self.run_concurrently(notify_group, grouped.items())
@@ -1,6 +1,4 @@
-from django.db.models import Q
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class DummyAlerting(BaseAlerting):
@@ -20,9 +18,8 @@ class DummyAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter(Q(notified_status__dummy=False) | ~Q(notified_status__has_key="dummy"))
+        alerts = self.get_alerts_to_notify("dummy")
         for a in alerts:
             # in a real alerters, this would be the place to send the alert
             self.logger.info("Alerting %s", a.name)
-            a.notified_status["dummy"] = True
-            a.save()
+        self.mark_notified(alerts, "dummy")
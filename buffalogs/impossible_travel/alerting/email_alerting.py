@@ -3,9 +3,7 @@ from collections import defaultdict
 import backoff
 from django.conf import settings
 from django.core.mail import send_mail
-from django.db.models import Q
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class EmailAlerting(BaseAlerting):
@@ -76,16 +74,15 @@ class EmailAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter(Q(notified_status__email=False) | ~Q(notified_status__has_key="email"))
-        if start_date is not None and end_date is not None:
-            alerts = Alert.objects.filter((Q(notified_status__email=False) | ~Q(notified_status__has_key="email")) & Q(created__range=(start_date, end_date)))
+        alerts = self.get_alerts_to_notify("email", start_date, end_date)
 
         grouped = defaultdict(list)
         for alert in alerts:
             key = (alert.user.username, alert.name)
             grouped[key].append(alert)
 
-        for (username, alert_name), group_alerts in grouped.items():
+        def notify_group(group):
+            (username, alert_name), group_alerts = group
             if len(group_alerts) == 1:
                 alert = group_alerts[0]
                 # Email for admin
@@ -109,8 +106,7 @@ class EmailAlerting(BaseAlerting):
                     except Exception as e:
                         self.logger.exception(f"Email alert failed for {alert.name}: {str(e)}")
 
-                alert.notified_status["email"] = True
-                alert.save()
+                self.mark_notified([alert], "email")
 
             else:
                 alert = group_alerts[0]
@@ -121,8 +117,9 @@ class EmailAlerting(BaseAlerting):
                         alert=None, recipient_list=self.recipient_list_admins, alert_title=alert_title, alert_description=alert_description
                     )  # 1 if sent,0 if not
                     self.logger.info(f"Clubbed Email alert Sent: {alert_title} to {self.recipient_list_admins}")
-                    for a in group_alerts:
-                        a.notified_status["email"] = True
-                        a.save()
+                    self.mark_notified(group_alerts, "email")
                 except Exception as e:
                     self.logger.exception(f"Clubbed Email Alert Failed for {group_alerts}: {str(e)}")
+                    self.mark_failed(group_alerts, "email", e)
+
+        self.run_concurrently(notify_group, grouped.items())
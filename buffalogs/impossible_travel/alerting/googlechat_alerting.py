@@ -5,9 +5,7 @@ except ImportError:
 from collections import defaultdict
 
 import backoff
-from django.db.models import Q
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class GoogleChatAlerting(BaseAlerting):
@@ -39,7 +37,7 @@ class GoogleChatAlerting(BaseAlerting):
             ]
         }
 
-        resp = requests.post(self.webhook_url, json=alert_msg)
+        resp = self.http_post(self.webhook_url, json=alert_msg)
         resp.raise_for_status()
         return resp
 
@@ -64,27 +62,24 @@ class GoogleChatAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter(Q(notified_status__googlechat=False) | ~Q(notified_status__has_key="googlechat"))
-        if start_date is not None and end_date is not None:
-            alerts = Alert.objects.filter(
-                (Q(notified_status__googlechat=False) | ~Q(notified_status__has_key="googlechat")) & Q(created__range=(start_date, end_date))
-            )
+        alerts = self.get_alerts_to_notify("googlechat", start_date, end_date)
 
         grouped = defaultdict(list)
         for alert in alerts:
             key = (alert.user.username, alert.name)
             grouped[key].append(alert)
 
-        for (username, alert_name), group_alerts in grouped.items():
+        def notify_group(group):
+            (username, alert_name), group_alerts = group
             if len(group_alerts) == 1:
                 try:
                     alert = group_alerts[0]
                     self.send_message(alert=alert)
                     self.logger.info(f"GoogleChat alert sent: {alert.name}")
-                    alert.notified_status["googlechat"] = True
-                    alert.save()
+                    self.mark_notified([alert], "googlechat")
                 except requests.RequestException as e:
                     self.logger.exception(f"GoogleChat Notification Failed for {alert}: {str(e)}")
+                    self.mark_failed([alert], "googlechat", e)
 
             else:
                 alert = group_alerts[0]
@@ -93,8 +88,9 @@ class GoogleChatAlerting(BaseAlerting):
                     self.send_message(alert=None, alert_title=alert_title, alert_description=alert_description)
                     self.logger.info(f"Clubbed GoogleChat Alert Sent: {alert_title}")
 
-                    for a in group_alerts:
-                        a.notified_status["googlechat"] = True
-                        a.save()
+                    self.mark_notified(group_alerts, "googlechat")
                 except requests.RequestException as e:
                     self.logger.exception(f"Clubbed GoogleChat Alert Failed for {group_alerts}: {str(e)}")
+                    self.mark_failed(group_alerts, "googlechat", e)
+
+        self.run_concurrently(notify_group, grouped.items())
@@ -0,0 +1,78 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class AlertingHTTPAdapter(HTTPAdapter):
+    """HTTP adapter of the alerting sessions, applying the default timeout to the requests without an explicit one"""
+
+    def __init__(self, timeout: float, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=self.timeout if timeout is None else timeout, **kwargs)
+
+    def get_metrics(self) -> dict:
+        """Return the number of connections opened and of requests sent by the connection pools of the adapter"""
+        pools = [self.poolmanager.pools[key] for key in self.poolmanager.pools.keys()]
+        return {"connections": sum(pool.num_connections for pool in pools), "requests": sum(pool.num_requests for pool in pools)}
+
+
+def get_destination(url: str) -> str:
+    """Scheme and host of the url, identifying the session used to send the requests to it"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_http_session(url: str) -> "requests.Session":
+    """Return the HTTP session shared by all the alerters of the process to send the requests to the destination of the url.
+    The connections of the session are kept alive and reused by the next notifications, instead of opening a new connection
+    (with its TLS handshake) for each alert
+
+    :param url: the url of the request
+    :type url: str
+
+    :return: the session of the destination
+    :rtype: requests.Session
+    """
+    destination = get_destination(url)
+    with _sessions_lock:
+        if destination not in _sessions:
+            session = requests.Session()
+            adapter = AlertingHTTPAdapter(
+                timeout=settings.CERTEGO_BUFFALOGS_ALERTING_HTTP_TIMEOUT,
+                pool_connections=1,
+                pool_maxsize=settings.CERTEGO_BUFFALOGS_ALERTING_HTTP_POOL_SIZE,
+                pool_block=True,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[destination] = session
+        return _sessions[destination]
+
+
+def get_http_metrics() -> dict:
+    """Return the connections opened and the requests sent to each destination by the alerting sessions of the process.
+    The difference between the requests and the connections is the number of requests which reused a kept-alive connection
+
+    :return: the metrics, by destination
+    :rtype: dict
+    """
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    return {destination: session.adapters["https://"].get_metrics() for destination, session in sessions.items()}
+
+
+def close_http_sessions():
+    """Close all the alerting sessions of the process and their connections"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -1,10 +1,6 @@
 import os
 from functools import partial
 
-try:
-    import requests
-except ImportError:
-    pass
 from impossible_travel.alerting.base_alerting import BaseAlerting
 from impossible_travel.constants import AlertDetectionType
 from impossible_travel.models import Alert
@@ -58,18 +54,20 @@ def parse_fields_value(field_value: str | list, field_name: str, supported_value
     return msg, field_value
 
 
-def get_alerts(names: list = [], get_all: bool = False):
+def get_alerts(names: list = [], get_all: bool = False, alerter_key: str = "http_request"):
     """
     Retrieve all alerts that have not been sent as notifications.
 
     If the parameter `names` is not an empty list, only alerts with names included in the list will be returned.
     If `names` is an empty list and `get_all` is True all alerts not notified will be returned
     Otherwise an empty list is returned
+    The alerts are claimed from the NotificationDelivery outbox, so they aren't returned again to a concurrent worker
 
     Args:
         names   : list of valid AlertDetectionTypes values
         get_all : boolean flag that determines if all not notified alerts are retrivied
                 : only effective if names is an empty list
+        alerter_key : key of the recipient in the outbox and in the notified_status, so each recipient receives all the alerts
     Returns:
         alerts  : list of Alert objects
     """
@@ -78,8 +76,10 @@ def get_alerts(names: list = [], get_all: bool = False):
     elif get_all:
         alerts = Alert.objects.filter(notified_status__http_request=False)
     else:
-        alerts = []
-    return alerts
+        return []
+    # the alerts already notified to the recipient
+    alerts = alerts.exclude(notified_status__contains={alerter_key: True})
+    return BaseAlerting.get_alerts_to_notify(alerter_key, alerts=alerts)
 
 
 def check_variable_exists(variable_name: str, default: str = ""):
@@ -151,6 +151,11 @@ class HTTPRequestAlerting(BaseAlerting):
             self.option_parsers.update(self.extra_option_parsers)
         self.configure(alert_config)
 
+    @property
+    def alerter_key(self) -> str:
+        """Key of the recipient in the NotificationDelivery outbox and in the Alert.notified_status, because the recipients share the alerter"""
+        return f"http_request:{self.alert_config['name']}"
+
     def parse_option(self, key: str, value: str | list):
         def fake_parser(value):
             return None, value
@@ -257,7 +262,7 @@ class HTTPRequestAlerting(BaseAlerting):
         headers = {"Content-Type": "application/json"}
         if token:
             headers["Authorization"] = f"Bearer {token}"
-        return requests.post(endpoint, json=data, headers=headers)
+        return self.http_post(endpoint, json=data, headers=headers)
 
     def send_alert(self, recipient_name: str, endpoint: str, alerts: list[Alert]):
         """
@@ -284,14 +289,16 @@ class HTTPRequestAlerting(BaseAlerting):
                 resp = None
                 error_msg = str(e)
 
+            if resp is not None and resp.ok:
+                # Mark alerts as notified
+                self.mark_notified(alert_batch, self.alerter_key)
+            else:
+                self.mark_failed(alert_batch, self.alerter_key, error_msg if resp is None else f"status: {resp.status_code}")
             for alert in alert_batch:
                 if resp is None:
                     # Log error message to all alerts in the batch
                     self.logger.error(f"Alerting Failed: {alert.name} to: {recipient_name} endpoint: {endpoint} error: {error_msg}")
                 elif resp.ok:
-                    # Mark alerts as notified
-                    alert.notified_status["http_request"] = True
-                    alert.save()
                     self.logger.info(f"Notification sent: {alert.name} to: {recipient_name} endpoint: {endpoint} status: {resp.status_code}")
                 else:
                     # Log error message for alerts in the batch
@@ -304,6 +311,6 @@ class HTTPRequestAlerting(BaseAlerting):
         endpoint = self.alert_config.get("endpoint")
         recipient_name = self.alert_config.get("name")
         alert_types = self.alert_config["alert_types"]
-        alerts = get_alerts(alert_types)
+        alerts = get_alerts(alert_types, alerter_key=self.alerter_key)
         self.logger.info(f"Sending alert to: {recipient_name}")
         self.send_alert(recipient_name, endpoint, alerts)
@@ -5,9 +5,7 @@ except ImportError:
 from collections import defaultdict
 
 import backoff
-from django.db.models import Q
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class MattermostAlerting(BaseAlerting):
@@ -37,7 +35,7 @@ class MattermostAlerting(BaseAlerting):
             "username": self.username,
         }
 
-        resp = requests.post(self.webhook_url, json=alert_msg)
+        resp = self.http_post(self.webhook_url, json=alert_msg)
         resp.raise_for_status()
         return resp
 
@@ -62,27 +60,24 @@ class MattermostAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter((Q(notified_status__mattermost=False) | ~Q(notified_status__has_key="mattermost")))
-        if start_date is not None and end_date is not None:
-            alerts = Alert.objects.filter(
-                (Q(notified_status__mattermost=False) | ~Q(notified_status__has_key="mattermost")) & Q(created__range=(start_date, end_date))
-            )
+        alerts = self.get_alerts_to_notify("mattermost", start_date, end_date)
 
         grouped = defaultdict(list)
         for alert in alerts:
             key = (alert.user.username, alert.name)
             grouped[key].append(alert)
 
-        for (username, alert_name), group_alerts in grouped.items():
+        def notify_group(group):
+            (username, alert_name), group_alerts = group
             if len(group_alerts) == 1:
                 try:
                     alert = group_alerts[0]
                     self.send_message(alert=alert)
                     self.logger.info(f"Mattermost alert sent: {alert.name}")
-                    alert.notified_status["mattermost"] = True
-                    alert.save()
+                    self.mark_notified([alert], "mattermost")
                 except requests.RequestException as e:
                     self.logger.exception(f"Mattermost Notification Failed for {alert}: {str(e)}")
+                    self.mark_failed([alert], "mattermost", e)
 
             else:
                 alert = group_alerts[0]
@@ -91,8 +86,9 @@ class MattermostAlerting(BaseAlerting):
                     self.send_message(alert=None, alert_title=alert_title, alert_description=alert_description)
                     self.logger.info(f"Clubbed Mattermost Alert Sent: {alert_title}")
 
-                    for a in group_alerts:
-                        a.notified_status["mattermost"] = True
-                        a.save()
+                    self.mark_notified(group_alerts, "mattermost")
                 except requests.RequestException as e:
                     self.logger.exception(f"Clubbed Mattermost Alert Failed for {group_alerts}: {str(e)}")
+                    self.mark_failed(group_alerts, "mattermost", e)
+
+        self.run_concurrently(notify_group, grouped.items())
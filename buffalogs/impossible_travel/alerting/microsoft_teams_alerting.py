@@ -7,9 +7,7 @@ except ImportError:
 from collections import defaultdict
 
 import backoff
-from django.db.models import Q
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class MicrosoftTeamsAlerting(BaseAlerting):
@@ -41,7 +39,7 @@ class MicrosoftTeamsAlerting(BaseAlerting):
             "text": alert_description,
         }
 
-        resp = requests.post(
+        resp = self.http_post(
             self.webhook_url,
             headers={"Content-Type": "application/json"},
             data=json.dumps(alert_msg),
@@ -70,27 +68,24 @@ class MicrosoftTeamsAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter((Q(notified_status__microsoftteams=False) | ~Q(notified_status__has_key="microsoftteams")))
-        if start_date is not None and end_date is not None:
-            alerts = Alert.objects.filter(
-                (Q(notified_status__microsoftteams=False) | ~Q(notified_status__has_key="microsoftteams")) & Q(created__range=(start_date, end_date))
-            )
+        alerts = self.get_alerts_to_notify("microsoftteams", start_date, end_date)
 
         grouped = defaultdict(list)
         for alert in alerts:
             key = (alert.user.username, alert.name)
             grouped[key].append(alert)
 
-        for (username, alert_name), group_alerts in grouped.items():
+        def notify_group(group):
+            (username, alert_name), group_alerts = group
             if len(group_alerts) == 1:
                 try:
                     alert = group_alerts[0]
                     self.send_message(alert=alert)
                     self.logger.info(f"MicrosoftTeams alert sent: {alert.name}")
-                    alert.notified_status["microsoftteams"] = True
-                    alert.save()
+                    self.mark_notified([alert], "microsoftteams")
                 except requests.RequestException as e:
                     self.logger.exception(f"MicrosoftTeams Notification Failed for {alert}: {str(e)}")
+                    self.mark_failed([alert], "microsoftteams", e)
 
             else:
                 alert = group_alerts[0]
@@ -99,8 +94,9 @@ class MicrosoftTeamsAlerting(BaseAlerting):
                     self.send_message(alert=None, alert_title=alert_title, alert_description=alert_description)
                     self.logger.info(f"Clubbed MicrosoftTeams Alert Sent: {alert_title}")
 
-                    for a in group_alerts:
-                        a.notified_status["microsoftteams"] = True
-                        a.save()
+                    self.mark_notified(group_alerts, "microsoftteams")
                 except requests.RequestException as e:
                     self.logger.exception(f"Clubbed MicrosoftTeams Alert Failed for {group_alerts}: {str(e)}")
+                    self.mark_failed(group_alerts, "microsoftteams", e)
+
+        self.run_concurrently(notify_group, grouped.items())
@@ -5,9 +5,7 @@ except ImportError:
 from collections import defaultdict
 
 import backoff
-from django.db.models import Q
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class PushoverAlerting(BaseAlerting):
@@ -36,7 +34,7 @@ class PushoverAlerting(BaseAlerting):
 
         payload = {"token": self.api_key, "user": self.user_key, "message": alert_msg}
 
-        resp = requests.post("https://api.pushover.net/1/messages.json", data=payload)
+        resp = self.http_post("https://api.pushover.net/1/messages.json", data=payload)
         resp.raise_for_status()
         return resp
 
@@ -61,27 +59,24 @@ class PushoverAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter((Q(notified_status__pushover=False) | ~Q(notified_status__has_key="pushover")))
-        if start_date is not None and end_date is not None:
-            alerts = Alert.objects.filter(
-                (Q(notified_status__pushover=False) | ~Q(notified_status__has_key="pushover")) & Q(created__range=(start_date, end_date))
-            )
+        alerts = self.get_alerts_to_notify("pushover", start_date, end_date)
 
         grouped = defaultdict(list)
         for alert in alerts:
             key = (alert.user.username, alert.name)
             grouped[key].append(alert)
 
-        for (username, alert_name), group_alerts in grouped.items():
+        def notify_group(group):
+            (username, alert_name), group_alerts = group
             if len(group_alerts) == 1:
                 try:
                     alert = group_alerts[0]
                     self.send_message(alert=alert)
                     self.logger.info(f"Pushover alert sent: {alert.name}")
-                    alert.notified_status["pushover"] = True
-                    alert.save()
+                    self.mark_notified([alert], "pushover")
                 except requests.RequestException as e:
                     self.logger.exception(f"Pushover Notification Failed for {alert}: {str(e)}")
+                    self.mark_failed([alert], "pushover", e)
 
             else:
                 alert = group_alerts[0]
@@ -90,8 +85,9 @@ class PushoverAlerting(BaseAlerting):
                     self.send_message(alert=None, alert_title=alert_title, alert_description=alert_description)
                     self.logger.info(f"Clubbed Pushover Alert Sent: {alert_title}")
 
-                    for a in group_alerts:
-                        a.notified_status["pushover"] = True
-                        a.save()
+                    self.mark_notified(group_alerts, "pushover")
                 except requests.RequestException as e:
                     self.logger.exception(f"Clubbed Pushover Alert Failed for {group_alerts}: {str(e)}")
+                    self.mark_failed(group_alerts, "pushover", e)
+
+        self.run_concurrently(notify_group, grouped.items())
@@ -6,10 +6,8 @@ from collections import defaultdict
 from datetime import timedelta
 
 import backoff
-from django.db.models import Q
 from django.utils import timezone
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class SlackAlerting(BaseAlerting):
@@ -48,7 +46,7 @@ class SlackAlerting(BaseAlerting):
             ]
         }
 
-        resp = requests.post(self.webhook_url, json=alert_msg, headers={"Content-Type": "application/json"})
+        resp = self.http_post(self.webhook_url, json=alert_msg, headers={"Content-Type": "application/json"})
         resp.raise_for_status()
         return resp
 
@@ -73,25 +71,24 @@ class SlackAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter((Q(notified_status__slack=False) | ~Q(notified_status__has_key="slack")))
-        if start_date is not None and end_date is not None:
-            alerts = Alert.objects.filter((Q(notified_status__slack=False) | ~Q(notified_status__has_key="slack")) & Q(created__range=(start_date, end_date)))
+        alerts = self.get_alerts_to_notify("slack", start_date, end_date)
 
         grouped = defaultdict(list)
         for alert in alerts:
             key = (alert.user.username, alert.name)
             grouped[key].append(alert)
 
-        for (username, alert_name), group_alerts in grouped.items():
+        def notify_group(group):
+            (username, alert_name), group_alerts = group
             if len(group_alerts) == 1:
                 try:
                     alert = group_alerts[0]
                     self.send_message(alert=alert)
                     self.logger.info(f"Slack alert sent: {alert.name}")
-                    alert.notified_status["slack"] = True
-                    alert.save()
+                    self.mark_notified([alert], "slack")
                 except requests.RequestException as e:
                     self.logger.exception(f"Slack Notification Failed for {alert}: {str(e)}")
+                    self.mark_failed([alert], "slack", e)
 
             else:
                 alert = group_alerts[0]
@@ -100,8 +97,9 @@ class SlackAlerting(BaseAlerting):
                     self.send_message(alert=None, alert_title=alert_title, alert_description=alert_description)
                     self.logger.info(f"Clubbed Slack Alert Sent: {alert_title}")
 
-                    for a in group_alerts:
-                        a.notified_status["slack"] = True
-                        a.save()
+                    self.mark_notified(group_alerts, "slack")
                 except requests.RequestException as e:
                     self.logger.exception(f"Clubbed Slack Alert Failed for {group_alerts}: {str(e)}")
+                    self.mark_failed(group_alerts, "slack", e)
+
+        self.run_concurrently(notify_group, grouped.items())
@@ -5,9 +5,7 @@ except ImportError:
 from collections import defaultdict
 
 import backoff
-from django.db.models import Q
 from impossible_travel.alerting.base_alerting import BaseAlerting
-from impossible_travel.models import Alert
 
 
 class TelegramAlerting(BaseAlerting):
@@ -38,7 +36,7 @@ class TelegramAlerting(BaseAlerting):
         # sending alerts to all the trusted chat ids
         for chat_id in self.chat_ids:
             payload = {"chat_id": chat_id, "text": alert_msg}
-            resp = requests.post(self.url, json=payload)
+            resp = self.http_post(self.url, json=payload)
             resp.raise_for_status()
             return resp
 
@@ -63,27 +61,24 @@ class TelegramAlerting(BaseAlerting):
         """
         Execute the alerter operation.
         """
-        alerts = Alert.objects.filter((Q(notified_status__telegram=False) | ~Q(notified_status__has_key="telegram")))
-        if start_date is not None and end_date is not None:
-            alerts = Alert.objects.filter(
-                (Q(notified_status__telegram=False) | ~Q(notified_status__has_key="telegram")) & Q(created__range=(start_date, end_date))
-            )
+        alerts = self.get_alerts_to_notify("telegram", start_date, end_date)
 
         grouped = defaultdict(list)
         for alert in alerts:
             key = (alert.user.username, alert.name)
             grouped[key].append(alert)
 
-        for (username, alert_name), group_alerts in grouped.items():
+        def notify_group(group):
+            (username, alert_name), group_alerts = group
             if len(group_alerts) == 1:
                 try:
                     alert = group_alerts[0]
                     self.send_message(alert=alert)
                     self.logger.info(f"Telegram alert sent: {alert.name}")
-                    alert.notified_status["telegram"] = True
-                    alert.save()
+                    self.mark_notified([alert], "telegram")
                 except requests.RequestException as e:
                     self.logger.exception(f"Telegram Notification Failed for {alert}: {str(e)}")
+                    self.mark_failed([alert], "telegram", e)
 
             else:
                 alert = group_alerts[0]
@@ -92,8 +87,9 @@ class TelegramAlerting(BaseAlerting):
                     self.send_message(alert=None, alert_title=alert_title, alert_description=alert_description)
                     self.logger.info(f"Clubbed Telegram Alert Sent: {alert_title}")
 
-                    for a in group_alerts:
-                        a.notified_status["telegram"] = True
-                        a.save()
+                    self.mark_notified(group_alerts, "telegram")
                 except requests.RequestException as e:
                     self.logger.exception(f"Clubbed Telegram Alert Failed for {group_alerts}: {str(e)}")
+                    self.mark_failed(group_alerts, "telegram", e)
+
+        self.run_concurrently(notify_group, grouped.items())
@@ -3,10 +3,6 @@ import time
 
 import jwt
 
-try:
-    import requests
-except ImportError:
-    pass
 from .http_request import HTTPRequestAlerting
 
 WEBHOOKS_ALGORITHM_LIST = jwt.algorithms.get_default_algorithms()
@@ -73,5 +69,5 @@ class WebHookAlerting(HTTPRequestAlerting):
         """Send a webhook notification with a JWT Bearer token."""
         token = self.generate_jwt()
         headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-        response = requests.post(endpoint, json=data, headers=headers)
+        response = self.http_post(endpoint, json=data, headers=headers)
         return response
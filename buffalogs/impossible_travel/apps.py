@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ImpossibleTravelConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "impossible_travel"
+
+    def ready(self):
+        # connect the signal receivers invalidating the cached Config snapshot
+        from impossible_travel.modules import app_config  # noqa: F401
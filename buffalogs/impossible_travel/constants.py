@@ -181,3 +181,16 @@ class ExecutionModes(models.TextChoices):
 
     MANUAL = "manual", _("Manual")
     AUTOMATIC = "automatic", _("Automatic")
+
+
+class NotificationDeliveryStatus(models.TextChoices):
+    """Status of the notification of an alert by an alerter
+
+    * PENDING: the alert has to be sent (or sent again, after a failed attempt)
+    * SENT: the alert has been sent
+    * FAILED: the alert hasn't been sent after the maximum number of attempts
+    """
+
+    PENDING = "pending", _("Pending")
+    SENT = "sent", _("Sent")
+    FAILED = "failed", _("Failed")
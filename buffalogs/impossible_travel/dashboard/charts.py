@@ -93,14 +93,7 @@ def alerts_line_chart(start, end):
             date_range.append(start)
             start = start + timedelta(seconds=1)
         for i in range(0, len(date_range) - 2, 2):
-            alerts_in_range.append(
-                Alert.objects.filter(
-                    login_raw_data__timestamp__range=(
-                        date_range[i].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                        date_range[i + 1].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                    )
-                ).count()
-            )
+            alerts_in_range.append(Alert.objects.filter(login_timestamp__range=(date_range[i], date_range[i + 1])).count())
     elif delta_timestamp.days >= 1 and delta_timestamp.days <= 31:
         while start <= end:
             date_range.append(start)
@@ -109,14 +102,7 @@ def alerts_line_chart(start, end):
             date_range.append(start)
             start = start + timedelta(seconds=1)
         for i in range(0, len(date_range) - 2, 2):
-            alerts_in_range.append(
-                Alert.objects.filter(
-                    login_raw_data__timestamp__range=(
-                        date_range[i].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                        date_range[i + 1].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                    )
-                ).count()
-            )
+            alerts_in_range.append(Alert.objects.filter(login_timestamp__range=(date_range[i], date_range[i + 1])).count())
     else:
         start = timezone.datetime(start.year, start.month, 1)
         end = end.replace(tzinfo=None)
@@ -126,13 +112,9 @@ def alerts_line_chart(start, end):
             start = start + relativedelta(months=1)
             date_range.append(start)
         for i in range(0, len(date_range) - 2, 2):
+            # the months are naive datetimes, in UTC
             alerts_in_range.append(
-                Alert.objects.filter(
-                    login_raw_data__timestamp__range=(
-                        date_range[i].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                        date_range[i + 1].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                    )
-                ).count()
+                Alert.objects.filter(login_timestamp__range=(timezone.make_aware(date_range[i]), timezone.make_aware(date_range[i + 1]))).count()
             )
     line_chart.x_labels = map(str, date_str)
     line_chart.add("", alerts_in_range)
@@ -150,11 +132,8 @@ def world_map_chart(start, end):
     tmp = {}
     for key, value in countries.items():
         country_alerts = Alert.objects.filter(
-            login_raw_data__timestamp__range=(
-                start.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                end.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-            ),
-            login_raw_data__country=value,
+            login_timestamp__range=(start, end),
+            country=value,
         ).count()
         if country_alerts == 0:
             tmp[key] = None
@@ -232,14 +211,11 @@ def user_geo_distribution_chart(user, start, end):
     # Get alert counts per country for the user
     alerts = Alert.objects.filter(
         user=user,
-        login_raw_data__timestamp__range=(
-            start.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-            end.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        ),
+        login_timestamp__range=(start, end),
     )
     alert_by_country = {}
     for alert in alerts:
-        country = alert.login_raw_data.get("country", "")
+        country = alert.country
         if country:
             alert_by_country[country.lower()] = alert_by_country.get(country.lower(), 0) + 1
 
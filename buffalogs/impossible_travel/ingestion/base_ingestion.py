@@ -1,7 +1,53 @@
+import asyncio
 import logging
+import queue
+import threading
 from abc import ABC, abstractmethod
 from datetime import datetime
 from enum import Enum
+from operator import itemgetter, methodcaller
+from typing import Any, Awaitable, Callable, Iterable, Iterator
+
+# fields required in a normalized login, the logins without them are skipped
+REQUIRED_LOGIN_FIELDS = ("timestamp", "ip", "country", "lat", "lon")
+
+
+def compile_field_accessor(ingestion_key: str) -> Callable[[dict], Any]:
+    """Compile the dotted ingestion key of a mapping (e.g. 'source.geo.location.lat') into a function extracting its value from a login,
+    returning an empty string if the path doesn't exist
+
+    :param ingestion_key: the (nested) ingestion field
+    :type ingestion_key: str
+
+    :return: the accessor function
+    :rtype: Callable[[dict], Any]
+    """
+    path = tuple(ingestion_key.split("."))
+    if len(path) == 1:
+        # C-level callable, cheaper than a python function for the top-level fields
+        return methodcaller("get", path[0], "")
+
+    def accessor(data: dict) -> Any:
+        try:
+            for key in path:
+                data = data[key]
+        except (KeyError, TypeError, IndexError):
+            return ""  # Return empty string if the path doesn't exist
+        return data
+
+    return accessor
+
+
+def compile_extraction_plan(mapping: dict) -> tuple:
+    """Compile the mapping into an extraction plan: a (buffalogs_key, accessor) couple for each mapped field
+
+    :param mapping: the mapping {ingestion_key: buffalogs_key}
+    :type mapping: dict
+
+    :return: the extraction plan
+    :rtype: tuple of (str, Callable[[dict], Any])
+    """
+    return tuple((buffalogs_key, compile_field_accessor(ingestion_key)) for ingestion_key, buffalogs_key in mapping.items())
 
 
 class BaseIngestion(ABC):
@@ -27,6 +73,18 @@ class BaseIngestion(ABC):
         self.mapping = mapping
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
+    @property
+    def mapping(self) -> dict:
+        return self._mapping
+
+    @mapping.setter
+    def mapping(self, mapping: dict):
+        # the mapping is compiled once, instead of splitting and walking the nested keys for each login
+        self._mapping = mapping
+        self._extraction_plan = compile_extraction_plan(mapping)
+        # if the mapping doesn't contain all the required fields, all the logins are skipped
+        self._required_fields_getter = itemgetter(*REQUIRED_LOGIN_FIELDS) if set(REQUIRED_LOGIN_FIELDS) <= set(mapping.values()) else None
+
     @abstractmethod
     def process_users(self, start_date: datetime, end_date: datetime) -> list:
         """Abstract method that implement the extraction of the users logged in between the time range considered defined by (start_date, end_date).
@@ -59,6 +117,149 @@ class BaseIngestion(ABC):
         """
         raise NotImplementedError
 
+    def count_logins(self, start_date: datetime, end_date: datetime) -> int | None:
+        """Count the logins in the time range defined by (start_date, end_date), used to size the time windows of the detection.
+        This default implementation returns None (count not supported by the ingestion source).
+
+        :param start_date: the initial datetime from which the logins are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: the number of logins, or None if they can't be counted
+        :rtype: int | None
+        """
+        return None
+
+    def iter_user_logins(self, start_date: datetime, end_date: datetime, username: str) -> Iterator[dict]:
+        """Streaming version of process_user_logins: the logins of the given user in the time range defined by (start_date, end_date)
+        are yielded one by one, so that the ingestion sources able to paginate the results keep in memory just a page of logins at a time.
+        This default implementation yields the list returned by process_user_logins.
+
+        :param username: username of the user that logged in
+        :type username: str
+        :param start_date: the initial datetime from which the logins of the user are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins of the user are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: iterator of logins of a user
+        :rtype: Iterator[dict]
+        """
+        yield from self.process_user_logins(start_date, end_date, username)
+
+    def process_logins_bulk(self, start_date: datetime, end_date: datetime) -> Iterator[tuple[str, Iterable[dict]]]:
+        """Extraction of all the logins in the time range defined by (start_date, end_date), grouped by user.
+        This default implementation runs one iter_user_logins query for each user returned by process_users,
+        so the ingestion sources able to fetch all the logins with a single query should override it.
+        The logins of each user can be a lazy iterable, so they must be consumed before advancing to the next user.
+
+        :param start_date: the initial datetime from which the logins are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: iterator of (username, logins of that user) tuples
+        :rtype: Iterator[tuple[str, Iterable[dict]]]
+        """
+        yield from self.process_users_logins(start_date, end_date, self.process_users(start_date, end_date))
+
+    def process_users_logins(self, start_date: datetime, end_date: datetime, usernames: Iterable[str]) -> Iterator[tuple[str, Iterable[dict]]]:
+        """Extraction of the logins of the given users in the time range defined by (start_date, end_date).
+        This default implementation runs the iter_user_logins queries one after the other,
+        so the ingestion sources supporting asynchronous clients should override it to run many queries concurrently.
+
+        :param start_date: the initial datetime from which the logins are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param usernames: the users whose logins must be extracted
+        :type usernames: Iterable[str]
+
+        :return: iterator of (username, logins of that user) tuples
+        :rtype: Iterator[tuple[str, Iterable[dict]]]
+        """
+        for username in usernames:
+            yield username, self.iter_user_logins(start_date, end_date, username)
+
+    def _iter_concurrently(
+        self, client_factory: Callable[[], Any], fetch: Callable[[Any, str], Awaitable[list]], usernames: Iterable[str]
+    ) -> Iterator[tuple[str, list]]:
+        """Run the fetch coroutine for each user with at most ingestion_config["concurrency"] requests in flight,
+        sharing a single asynchronous client. The event loop runs in a background thread and the results are yielded
+        as soon as they are ready (not in the usernames order), through a bounded queue: so the detection can consume them synchronously
+        while the other requests are in flight, and the fetching is paused if the detection is slower than the ingestion source.
+        If the logins of a user can't be fetched, the error is logged and raised to the consumer, so the time window isn't marked as processed
+        with some users missing.
+
+        :param client_factory: function creating the asynchronous client (inside the event loop)
+        :type client_factory: Callable[[], Any]
+        :param fetch: coroutine function returning the list of the logins of a user, given the client and the username
+        :type fetch: Callable[[Any, str], Awaitable[list]]
+        :param usernames: the users whose logins must be extracted
+        :type usernames: Iterable[str]
+
+        :return: iterator of (username, logins of that user) tuples
+        :rtype: Iterator[tuple[str, list]]
+        """
+        concurrency = self.ingestion_config["concurrency"]
+        results = queue.Queue(maxsize=concurrency)
+        stop = threading.Event()
+        done = object()
+        usernames = iter(usernames)
+
+        async def worker(client):
+            # the usernames iterator is shared by the workers, all running in the same event loop thread
+            for username in usernames:
+                if stop.is_set():
+                    return
+                try:
+                    user_logins = await fetch(client, username)
+                except Exception as e:
+                    if isinstance(e, ConnectionError):
+                        self.logger.error(f"Failed to establish a connection with host: {client}")
+                    elif isinstance(e, TimeoutError):
+                        self.logger.error(f"Timeout reached for the host: {client}")
+                    else:
+                        self.logger.error(f"Exception while querying the logins of the user {username}: {e}")
+                    # the other workers stop before fetching the next user
+                    stop.set()
+                    raise
+                await asyncio.to_thread(results.put, (username, user_logins))
+
+        async def run():
+            try:
+                client = client_factory()
+                try:
+                    # the requests in flight are completed before closing the client
+                    errors = [error for error in await asyncio.gather(*(worker(client) for _ in range(concurrency)), return_exceptions=True) if error]
+                finally:
+                    await client.close()
+                if errors:
+                    raise errors[0]
+            except Exception as e:
+                # raised to the consumer, after the results already fetched
+                await asyncio.to_thread(results.put, e)
+            finally:
+                await asyncio.to_thread(results.put, done)
+
+        thread = threading.Thread(target=asyncio.run, args=(run(),), daemon=True)
+        thread.start()
+        try:
+            while (item := results.get()) is not done:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # if the consumer stops early, unblock the workers and wait for the event loop to be closed
+            stop.set()
+            while thread.is_alive():
+                try:
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+
     def normalize_fields(self, logins: list) -> list:
         """Concrete method that manage the mapping into the required BuffaLogs mapping.
         The mapping used is defined into the ingestion.json file "custom_mapping" if defined, otherwise it is used the default one
@@ -69,16 +270,30 @@ class BaseIngestion(ABC):
         :return: the final normalized list of normalized logins
         :rtype: list
         """
-        normalized_logins = []
-        for login in logins:
-            normalized_login = self._normalize_fields(data=login)
-            if normalized_login:
-                normalized_logins.append(normalized_login)
+        return list(self.iter_normalized_fields(logins=logins))
 
-        return normalized_logins
+    def iter_normalized_fields(self, logins: Iterable[dict]) -> Iterator[dict]:
+        """Streaming version of normalize_fields: the logins are normalized and yielded one by one,
+        skipping the ones without the required fields
+
+        :param logins: the logins to be normalized into the mapping fields
+        :type logins: Iterable[dict]
+
+        :return: iterator of the normalized logins
+        :rtype: Iterator[dict]
+        """
+        # the extraction plan is bound once for the whole batch of logins
+        extraction_plan, required_fields_getter = self._extraction_plan, self._required_fields_getter
+        if required_fields_getter is None:
+            return
+        for login in logins:
+            normalized_login = {buffalogs_key: accessor(login) for buffalogs_key, accessor in extraction_plan}
+            # Skip logins without timestamp, ip, country, latitude or longitude
+            if all(required_fields_getter(normalized_login)):
+                yield normalized_login
 
     def _normalize_fields(self, data: dict) -> dict:
-        """Normalize each login based on the mapping
+        """Normalize each login based on the mapping, compiled into the extraction plan
 
         :param data: the logins to be normalized into the mapping fields
         :type data: dict
@@ -86,29 +301,8 @@ class BaseIngestion(ABC):
         :return: the final normalized login dict
         :rtype: dict
         """
-        normalized_data = {}
-        #
-        for ingestion_key, buffalogs_key in self.mapping.items():
-            # Split the key in case it's nested (ex. 'source.geo.location.lat')
-            keys = ingestion_key.split(".")
-            value = data
-
-            # Traverse the nested keys to extract the correct value
-            for k in keys:
-                if isinstance(value, dict) and k in value:
-                    value = value[k]
-                else:
-                    value = ""  # Return empty string if the path doesn't exist
-
-            # Add the value to the normalized data
-            normalized_data[buffalogs_key] = value
+        normalized_data = {buffalogs_key: accessor(data) for buffalogs_key, accessor in self._extraction_plan}
 
         # Skip logins without timestamp, ip, country, latitude or longitude
-        if (
-            normalized_data.get("timestamp")
-            and normalized_data.get("ip")
-            and normalized_data.get("country")
-            and normalized_data.get("lat")
-            and normalized_data.get("lon")
-        ):
+        if self._required_fields_getter and all(self._required_fields_getter(normalized_data)):
             return normalized_data
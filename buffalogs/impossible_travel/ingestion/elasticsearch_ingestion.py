@@ -1,9 +1,28 @@
 import logging
 from datetime import datetime
+from itertools import groupby
+from typing import Iterable, Iterator
 
+from elasticsearch import AsyncElasticsearch
 from elasticsearch.dsl import Search, connections
 from impossible_travel.ingestion.base_ingestion import BaseIngestion
 
+LOGIN_SOURCE_FIELDS = [
+    "user.name",
+    "@timestamp",
+    "source.geo.location.lat",
+    "source.geo.location.lon",
+    "source.geo.country_name",
+    "source.as.organization.name",
+    "user_agent.original",
+    "_index",
+    "source.ip",
+    "_id",
+    "source.intelligence_category",
+]
+# the point in time must be kept alive while a page of logins is processed by the detection, before the next page is requested
+DEFAULT_PIT_KEEP_ALIVE = "10m"
+
 
 class ElasticsearchIngestion(BaseIngestion):
     """
@@ -16,7 +35,12 @@ class ElasticsearchIngestion(BaseIngestion):
         """
         super().__init__(ingestion_config, mapping)
         # create the elasticsearch host connection
-        connections.create_connection(hosts=self.ingestion_config["url"], request_timeout=self.ingestion_config["timeout"], verify_certs=False)
+        connections.create_connection(
+            hosts=self.ingestion_config["url"],
+            request_timeout=self.ingestion_config["timeout"],
+            verify_certs=False,
+            connections_per_node=self.ingestion_config.get("pool_size", 10),
+        )
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
     def process_users(self, start_date: datetime, end_date: datetime) -> list:
@@ -77,7 +101,212 @@ class ElasticsearchIngestion(BaseIngestion):
         """
         response = None
         user_logins = []
+        s = self._user_logins_search(start_date, end_date, username)
+        try:
+            response = s.execute()
+        except ConnectionError:
+            self.logger.error(f"Failed to establish a connection with host: {connections.get_connection()}")
+        except TimeoutError:
+            self.logger.error(f"Timeout reached for the host: {connections.get_connection()}")
+        except Exception as e:
+            self.logger.error(f"Exception while quering elasticsearch: {e}")
+
+        # create a single standard dict (with the required fields listed in the ingestion.json config file) for each login
+        if response:
+            self.logger.info(f"Got {len(response)} logins for the user {username} to be normalized")
+
+            for hit in response.hits.hits:
+                user_logins.append(self._build_login(hit.to_dict()))
+
+        return user_logins
+
+    def iter_user_logins(self, start_date: datetime, end_date: datetime, username: str) -> Iterator[dict]:
+        """
+        Concrete implementation of the BaseIngestion.iter_user_logins method.
+        The logins are fetched with a plain sorted search, and only if they don't fit in a page (of bucket_size logins)
+        they are fetched again page by page with search_after inside a point in time.
+
+        :param username: username of the user that logged in Elasticsearch
+        :type username: str
+        :param start_date: the initial datetime from which the logins of the user are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins of the user are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: iterator of the logins (dictionaries) for that username
+        :rtype: Iterator[dict]
+        """
+        s = self._user_logins_search(start_date, end_date, username)
+        try:
+            hits = s.execute().hits.hits
+        except Exception as e:
+            self.logger.error(f"Exception while quering elasticsearch: {e}")
+            raise
+        if len(hits) < self.ingestion_config["bucket_size"]:
+            # all the logins of the user are in the first page, without opening and closing a point in time
+            hits = (hit.to_dict() for hit in hits)
+        else:
+            hits = self._iterate_hits(s)
+        for hit in hits:
+            yield self._build_login(hit)
+
+    def process_logins_bulk(self, start_date: datetime, end_date: datetime) -> Iterator[tuple[str, Iterable[dict]]]:
+        """
+        Concrete implementation of the BaseIngestion.process_logins_bulk method.
+        All the logins in the time range are extracted with a single search sorted by (user.name, @timestamp),
+        paginated with search_after inside a point in time, so the logins of each user are consecutive.
+
+        :param start_date: the initial datetime from which the logins are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: iterator of (username, lazy iterator of the logins of that user) tuples
+        :rtype: Iterator[tuple[str, Iterable[dict]]]
+        """
+        self.logger.info(f"Starting bulk logins extraction at: {start_date} Finishing at: {end_date}")
         s = (
+            self._logins_search(start_date, end_date)
+            .source(includes=LOGIN_SOURCE_FIELDS)
+            .sort("user.name", "@timestamp")  # logins grouped by user, from the oldest to the most recent one
+            .extra(size=self.ingestion_config["bucket_size"])
+        )
+        for username, user_hits in groupby(self._iterate_hits(s), key=lambda hit: hit["sort"][0]):
+            if username:  # exclude not well-formatted usernames (e.g. "")
+                yield username, map(self._build_login, user_hits)
+
+    def count_logins(self, start_date: datetime, end_date: datetime) -> int | None:
+        """
+        Concrete implementation of the BaseIngestion.count_logins method, with a count query
+
+        :param start_date: the initial datetime from which the logins are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: the number of logins, or None if the query failed
+        :rtype: int | None
+        """
+        try:
+            return self._logins_search(start_date, end_date).count()
+        except ConnectionError:
+            self.logger.error(f"Failed to establish a connection with host: {connections.get_connection()}")
+        except TimeoutError:
+            self.logger.error(f"Timeout reached for the host: {connections.get_connection()}")
+        except Exception as e:
+            self.logger.error(f"Exception while quering elasticsearch: {e}")
+        return None
+
+    def process_users_logins(self, start_date: datetime, end_date: datetime, usernames: Iterable[str]) -> Iterator[tuple[str, Iterable[dict]]]:
+        """
+        Concrete implementation of the BaseIngestion.process_users_logins method.
+        If the "concurrency" option is greater than 1, up to "concurrency" users are queried at the same time with an AsyncElasticsearch client
+
+        :param start_date: the initial datetime from which the logins are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param usernames: the users whose logins must be extracted
+        :type usernames: Iterable[str]
+
+        :return: iterator of (username, logins of that user) tuples
+        :rtype: Iterator[tuple[str, Iterable[dict]]]
+        """
+        if self.ingestion_config.get("concurrency", 1) <= 1:
+            yield from super().process_users_logins(start_date, end_date, usernames)
+            return
+        yield from self._iter_concurrently(
+            client_factory=self._async_client,
+            fetch=lambda client, username: self._async_user_logins(client, start_date, end_date, username),
+            usernames=usernames,
+        )
+
+    def _async_client(self) -> AsyncElasticsearch:
+        """Create the asynchronous client, with a connection pool of "pool_size" connections"""
+        return AsyncElasticsearch(
+            hosts=self.ingestion_config["url"],
+            request_timeout=self.ingestion_config["timeout"],
+            verify_certs=False,
+            connections_per_node=self.ingestion_config.get("pool_size", 10),
+        )
+
+    async def _async_user_logins(self, client: AsyncElasticsearch, start_date: datetime, end_date: datetime, username: str) -> list:
+        """Asynchronous version of iter_user_logins: the logins are fetched with a plain sorted search, and only if they don't fit in a page
+        they are fetched again page by page with search_after inside a point in time
+
+        :param client: the asynchronous client
+        :type client: AsyncElasticsearch
+        :param username: username of the user that logged in Elasticsearch
+        :type username: str
+        :param start_date: the initial datetime from which the logins of the user are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins of the user are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: list of the logins (dictionaries) for that username
+        :rtype: list of dicts
+        """
+        body = self._user_logins_search(start_date, end_date, username).to_dict()
+        response = await client.search(index=self.ingestion_config["indexes"], body=body)
+        hits = response["hits"]["hits"]
+        if len(hits) < self.ingestion_config["bucket_size"]:
+            # all the logins of the user are in the first page, without opening and closing a point in time
+            self.logger.info(f"Got {len(hits)} logins for the user {username} to be normalized")
+            return [self._build_login(hit) for hit in hits]
+        user_logins = []
+        keep_alive = self.ingestion_config.get("pit_keep_alive", DEFAULT_PIT_KEEP_ALIVE)
+        pit = await client.open_point_in_time(index=self.ingestion_config["indexes"], keep_alive=keep_alive)
+        try:
+            while True:
+                body["pit"] = {"id": pit["id"], "keep_alive": keep_alive}
+                response = await client.search(body=body)
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
+                user_logins.extend(self._build_login(hit) for hit in hits)
+                body["search_after"] = hits[-1]["sort"]
+                # the point in time id can change between the searches
+                pit = {"id": response.body.get("pit_id", pit["id"])}
+        finally:
+            await client.close_point_in_time(id=pit["id"])
+        self.logger.info(f"Got {len(user_logins)} logins for the user {username} to be normalized")
+        return user_logins
+
+    def _logins_search(self, start_date: datetime, end_date: datetime) -> Search:
+        """Build the search of the logins of all the users in the time range defined by (start_date, end_date)
+
+        :param start_date: the initial datetime from which the logins are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: the search
+        :rtype: Search
+        """
+        return (
+            Search(index=self.ingestion_config["indexes"])
+            .filter("range", **{"@timestamp": {"gte": start_date, "lt": end_date}})
+            .query("match", **{"event.category": "authentication"})
+            .query("match", **{"event.outcome": "success"})
+            .query("match", **{"event.type": "start"})
+            .query("exists", field="user.name")
+            .query("exists", field="source.ip")
+        )
+
+    def _user_logins_search(self, start_date: datetime, end_date: datetime, username: str) -> Search:
+        """Build the search of the logins of the given user in the time range defined by (start_date, end_date)
+
+        :param username: username of the user that logged in Elasticsearch
+        :type username: str
+        :param start_date: the initial datetime from which the logins of the user are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins of the user are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: the search sorted from the oldest to the most recent login
+        :rtype: Search
+        """
+        return (
             Search(index=self.ingestion_config["indexes"])
             .filter("range", **{"@timestamp": {"gte": start_date, "lt": end_date}})
             .query("match", **{"user.name": username})
@@ -85,44 +314,52 @@ class ElasticsearchIngestion(BaseIngestion):
             .query("match", **{"event.outcome": "success"})
             .query("match", **{"event.type": "start"})
             .query("exists", field="source.ip")
-            .source(
-                includes=[
-                    "user.name",
-                    "@timestamp",
-                    "source.geo.location.lat",
-                    "source.geo.location.lon",
-                    "source.geo.country_name",
-                    "source.as.organization.name",
-                    "user_agent.original",
-                    "_index",
-                    "source.ip",
-                    "_id",
-                    "source.intelligence_category",
-                ]
-            )
+            .source(includes=LOGIN_SOURCE_FIELDS)
             .sort("@timestamp")  # from the oldest to the most recent login
             .extra(size=self.ingestion_config["bucket_size"])
         )
+
+    def _iterate_hits(self, s: Search) -> Iterator[dict]:
+        """Iterate over all the hits of the given sorted search, page by page, using a point in time and search_after.
+        The errors are logged and raised again, so the time window isn't marked as processed with only part of its logins
+
+        :param s: the search to be executed, with an explicit sort
+        :type s: Search
+
+        :return: iterator of the raw hits (dictionaries)
+        :rtype: Iterator[dict]
+        """
         try:
-            response = s.execute()
+            with s.point_in_time(keep_alive=self.ingestion_config.get("pit_keep_alive", DEFAULT_PIT_KEEP_ALIVE)) as pit_search:
+                while True:
+                    response = pit_search.execute()
+                    if not response.hits:
+                        break
+                    for hit in response.hits.hits:
+                        yield hit.to_dict()
+                    pit_search = pit_search.search_after()
         except ConnectionError:
             self.logger.error(f"Failed to establish a connection with host: {connections.get_connection()}")
+            raise
         except TimeoutError:
             self.logger.error(f"Timeout reached for the host: {connections.get_connection()}")
+            raise
         except Exception as e:
             self.logger.error(f"Exception while quering elasticsearch: {e}")
+            raise
 
-        # create a single standard dict (with the required fields listed in the ingestion.json config file) for each login
-        if response:
-            self.logger.info(f"Got {len(response)} logins for the user {username} to be normalized")
+    def _build_login(self, hit_dict: dict) -> dict:
+        """Create a single standard dict (with the required fields listed in the ingestion.json config file) for a login hit
 
-            for hit in response.hits.hits:
-                hit_dict = hit.to_dict()
-                tmp = {
-                    "_index": "fw-proxy" if hit_dict.get("_index", "").startswith("fw-") else hit_dict.get("_index", "").split("-")[0],
-                    "_id": hit_dict["_id"],
-                }
-                tmp.update(hit_dict["_source"])
-                user_logins.append(tmp)
+        :param hit_dict: the raw hit returned by Elasticsearch
+        :type hit_dict: dict
 
-        return user_logins
+        :return: the login dict to be normalized
+        :rtype: dict
+        """
+        login = {
+            "_index": "fw-proxy" if hit_dict.get("_index", "").startswith("fw-") else hit_dict.get("_index", "").split("-")[0],
+            "_id": hit_dict["_id"],
+        }
+        login.update(hit_dict["_source"])
+        return login
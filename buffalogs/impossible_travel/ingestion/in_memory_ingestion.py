@@ -0,0 +1,59 @@
+import logging
+from datetime import datetime
+
+from impossible_travel.ingestion.base_ingestion import BaseIngestion
+
+
+class InMemoryIngestion(BaseIngestion):
+    """
+    Concrete implementation of the BaseIngestion class serving the logins from memory (e.g. synthetic logins for the benchmarks),
+    without any external ingestion source
+    """
+
+    def __init__(self, ingestion_config: dict, mapping: dict, users_logins: dict):
+        """
+        Constructor for the In-memory Ingestion object
+
+        :param users_logins: the raw logins of each user {username: [login, ...]}, with the "@timestamp" field in ISO format
+        :type users_logins: dict
+        """
+        super().__init__(ingestion_config, mapping)
+        self.users_logins = users_logins
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+    def process_users(self, start_date: datetime, end_date: datetime) -> list:
+        """
+        Concrete implementation of the BaseIngestion.process_users abstract method
+
+        :param start_date: the initial datetime from which the users are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the users are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: list of users that logged in the time range
+        :rtype: list
+        """
+        return [username for username in self.users_logins if self.process_user_logins(start_date, end_date, username)]
+
+    def process_user_logins(self, start_date: datetime, end_date: datetime, username: str) -> list:
+        """
+        Concrete implementation of the BaseIngestion.process_user_logins abstract method
+
+        :param username: username of the user
+        :type username: str
+        :param start_date: the initial datetime from which the logins of the user are considered
+        :type start_date: datetime (with tzinfo=datetime.timezone.utc)
+        :param end_date: the final datetime within which the logins of the user are considered
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: list of the logins of the user in the time range, from the oldest to the most recent one
+        :rtype: list of dicts
+        """
+        user_logins = [login for login in self.users_logins.get(username, []) if start_date <= datetime.fromisoformat(login["@timestamp"]) < end_date]
+        return sorted(user_logins, key=lambda login: datetime.fromisoformat(login["@timestamp"]))
+
+    def count_logins(self, start_date: datetime, end_date: datetime) -> int:
+        """
+        Concrete implementation of the BaseIngestion.count_logins method
+        """
+        return sum(len(self.process_user_logins(start_date, end_date, username)) for username in self.users_logins)
@@ -1,10 +1,17 @@
 import logging
 from datetime import datetime
+from typing import Iterable, Iterator
 
 from impossible_travel.ingestion.base_ingestion import BaseIngestion
 
 try:
-    from opensearchpy import OpenSearch
+    from opensearchpy import OpenSearch, helpers
+except ImportError:
+    pass
+
+try:
+    # the asynchronous client requires aiohttp
+    from opensearchpy import AsyncOpenSearch
 except ImportError:
     pass
 
@@ -24,6 +31,7 @@ class OpensearchIngestion(BaseIngestion):
             hosts=[self.ingestion_config["url"]],
             timeout=self.ingestion_config["timeout"],
             verify_certs=False,
+            pool_maxsize=self.ingestion_config.get("pool_size", 10),
         )
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
@@ -84,7 +92,144 @@ class OpensearchIngestion(BaseIngestion):
         """
         response = None  # Initialize the response variable
         user_logins = []
+        query = self._user_logins_query(start_date, end_date, username)
+        try:
+            response = self.client.search(index=self.ingestion_config["indexes"], body=query)
+        except ConnectionError:
+            self.logger.error(f"Failed to establish a connection with host:{self.client}")
+        except TimeoutError:
+            self.logger.error(f"Timeout reached for the host:{self.client}")
+        except Exception as e:
+            self.logger.error(f"Exception while querying opensearch:{e}")
+        # only access response if it exists and has the expected structure
+        if response and "hits" in response and "hits" in response["hits"]:
+            # Process hits into standardized format
+            self.logger.info(f"Got {len(response['hits']['hits'])} logins or the user {username} to be normalized")
+
+            for hit in response["hits"]["hits"]:
+                user_logins.append(self._build_login(hit))
+
+        return user_logins
+
+    def iter_user_logins(self, start_date: datetime, end_date: datetime, username: str) -> Iterator[dict]:
+        """
+        Concrete implementation of the BaseIngestion.iter_user_logins method.
+        The logins are fetched page by page (of bucket_size logins each) with a sorted scroll search.
+        The errors are logged and raised again, so the time window isn't marked as processed with only part of the user's logins
+
+        :param username: Username of the user that logged in
+        :param start_date: the initial datetime from which the logins of the user are considered
+        :param end_date: the final datetime within which the logins of the user are considered
+        :return: iterator of the logins (dictionaries) for that specified username
+        :rtype: Iterator[dict]
+        """
+        query = self._user_logins_query(start_date, end_date, username)
+        # the page size is set by the scroll parameters
+        page_size = query.pop("size")
+        try:
+            for hit in helpers.scan(self.client, query=query, index=self.ingestion_config["indexes"], size=page_size, preserve_order=True):
+                yield self._build_login(hit)
+        except ConnectionError:
+            self.logger.error(f"Failed to establish a connection with host:{self.client}")
+            raise
+        except TimeoutError:
+            self.logger.error(f"Timeout reached for the host:{self.client}")
+            raise
+        except Exception as e:
+            self.logger.error(f"Exception while querying opensearch:{e}")
+            raise
+
+    def count_logins(self, start_date: datetime, end_date: datetime) -> int | None:
+        """
+        Concrete implementation of the BaseIngestion.count_logins method, with a count query
+
+        :param start_date: the initial datetime from which the logins are considered
+        :param end_date: the final datetime within which the logins are considered
+        :return: the number of logins, or None if the query failed
+        :rtype: int | None
+        """
         query = {
+            "query": {
+                "bool": {
+                    "must": [
+                        {"range": {"@timestamp": {"gte": start_date, "lt": end_date}}},
+                        {"match": {"event.category": "authentication"}},
+                        {"match": {"event.outcome": "success"}},
+                        {"match": {"event.type": "start"}},
+                        {"exists": {"field": "user.name"}},
+                        {"exists": {"field": "source.ip"}},
+                    ]
+                }
+            }
+        }
+        try:
+            return self.client.count(index=self.ingestion_config["indexes"], body=query)["count"]
+        except ConnectionError:
+            self.logger.error(f"Failed to establish a connection with host:{self.client}")
+        except TimeoutError:
+            self.logger.error(f"Timeout reached for the host:{self.client}")
+        except Exception as e:
+            self.logger.error(f"Exception while querying opensearch:{e}")
+        return None
+
+    def process_users_logins(self, start_date: datetime, end_date: datetime, usernames: Iterable[str]) -> Iterator[tuple[str, Iterable[dict]]]:
+        """
+        Concrete implementation of the BaseIngestion.process_users_logins method.
+        If the "concurrency" option is greater than 1, up to "concurrency" users are queried at the same time with an AsyncOpenSearch client
+
+        :param start_date: the initial datetime from which the logins are considered
+        :param end_date: the final datetime within which the logins are considered
+        :param usernames: the users whose logins must be extracted
+        :return: iterator of (username, logins of that user) tuples
+        :rtype: Iterator[tuple[str, Iterable[dict]]]
+        """
+        if self.ingestion_config.get("concurrency", 1) <= 1:
+            yield from super().process_users_logins(start_date, end_date, usernames)
+            return
+        yield from self._iter_concurrently(
+            client_factory=self._async_client,
+            fetch=lambda client, username: self._async_user_logins(client, start_date, end_date, username),
+            usernames=usernames,
+        )
+
+    def _async_client(self) -> "AsyncOpenSearch":
+        """Create the asynchronous client, with a connection pool of "pool_size" connections"""
+        return AsyncOpenSearch(
+            hosts=[self.ingestion_config["url"]],
+            timeout=self.ingestion_config["timeout"],
+            verify_certs=False,
+            pool_maxsize=self.ingestion_config.get("pool_size", 10),
+        )
+
+    async def _async_user_logins(self, client: "AsyncOpenSearch", start_date: datetime, end_date: datetime, username: str) -> list:
+        """Asynchronous version of iter_user_logins: the logins are fetched page by page with a sorted scroll search
+
+        :param client: the asynchronous client
+        :param username: Username of the user that logged in
+        :param start_date: the initial datetime from which the logins of the user are considered
+        :param end_date: the final datetime within which the logins of the user are considered
+        :return: list of the logins (dictionaries) for that specified username
+        :rtype: list of dicts
+        """
+        query = self._user_logins_query(start_date, end_date, username)
+        page_size = query.pop("size")
+        user_logins = [
+            self._build_login(hit)
+            async for hit in helpers.async_scan(client, query=query, index=self.ingestion_config["indexes"], size=page_size, preserve_order=True)
+        ]
+        self.logger.info(f"Got {len(user_logins)} logins for the user {username} to be normalized")
+        return user_logins
+
+    def _user_logins_query(self, start_date: datetime, end_date: datetime, username: str) -> dict:
+        """Build the query of the logins of the given user in the time range defined by (start_date, end_date)
+
+        :param username: Username of the user that logged in
+        :param start_date: the initial datetime from which the logins of the user are considered
+        :param end_date: the final datetime within which the logins of the user are considered
+        :return: the query body, sorted from the oldest to the most recent login
+        :rtype: dict
+        """
+        return {
             "query": {
                 "bool": {
                     "must": [
@@ -112,26 +257,19 @@ class OpensearchIngestion(BaseIngestion):
             ],
             "size": self.ingestion_config["bucket_size"],
         }
-        try:
-            response = self.client.search(index=self.ingestion_config["indexes"], body=query)
-        except ConnectionError:
-            self.logger.error(f"Failed to establish a connection with host:{self.client}")
-        except TimeoutError:
-            self.logger.error(f"Timeout reached for the host:{self.client}")
-        except Exception as e:
-            self.logger.error(f"Exception while querying opensearch:{e}")
-        # only access response if it exists and has the expected structure
-        if response and "hits" in response and "hits" in response["hits"]:
-            # Process hits into standardized format
-            self.logger.info(f"Got {len(response['hits']['hits'])} logins or the user {username} to be normalized")
 
-            for hit in response["hits"]["hits"]:
-                tmp = {
-                    "_index": "fw-proxy" if hit.get("_index", "").startswith("fw-") else hit.get("_index", "").split("-")[0],
-                    "_id": hit["_id"],
-                }
-                # Add source data to the tmp dict
-                tmp.update(hit["_source"])
-                user_logins.append(tmp)
+    def _build_login(self, hit: dict) -> dict:
+        """Create a single standard dict (with the required fields listed in the ingestion.json config file) for a login hit
 
-        return user_logins
+        :param hit: the raw hit returned by Opensearch
+        :type hit: dict
+        :return: the login dict to be normalized
+        :rtype: dict
+        """
+        login = {
+            "_index": "fw-proxy" if hit.get("_index", "").startswith("fw-") else hit.get("_index", "").split("-")[0],
+            "_id": hit["_id"],
+        }
+        # Add source data to the login dict
+        login.update(hit["_source"])
+        return login
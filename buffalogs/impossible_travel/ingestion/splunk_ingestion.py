@@ -1,5 +1,9 @@
+import io
+import json
 import logging
 from datetime import datetime
+from itertools import groupby
+from typing import Iterable, Iterator
 
 try:
     from splunklib import client, results
@@ -60,15 +64,13 @@ class SplunkIngestion(BaseIngestion):
             search_kwargs = {
                 "earliest_time": start_date_str,
                 "latest_time": end_date_str,
-                "exec_mode": "normal",
+                # the call returns when the job is done, instead of polling it
+                "exec_mode": "blocking",
                 "count": self.ingestion_config.get("bucket_size", 10000),
             }
 
             search_job = self.service.jobs.create(query, **search_kwargs)
 
-            while not search_job.is_done():
-                search_job.refresh()
-
             results_reader = results.ResultsReader(search_job.results())
             for result in results_reader:
                 if isinstance(result, dict) and "user.name" in result:
@@ -100,30 +102,18 @@ class SplunkIngestion(BaseIngestion):
         end_date_str = end_date.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
 
         # Build Splunk query to get login events for the specific user
-        query = f"""
-            search index={self.ingestion_config["indexes"]}
-            earliest="{start_date_str}" latest="{end_date_str}"
-            user.name="{username}" event.category="authentication" event.outcome="success" event.type="start"
-            | where isnotnull(source.ip)
-            | fields user.name, _time AS "@timestamp", source.geo.location.lat, source.geo.location.lon,
-              source.geo.country_name, source.as.organization.name, user_agent.original, index, source.ip, _id,
-              source.intelligence_category
-            | sort 0 @timestamp
-        """
+        query = self._user_logins_query(start_date_str, end_date_str, username)
         try:
             search_kwargs = {
                 "earliest_time": start_date_str,
                 "latest_time": end_date_str,
-                "exec_mode": "normal",
+                # the call returns when the job is done, instead of polling it
+                "exec_mode": "blocking",
                 "count": self.ingestion_config.get("bucket_size", 10000),
             }
 
             search_job = self.service.jobs.create(query, **search_kwargs)
 
-            # Wait for the job to complete
-            while not search_job.is_done():
-                search_job.refresh()
-
             results_reader = results.ResultsReader(search_job.results())
             for result in results_reader:
                 if isinstance(result, dict):
@@ -138,3 +128,168 @@ class SplunkIngestion(BaseIngestion):
         except Exception as e:
             self.logger.error(f"Exception while querying Splunk: {e}")
         return response
+
+    def iter_user_logins(self, start_date: datetime, end_date: datetime, username: str) -> Iterator[dict]:
+        """
+        Concrete implementation of the BaseIngestion.iter_user_logins method.
+        The results of the search job are read page by page (of bucket_size logins each).
+        The errors are logged and raised again, so the time window isn't marked as processed with only part of the user's logins
+
+        :param username: Username of the user that logged in
+        :param start_date: Initial datetime from which logins are considered
+        :param end_date: Final datetime within which logins are considered
+        :return: Iterator of login dictionaries for the specified user
+        """
+        # Format dates for Splunk query
+        start_date_str = start_date.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        end_date_str = end_date.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        page_size = self.ingestion_config.get("bucket_size", 10000)
+
+        try:
+            search_job = self.service.jobs.create(
+                self._user_logins_query(start_date_str, end_date_str, username),
+                earliest_time=start_date_str,
+                latest_time=end_date_str,
+                # the call returns when the job is done, instead of polling it
+                exec_mode="blocking",
+            )
+
+            offset = 0
+            while True:
+                page_logins = 0
+                for result in results.ResultsReader(search_job.results(count=page_size, offset=offset)):
+                    if isinstance(result, dict):
+                        page_logins += 1
+                        yield result
+                if page_logins < page_size:
+                    break
+                offset += page_size
+
+        except ConnectionError:
+            self.logger.error(f"Failed to establish a connection with host: {self.ingestion_config.get('host')}")
+            raise
+        except TimeoutError:
+            self.logger.error(f"Timeout reached for the host: {self.ingestion_config.get('host')}")
+            raise
+        except Exception as e:
+            self.logger.error(f"Exception while querying Splunk: {e}")
+            raise
+
+    def process_logins_bulk(self, start_date: datetime, end_date: datetime) -> Iterator[tuple[str, Iterable[dict]]]:
+        """
+        Concrete implementation of the BaseIngestion.process_logins_bulk method.
+        All the logins in the time range are extracted with a single export (streaming) search sorted by (user.name, @timestamp),
+        whose JSON results are parsed while they are received, so the logins of each user are consecutive.
+
+        :param start_date: Initial datetime from which logins are considered
+        :param end_date: Final datetime within which logins are considered
+        :return: Iterator of (username, lazy iterator of the logins of that user) tuples
+        """
+        self.logger.info(f"Starting bulk logins extraction at: {start_date} Finishing at: {end_date}")
+        # Format dates for Splunk query
+        start_date_str = start_date.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        end_date_str = end_date.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+        logins = self._export_results(self._logins_query(start_date_str, end_date_str), start_date_str, end_date_str)
+        for username, user_logins in groupby(logins, key=lambda login: login.get("user.name", "")):
+            if username:  # exclude not well-formatted usernames (e.g. "")
+                yield username, user_logins
+
+    def count_logins(self, start_date: datetime, end_date: datetime) -> int | None:
+        """
+        Concrete implementation of the BaseIngestion.count_logins method, with a tstats count export search.
+        The tstats command reads only the indexed metadata, without a search job scanning the raw events,
+        so the count includes all the events of the indexes: an upper bound of the logins, enough to size the time windows
+
+        :param start_date: Initial datetime from which logins are considered
+        :param end_date: Final datetime within which logins are considered
+        :return: The number of logins, or None if the query failed
+        """
+        start_date_str = start_date.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        end_date_str = end_date.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        query = f'| tstats count where index={self.ingestion_config["indexes"]} earliest="{start_date_str}" latest="{end_date_str}"'
+        try:
+            for result in self._export_results(query, start_date_str, end_date_str):
+                return int(result["count"])
+        except Exception:
+            # already logged by _export_results: the time windows are sized without the count
+            pass
+        return None
+
+    def _export_results(self, query: str, start_date_str: str, end_date_str: str) -> Iterator[dict]:
+        """
+        Run the query as an export search, streaming the final results (one JSON object per line) as soon as they are received.
+        The errors are logged and raised again, so the time window isn't marked as processed with only part of its logins
+
+        :param query: The Splunk query string
+        :param start_date_str: Initial datetime (Splunk formatted) from which logins are considered
+        :param end_date_str: Final datetime (Splunk formatted) within which logins are considered
+        :return: Iterator of the results dictionaries
+        """
+        try:
+            stream = self.service.jobs.export(
+                query,
+                earliest_time=start_date_str,
+                latest_time=end_date_str,
+                search_mode="normal",
+                output_mode="json",
+            )
+            # the results are read line by line, not loaded all at once as by the splunklib JSONResultsReader
+            for line in io.BufferedReader(stream):
+                if not line.strip():
+                    continue
+                parsed_line = json.loads(line)
+                for message in parsed_line.get("messages", []):
+                    self.logger.info(f"Splunk message {message.get('type')}: {message.get('text')}")
+                # skip the partial results of the preview
+                if "result" in parsed_line and not parsed_line.get("preview", False):
+                    yield parsed_line["result"]
+
+        except ConnectionError:
+            self.logger.error(f"Failed to establish a connection with host: {self.ingestion_config.get('host')}")
+            raise
+        except TimeoutError:
+            self.logger.error(f"Timeout reached for the host: {self.ingestion_config.get('host')}")
+            raise
+        except Exception as e:
+            self.logger.error(f"Exception while querying Splunk: {e}")
+            raise
+
+    def _logins_query(self, start_date_str: str, end_date_str: str) -> str:
+        """
+        Build the Splunk query to get the login events of all the users, sorted by user and then from the oldest to the most recent one
+
+        :param start_date_str: Initial datetime (Splunk formatted) from which logins are considered
+        :param end_date_str: Final datetime (Splunk formatted) within which logins are considered
+        :return: The Splunk query string
+        """
+        return f"""
+            search index={self.ingestion_config["indexes"]}
+            earliest="{start_date_str}" latest="{end_date_str}"
+            event.category="authentication" event.outcome="success" event.type="start"
+            | where isnotnull(source.ip) AND isnotnull(user.name) AND user.name!=""
+            | fields user.name, _time AS "@timestamp", source.geo.location.lat, source.geo.location.lon,
+              source.geo.country_name, source.as.organization.name, user_agent.original, index, source.ip, _id,
+              source.intelligence_category
+            | sort 0 user.name, @timestamp
+        """
+
+    def _user_logins_query(self, start_date_str: str, end_date_str: str, username: str) -> str:
+        """
+        Build the Splunk query to get the login events of the given user, sorted from the oldest to the most recent one
+
+        :param start_date_str: Initial datetime (Splunk formatted) from which logins are considered
+        :param end_date_str: Final datetime (Splunk formatted) within which logins are considered
+        :param username: Username of the user that logged in
+        :return: The Splunk query string
+        """
+        return f"""
+            search index={self.ingestion_config["indexes"]}
+            earliest="{start_date_str}" latest="{end_date_str}"
+            user.name="{username}" event.category="authentication" event.outcome="success" event.type="start"
+            | where isnotnull(source.ip)
+            | fields user.name, _time AS "@timestamp", source.geo.location.lat, source.geo.location.lon,
+              source.geo.country_name, source.as.organization.name, user_agent.original, index, source.ip, _id,
+              source.intelligence_category
+            | sort 0 @timestamp
+        """
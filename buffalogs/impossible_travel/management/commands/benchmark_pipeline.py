@@ -0,0 +1,201 @@
+import json
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.core.management.base import CommandError, CommandParser
+from django.db import connection
+from django.utils import timezone
+from impossible_travel import tasks
+from impossible_travel.ingestion.in_memory_ingestion import InMemoryIngestion
+from impossible_travel.management.commands.base_command import TaskLoggingCommand
+from impossible_travel.models import Alert, Login, User
+from impossible_travel.utils.synthetic_logins import SyntheticLoginsGenerator
+from impossible_travel.utils.utils import get_user_agent_cache_info
+from impossible_travel.views.utils import read_config
+
+BENCHMARK_USERNAME_PREFIX = "benchmark_user"
+# users owning the background logins, which fill the Login table without being detected
+BACKGROUND_USERNAME_PREFIX = "benchmark_background"
+BACKGROUND_LOGINS_PER_USER = 1000
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run by the benchmarked code"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(TaskLoggingCommand):
+    help = "Benchmark the ingestion->detection pipeline on synthetic logins, reporting the throughput, the DB queries and the per-user latency"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--users", type=int, default=100, help="Number of synthetic users (default: 100)")
+        parser.add_argument("--logins-per-user", type=int, default=50, help="Number of logins of each user (default: 50)")
+        parser.add_argument("--countries", type=int, default=5, help="Number of distinct countries of the logins (default: 5)")
+        parser.add_argument("--user-agents", type=int, default=5, help="Number of distinct user-agents of the logins (default: 5)")
+        parser.add_argument("--anomaly-rate", type=float, default=0.05, help="Share of anomalous logins, from 0 to 1 (default: 0.05)")
+        parser.add_argument("--seed", type=int, default=None, help="Seed of the generator, for reproducible runs")
+        parser.add_argument(
+            "--background-logins",
+            type=int,
+            default=0,
+            help="Logins of other users inserted in the Login table before the run, to measure the latency as the table grows (default: 0)",
+        )
+        parser.add_argument(
+            "--allow-live",
+            action="store_true",
+            help="Confirm that the benchmark can write its synthetic users, logins and alerts in the configured database (required)",
+        )
+        parser.add_argument("--keep-data", action="store_true", help="Don't delete the benchmark users, logins and alerts at the end")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+        return super().add_arguments(parser)
+
+    def handle(self, *args, **options):
+        if not options["allow_live"]:
+            raise CommandError(
+                f"The benchmark writes synthetic data in the database {connection.settings_dict['NAME']} on {connection.settings_dict['HOST'] or 'localhost'}: "
+                "run it against a dedicated database and pass --allow-live to confirm"
+            )
+        if options["users"] < 1 or options["logins_per_user"] < 1:
+            raise CommandError("The number of users and of logins per user must be positive")
+        if not 0 <= options["anomaly_rate"] <= 1:
+            raise CommandError("The anomaly rate must be between 0 and 1")
+        if options["background_logins"] < 0:
+            raise CommandError("The number of background logins can't be negative")
+
+        end_date = timezone.now()
+        generator = SyntheticLoginsGenerator(
+            users=options["users"],
+            logins_per_user=options["logins_per_user"],
+            countries=options["countries"],
+            user_agents=options["user_agents"],
+            anomaly_rate=options["anomaly_rate"],
+            seed=options["seed"],
+            username_prefix=BENCHMARK_USERNAME_PREFIX,
+        )
+        users_logins = generator.generate(end_date)
+        start_date = min(datetime.fromisoformat(user_logins[0]["@timestamp"]) for user_logins in users_logins.values())
+        # the synthetic logins have the fields of the Elasticsearch logins
+        ingestion_config = read_config("ingestion.json", "elasticsearch")
+        ingestion = InMemoryIngestion(ingestion_config, ingestion_config["custom_mapping"], users_logins)
+
+        self.clean_benchmark_data()
+        if options["background_logins"]:
+            self.add_background_logins(options["background_logins"], end_date)
+        results = self.run_benchmark(ingestion, start_date, end_date + timedelta(seconds=1))
+        if not options["keep_data"]:
+            self.clean_benchmark_data()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.write_report(results)
+
+    def run_benchmark(self, ingestion: InMemoryIngestion, start_date, end_date) -> dict:
+        """Run the detection of all the users, as the process_logs task, measuring each user's detection
+
+        :return: the benchmark results
+        :rtype: dict
+        """
+        query_counter = QueryCounter()
+        users_latencies = []
+        started = time.perf_counter()
+        with connection.execute_wrapper(query_counter):
+            for username, user_logins in ingestion.process_logins_bulk(start_date, end_date):
+                user_started = time.perf_counter()
+                tasks.detect_user(username, user_logins, ingestion)
+                users_latencies.append(time.perf_counter() - user_started)
+        elapsed = time.perf_counter() - started
+
+        logins = Login.objects.filter(user__username__startswith=BENCHMARK_USERNAME_PREFIX)
+        alerts = Alert.objects.filter(user__username__startswith=BENCHMARK_USERNAME_PREFIX)
+        processed_logins = sum(len(user_logins) for user_logins in ingestion.users_logins.values())
+        return {
+            "users": len(users_latencies),
+            "logins": processed_logins,
+            "stored_logins": logins.count(),
+            "table_logins": Login.objects.count(),
+            "elapsed_seconds": round(elapsed, 3),
+            "logins_per_second": round(processed_logins / elapsed, 1) if elapsed else None,
+            "queries": query_counter.count,
+            "queries_per_login": round(query_counter.count / processed_logins, 3),
+            "user_latency_ms": {
+                "p50": round(statistics.median(users_latencies) * 1000, 2),
+                "p95": round(self.percentile(users_latencies, 95) * 1000, 2),
+                "max": round(max(users_latencies) * 1000, 2),
+            },
+            "alerts": dict(Counter(alerts.values_list("name", flat=True))),
+            "user_agent_cache": get_user_agent_cache_info(),
+        }
+
+    @staticmethod
+    def percentile(values: list, percent: int) -> float:
+        """Nearest-rank percentile of the values"""
+        ordered = sorted(values)
+        return ordered[max(0, -(-len(ordered) * percent // 100) - 1)]
+
+    @staticmethod
+    def add_background_logins(count: int, end_date: datetime):
+        """Insert the background logins with a single INSERT ... SELECT, BACKGROUND_LOGINS_PER_USER for each background user,
+        and update the table statistics, so the planner chooses the query plans of a table of that size
+
+        :param count: number of logins to be inserted
+        :type count: int
+        :param end_date: timestamp of the most recent background login
+        :type end_date: datetime
+        """
+        users = User.objects.bulk_create(
+            [User(username=f"{BACKGROUND_USERNAME_PREFIX}_{i}") for i in range(-(-count // BACKGROUND_LOGINS_PER_USER))],
+        )
+        columns = ", ".join(
+            connection.ops.quote_name(column)
+            for column in [
+                "user_id",
+                "created",
+                "updated",
+                "timestamp",
+                "latitude",
+                "longitude",
+                "country",
+                "user_agent",
+                "device_fingerprint",
+                "index",
+                "event_id",
+                "ip",
+            ]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {connection.ops.quote_name(Login._meta.db_table)} ({columns}) "
+                "SELECT (%s::bigint[])[1 + i / %s], now(), now(), %s - i * interval '1 minute', 45.0, 9.0, 'Country ' || (i %% 50), '', '', "
+                "'cloud', 'background_' || i, '192.0.2.1' FROM generate_series(0, %s - 1) AS i",
+                [[user.id for user in users], BACKGROUND_LOGINS_PER_USER, end_date, count],
+            )
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(Login._meta.db_table)}")
+
+    @staticmethod
+    def clean_benchmark_data():
+        """Delete the benchmark and the background users, together with their logins, IPs and alerts"""
+        User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX).delete()
+        User.objects.filter(username__startswith=BACKGROUND_USERNAME_PREFIX).delete()
+
+    def write_report(self, results: dict):
+        self.stdout.write(
+            f"Users: {results['users']}, logins: {results['logins']} ({results['stored_logins']} stored, {results['table_logins']} in the Login table)"
+        )
+        self.stdout.write(f"Elapsed: {results['elapsed_seconds']}s, throughput: {results['logins_per_second']} logins/s")
+        self.stdout.write(f"DB queries: {results['queries']} ({results['queries_per_login']} per login)")
+        latency = results["user_latency_ms"]
+        self.stdout.write(f"Per-user latency: p50 {latency['p50']}ms, p95 {latency['p95']}ms, max {latency['max']}ms")
+        ua_cache = results["user_agent_cache"]
+        self.stdout.write(f"User-agent cache: {ua_cache['hits']} hits, {ua_cache['misses']} misses")
+        for alert_name, count in sorted(results["alerts"].items()):
+            self.stdout.write(f"Alerts {alert_name}: {count}")
+        self.stdout.write(self.style.SUCCESS("Benchmark completed"))
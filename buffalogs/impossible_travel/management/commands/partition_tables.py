@@ -0,0 +1,32 @@
+from django.core.management.base import CommandParser
+from impossible_travel.management.commands.base_command import TaskLoggingCommand
+from impossible_travel.modules import partitioning
+
+
+class Command(TaskLoggingCommand):
+    help = "Convert the Login and Alert tables into tables partitioned by month (on Login.timestamp and Alert.created), so the retention drops whole partitions"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--model",
+            choices=[model._meta.model_name for model in partitioning.PARTITION_KEYS],
+            help="Partition only the table of this model (optional, all the tables by default)",
+        )
+        parser.add_argument("--months-ahead", type=int, default=None, help="Future months whose partitions are created in advance")
+        return super().add_arguments(parser)
+
+    def handle(self, *args, **options):
+        for model in partitioning.PARTITION_KEYS:
+            if options["model"] and model._meta.model_name != options["model"]:
+                continue
+            if partitioning.is_partitioned(model):
+                self.stdout.write(f"The table {model._meta.db_table} is already partitioned")
+                continue
+            partitioning.partition_table(
+                model,
+                months_ahead=options["months_ahead"],
+                after_batch=(lambda last_id: self.stdout.write(f"Copied the rows up to id {last_id}")) if options["verbosity"] > 1 else None,
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"Partitioned the table {model._meta.db_table} in {len(partitioning.get_partitions(model))} monthly partitions")
+            )
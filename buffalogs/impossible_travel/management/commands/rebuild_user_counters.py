@@ -0,0 +1,20 @@
+from django.core.management.base import CommandError, CommandParser
+from impossible_travel.management.commands.base_command import TaskLoggingCommand
+from impossible_travel.models import User
+
+
+class Command(TaskLoggingCommand):
+    help = "Recompute the users' counters (alerts, risk alerts, logins and last login) from their logins and alerts"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--username", type=str, help="Specify the username to update (optional, all the users by default)")
+        return super().add_arguments(parser)
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["username"]:
+            users = users.filter(username=options["username"])
+            if not users.exists():
+                raise CommandError(f"User '{options['username']}' does not exist.")
+        updated = User.rebuild_counters(users=users)
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt the counters of {updated} users."))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:24
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_user_counters(apps, schema_editor):
+    User = apps.get_model("impossible_travel", "User")
+    Login = apps.get_model("impossible_travel", "Login")
+    Alert = apps.get_model("impossible_travel", "Alert")
+    Config = apps.get_model("impossible_travel", "Config")
+
+    app_config = Config.objects.filter(id=1).first()
+    risk_alerts_types = app_config.risk_score_increment_alerts if app_config else list(settings.CERTEGO_BUFFALOGS_RISK_SCORE_INCREMENT_ALERTS)
+    user_logins = Login.objects.filter(user=OuterRef("pk")).order_by().values("user")
+    user_alerts = Alert.objects.filter(user=OuterRef("pk")).order_by().values("user")
+    User.objects.update(
+        risk_alert_count=Coalesce(Subquery(user_alerts.filter(name__in=risk_alerts_types).annotate(count=Count("id")).values("count")), 0),
+        alert_count=Coalesce(Subquery(user_alerts.annotate(count=Count("id")).values("count")), 0),
+        login_count=Coalesce(Subquery(user_logins.annotate(count=Count("id")).values("count")), 0),
+        last_login=Subquery(user_logins.annotate(last_login=Max("timestamp")).values("last_login")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "impossible_travel",
+            "0022_remove_tasksettings_unique_task_execution_mode_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="alert_count",
+            field=models.PositiveIntegerField(default=0, help_text="Number of alerts of the user"),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="last_login",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Timestamp of the most recent login of the user",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="login_count",
+            field=models.PositiveIntegerField(default=0, help_text="Number of logins of the user"),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="risk_alert_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Number of alerts of the user in the Config.risk_score_increment_alerts list",
+            ),
+        ),
+        migrations.RunPython(populate_user_counters, migrations.RunPython.noop),
+    ]
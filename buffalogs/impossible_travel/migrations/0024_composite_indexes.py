@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:07
+
+import django.db.models.fields.json
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the indexes are built without locking the writes on the tables, which can be large
+    atomic = False
+
+    dependencies = [
+        ("impossible_travel", "0023_user_counters"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="alert",
+            index=models.Index(fields=["created"], name="alert_created"),
+        ),
+        AddIndexConcurrently(
+            model_name="alert",
+            index=models.Index(fields=["user", "name"], name="alert_user_name"),
+        ),
+        AddIndexConcurrently(
+            model_name="alert",
+            index=models.Index(
+                django.db.models.fields.json.KeyTransform("timestamp", "login_raw_data"),
+                name="alert_login_timestamp",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="alert",
+            index=models.Index(
+                django.db.models.fields.json.KeyTransform("ip", "login_raw_data"),
+                name="alert_login_ip",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="login",
+            index=models.Index(
+                fields=["user", "index", "country", "user_agent"],
+                name="login_user_index_country_ua",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="login",
+            index=models.Index(fields=["user", "country"], name="login_user_country"),
+        ),
+        AddIndexConcurrently(
+            model_name="login",
+            index=models.Index(fields=["user", "device_fingerprint"], name="login_user_fingerprint"),
+        ),
+        AddIndexConcurrently(
+            model_name="login",
+            index=models.Index(fields=["user", "timestamp"], name="login_user_timestamp"),
+        ),
+        AddIndexConcurrently(
+            model_name="usersip",
+            index=models.Index(fields=["user", "ip"], name="usersip_user_ip"),
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:11
+
+from ipaddress import ip_address
+
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+BACKFILL_BATCH_SIZE = 5000
+
+# frozen copy of the fields and of the extraction of the models at the time of the migration, so later changes to the models don't change the backfill
+ALERT_LOGIN_FIELDS = ["login_timestamp", "country", "ip", "latitude", "longitude", "user_agent"]
+
+
+def get_alert_login_fields(login_raw_data: dict) -> dict:
+    """Extract the values of the Alert login columns from the login_raw_data, ignoring the missing or invalid ones"""
+    login_raw_data = login_raw_data or {}
+    login_fields = {"login_timestamp": None, "country": login_raw_data.get("country") or "", "ip": None, "latitude": None, "longitude": None}
+    login_fields["user_agent"] = login_raw_data.get("agent") or login_raw_data.get("user_agent") or ""
+    try:
+        login_timestamp = parse_datetime(str(login_raw_data.get("timestamp") or ""))
+        if login_timestamp and timezone.is_naive(login_timestamp):
+            login_timestamp = timezone.make_aware(login_timestamp)
+        login_fields["login_timestamp"] = login_timestamp
+    except ValueError:
+        pass
+    try:
+        login_fields["ip"] = str(ip_address(login_raw_data.get("ip") or ""))
+    except ValueError:
+        pass
+    for field, key in (("latitude", "lat"), ("longitude", "lon")):
+        try:
+            login_fields[field] = float(login_raw_data[key])
+        except (KeyError, TypeError, ValueError):
+            pass
+    return login_fields
+
+
+def populate_alert_login_fields(apps, schema_editor):
+    """Fill the login columns of the existing alerts, in chunks of BACKFILL_BATCH_SIZE alerts committed one by one,
+    so a large table isn't locked for the whole backfill and an interrupted migration restarts from the alerts not filled yet
+    """
+    Alert = apps.get_model("impossible_travel", "Alert")
+    alerts = Alert.objects.filter(login_timestamp__isnull=True, country="", ip__isnull=True).order_by("pk").only("pk", "login_raw_data")
+    last_pk = 0
+    while chunk := list(alerts.filter(pk__gt=last_pk)[:BACKFILL_BATCH_SIZE]):
+        for alert in chunk:
+            for field, value in get_alert_login_fields(alert.login_raw_data).items():
+                setattr(alert, field, value)
+        with transaction.atomic():
+            Alert.objects.bulk_update(chunk, fields=ALERT_LOGIN_FIELDS)
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+    # the alerts are backfilled and indexed without locking the table for the whole migration
+    atomic = False
+
+    dependencies = [
+        ("impossible_travel", "0024_composite_indexes"),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name="alert",
+            name="alert_login_timestamp",
+        ),
+        RemoveIndexConcurrently(
+            model_name="alert",
+            name="alert_login_ip",
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="country",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="ip",
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="login_timestamp",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="user_agent",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(populate_alert_login_fields, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name="alert",
+            index=models.Index(fields=["login_timestamp"], name="alert_login_timestamp"),
+        ),
+        AddIndexConcurrently(
+            model_name="alert",
+            index=models.Index(
+                django.db.models.functions.text.Upper("country"),
+                models.F("login_timestamp"),
+                name="alert_country_timestamp",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="alert",
+            index=models.Index(fields=["ip"], name="alert_ip"),
+        ),
+    ]
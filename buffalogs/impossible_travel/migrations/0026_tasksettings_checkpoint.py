@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0025_alert_login_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasksettings",
+            name="checkpoint",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Progress of the task, in order to resume it if interrupted",
+            ),
+        ),
+    ]
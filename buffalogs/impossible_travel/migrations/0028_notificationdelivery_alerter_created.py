@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0027_notificationdelivery"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notificationdelivery",
+            index=models.Index(fields=["alerter", "created"], name="delivery_alerter_created"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0028_notificationdelivery_alerter_created"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notificationdelivery",
+            name="alerter",
+            field=models.CharField(
+                help_text="Key of the alerter in the Alert.notified_status (e.g. slack, or http_request:<name> for each HTTP recipient)",
+                max_length=255,
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0029_notificationdelivery_alerter_length"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="login",
+            name="login_user_index_country_ua",
+        ),
+        migrations.AddIndex(
+            model_name="login",
+            index=models.Index(fields=["user", "index", "country"], name="login_user_index_country"),
+        ),
+    ]
@@ -1,12 +1,17 @@
+from contextlib import contextmanager
 from datetime import datetime
+from ipaddress import ip_address
 
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Func, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Upper
 from django.utils import timezone
-from impossible_travel.constants import AlertDetectionType, AlertFilterType, AlertTagValues, ExecutionModes, UserRiskScoreType
+from django.utils.dateparse import parse_datetime
+from impossible_travel.constants import AlertDetectionType, AlertFilterType, AlertTagValues, ExecutionModes, NotificationDeliveryStatus, UserRiskScoreType
 from impossible_travel.validators import (
     validate_countries_names,
     validate_country_couples_list,
@@ -26,10 +31,111 @@ class User(models.Model):
     username = models.TextField(unique=True, db_index=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+    # Denormalized counters: kept up-to-date by the detection and by the clean_models_periodically task
+    risk_alert_count = models.PositiveIntegerField(default=0, help_text="Number of alerts of the user in the Config.risk_score_increment_alerts list")
+    alert_count = models.PositiveIntegerField(default=0, help_text="Number of alerts of the user")
+    login_count = models.PositiveIntegerField(default=0, help_text="Number of logins of the user")
+    last_login = models.DateTimeField(null=True, blank=True, help_text="Timestamp of the most recent login of the user")
 
     def __str__(self):
         return f"User object ({self.id}) - {self.username}"
 
+    def increment_counters(self, logins: int = 0, alerts: int = 0, risk_alerts: int = 0, last_login: datetime = None):
+        """Update the denormalized counters of the user atomically in the DB, with F-expressions, and in the object
+
+        :param logins: number of new logins
+        :type logins: int
+        :param alerts: number of new alerts
+        :type alerts: int
+        :param risk_alerts: number of new alerts in the Config.risk_score_increment_alerts list
+        :type risk_alerts: int
+        :param last_login: timestamp of a new or updated login, saved if it's the most recent one
+        :type last_login: datetime
+        """
+        fields = {}
+        if logins:
+            fields["login_count"] = F("login_count") + logins
+            self.login_count += logins
+        if alerts:
+            fields["alert_count"] = F("alert_count") + alerts
+            self.alert_count += alerts
+        if risk_alerts:
+            fields["risk_alert_count"] = F("risk_alert_count") + risk_alerts
+            self.risk_alert_count += risk_alerts
+        if last_login:
+            last_login_value = Value(last_login, output_field=models.DateTimeField())
+            fields["last_login"] = Greatest(Coalesce("last_login", last_login_value), last_login_value)
+            self.last_login = max(self.last_login, last_login) if self.last_login else last_login
+        if fields:
+            User.objects.filter(pk=self.pk).update(**fields)
+
+    @classmethod
+    def rebuild_counters(cls, users: models.QuerySet = None, risk_alerts_types: list = None) -> int:
+        """Recompute the denormalized counters of the users from their logins and alerts, with a single UPDATE query
+
+        :param users: the users to be updated, all the users if not given
+        :type users: QuerySet
+        :param risk_alerts_types: the alerts counted in the risk_alert_count field, the Config.risk_score_increment_alerts if not given
+        :type risk_alerts_types: list
+
+        :return: number of updated users
+        :rtype: int
+        """
+        if risk_alerts_types is None:
+            app_config, _ = Config.objects.get_or_create(id=1)
+            risk_alerts_types = app_config.risk_score_increment_alerts
+        users = cls.objects.all() if users is None else users
+        user_logins = Login.objects.filter(user=OuterRef("pk")).order_by().values("user")
+        user_alerts = Alert.objects.filter(user=OuterRef("pk")).order_by().values("user")
+        return users.update(
+            risk_alert_count=Coalesce(Subquery(user_alerts.filter(name__in=risk_alerts_types).annotate(count=Count("id")).values("count")), 0),
+            alert_count=Coalesce(Subquery(user_alerts.annotate(count=Count("id")).values("count")), 0),
+            login_count=Coalesce(Subquery(user_logins.annotate(count=Count("id")).values("count")), 0),
+            last_login=Subquery(user_logins.annotate(last_login=Max("timestamp")).values("last_login")),
+        )
+
+    @classmethod
+    @contextmanager
+    def track_deleted_rows(cls, rows: models.QuerySet, risk_alerts_types: list = None):
+        """Context manager keeping the denormalized counters consistent with the logins or alerts deleted inside its block (e.g. by the retention),
+        within the same transaction: the counters of the users of the rows are decreased by the number of their deleted rows, before the deletion,
+        and the last_login is computed again only for the users whose most recent login has been deleted.
+        The users are updated in chunks of CERTEGO_BUFFALOGS_RETENTION_BATCH_SIZE users
+
+        :param rows: the logins or alerts to be deleted
+        :type rows: QuerySet
+        :param risk_alerts_types: the alerts counted in the risk_alert_count field, the Config.risk_score_increment_alerts if not given
+        :type risk_alerts_types: list
+        """
+        if rows.model is Alert and risk_alerts_types is None:
+            app_config, _ = Config.objects.get_or_create(id=1)
+            risk_alerts_types = app_config.risk_score_increment_alerts
+        user_ids = list(rows.order_by("user_id").values_list("user_id", flat=True).distinct())
+        batch_size = settings.CERTEGO_BUFFALOGS_RETENTION_BATCH_SIZE
+        user_rows = rows.filter(user=OuterRef("pk")).order_by().values("user")
+
+        def deleted_count(queryset: models.QuerySet):
+            return Coalesce(Subquery(queryset.annotate(count=Count("id")).values("count")), 0)
+
+        last_deleted = None
+        if rows.model is Login:
+            last_deleted = rows.aggregate(last_deleted=Max("timestamp"))["last_deleted"]
+            fields = {"login_count": Greatest(F("login_count") - deleted_count(user_rows), 0)}
+        else:
+            fields = {
+                "alert_count": Greatest(F("alert_count") - deleted_count(user_rows), 0),
+                "risk_alert_count": Greatest(F("risk_alert_count") - deleted_count(user_rows.filter(name__in=risk_alerts_types)), 0),
+            }
+        for i in range(0, len(user_ids), batch_size):
+            cls.objects.filter(pk__in=user_ids[i : i + batch_size]).update(**fields)
+        yield
+        if last_deleted is not None:
+            user_logins = Login.objects.filter(user=OuterRef("pk")).order_by().values("user")
+            for i in range(0, len(user_ids), batch_size):
+                cls.objects.filter(pk__in=user_ids[i : i + batch_size], last_login__lte=last_deleted).update(
+                    last_login=Subquery(user_logins.annotate(last_login=Max("timestamp")).values("last_login"))
+                )
+
     class Meta:
         constraints = [
             models.CheckConstraint(
@@ -97,11 +203,93 @@ class Login(models.Model):
 
         return query
 
+    class Meta:
+        # if the table is partitioned by the partition_tables command, its primary key is (id, timestamp): the new indexes can't be created
+        # concurrently and the unique constraints must include the timestamp (see docs/guides/deployment/management_commands/partition_tables.md)
+        indexes = [
+            # user's logins by index and country, without the user_agent: the unbounded TextField could exceed the maximum size of a btree index row
+            models.Index(fields=["user", "index", "country"], name="login_user_index_country"),
+            models.Index(fields=["user", "country"], name="login_user_country"),
+            models.Index(fields=["user", "device_fingerprint"], name="login_user_fingerprint"),
+            # user's logins in a time range and latest login
+            models.Index(fields=["user", "timestamp"], name="login_user_timestamp"),
+        ]
+
+
+# columns of the Alert with the values of the login_raw_data
+ALERT_LOGIN_FIELDS = ["login_timestamp", "country", "ip", "latitude", "longitude", "user_agent"]
+
+
+def get_alert_login_fields(login_raw_data: dict) -> dict:
+    """Extract the values of the Alert login columns from the login_raw_data, ignoring the missing or invalid ones
+
+    :param login_raw_data: the login that triggered the alert
+    :type login_raw_data: dict
+
+    :return: the values of the login_timestamp, country, ip, latitude, longitude and user_agent fields
+    :rtype: dict
+    """
+    login_raw_data = login_raw_data or {}
+    login_fields = {"login_timestamp": None, "country": login_raw_data.get("country") or "", "ip": None, "latitude": None, "longitude": None}
+    login_fields["user_agent"] = login_raw_data.get("agent") or login_raw_data.get("user_agent") or ""
+    try:
+        login_timestamp = parse_datetime(str(login_raw_data.get("timestamp") or ""))
+        if login_timestamp and timezone.is_naive(login_timestamp):
+            login_timestamp = timezone.make_aware(login_timestamp)
+        login_fields["login_timestamp"] = login_timestamp
+    except ValueError:
+        pass
+    try:
+        login_fields["ip"] = str(ip_address(login_raw_data.get("ip") or ""))
+    except ValueError:
+        pass
+    for field, key in (("latitude", "lat"), ("longitude", "lon")):
+        try:
+            login_fields[field] = float(login_raw_data[key])
+        except (KeyError, TypeError, ValueError):
+            pass
+    return login_fields
+
+
+class AlertQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create() doesn't call Alert.save(), which fills the login columns
+        objs = list(objs)
+        for alert in objs:
+            alert.set_login_fields()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def mark_notified(self, alerter: str) -> int:
+        """Set the notified status of the alerter to True with a single UPDATE, merging the key into the notified_status JSON in the DB,
+        so the other columns (e.g. the login_raw_data) aren't written again and the statuses set by the other alerters are preserved
+
+        :param alerter: key of the alerter in the notified_status (e.g. "slack")
+        :type alerter: str
+
+        :return: the number of updated alerts
+        :rtype: int
+        """
+        notified_status = Func(
+            F("notified_status"),
+            Value({alerter: True}, output_field=models.JSONField()),
+            template="(%(expressions)s)",
+            arg_joiner=" || ",
+            output_field=models.JSONField(),
+        )
+        return self.update(notified_status=notified_status, updated=timezone.now())
+
 
 class Alert(models.Model):
     name = models.CharField(choices=AlertDetectionType.choices, max_length=30, null=False, blank=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     login_raw_data = models.JSONField()
+    # login fields copied from the login_raw_data, in order to filter and aggregate the alerts on indexed columns
+    login_timestamp = models.DateTimeField(null=True, blank=True)
+    country = models.TextField(blank=True, default="")
+    ip = models.GenericIPAddressField(null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    user_agent = models.TextField(blank=True, default="")
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     description = models.TextField()
@@ -122,6 +310,19 @@ class Alert(models.Model):
 
     notified_status = models.JSONField(default=dict, blank=True, help_text="Tracks each active_alerter status")
 
+    objects = AlertQuerySet.as_manager()
+
+    def set_login_fields(self):
+        """Copy the login fields from the login_raw_data to the login columns"""
+        for field, value in get_alert_login_fields(self.login_raw_data).items():
+            setattr(self, field, value)
+
+    def save(self, *args, **kwargs):
+        self.set_login_fields()
+        if kwargs.get("update_fields") is not None and "login_raw_data" in kwargs["update_fields"]:
+            kwargs["update_fields"] = {*kwargs["update_fields"], *ALERT_LOGIN_FIELDS}
+        super().save(*args, **kwargs)
+
     @property
     def is_filtered(self):
         """Returns if the alert is filtered based on the filter_type field"""
@@ -172,15 +373,15 @@ class Alert(models.Model):
         if notified is True:
             query = query.exclude(notified_status={})
         if ip:
-            query = query.filter(login_raw_data__ip=ip)
+            query = query.filter(ip=ip)
         if user_agent:
-            query = query.filter(login_raw_data__user_agent__icontains=user_agent)
+            query = query.filter(user_agent__icontains=user_agent)
         if login_start_time:
-            query = query.filter(login_raw_data__timestamp__gte=login_start_time)
+            query = query.filter(login_timestamp__gte=login_start_time)
         if login_end_time:
-            query = query.filter(login_raw_data__timestamp__lte=login_end_time)
+            query = query.filter(login_timestamp__lte=login_end_time)
         if country_code:
-            query = query.filter(login_raw_data__country__iexact=country_code)
+            query = query.filter(country__iexact=country_code)
         if risk_score:
             if isinstance(risk_score, int):
                 query = query.filter(user__risk_score=UserRiskScoreType.get_risk_level(risk_score))
@@ -200,6 +401,18 @@ class Alert(models.Model):
         return query
 
     class Meta:
+        # if the table is partitioned by the partition_tables command, its primary key is (id, created): the new indexes can't be created
+        # concurrently and the unique constraints must include the created field (see docs/guides/deployment/management_commands/partition_tables.md)
+        indexes = [
+            # alerts to be notified and API filters
+            models.Index(fields=["created"], name="alert_created"),
+            # count of the user's alerts in the Config.risk_score_increment_alerts list
+            models.Index(fields=["user", "name"], name="alert_user_name"),
+            # charts and API filters on the login fields
+            models.Index(fields=["login_timestamp"], name="alert_login_timestamp"),
+            models.Index(Upper("country"), "login_timestamp", name="alert_country_timestamp"),
+            models.Index(fields=["ip"], name="alert_ip"),
+        ]
         constraints = [
             models.CheckConstraint(
                 # Check that the Alert.name is one of the value in the Enum AlertDetectionType
@@ -214,12 +427,40 @@ class Alert(models.Model):
         ]
 
 
+class NotificationDelivery(models.Model):
+    """Outbox of the alerts notifications: a row for each alert to be sent by each alerter, claimed by the alerters with SELECT ... FOR UPDATE SKIP LOCKED"""
+
+    # without a DB constraint, because the primary key of the Alert table isn't unique on the id alone once it's partitioned
+    alert = models.ForeignKey(Alert, on_delete=models.CASCADE, db_constraint=False)
+    alerter = models.CharField(
+        max_length=255, help_text="Key of the alerter in the Alert.notified_status (e.g. slack, or http_request:<name> for each HTTP recipient)"
+    )
+    status = models.CharField(max_length=10, choices=NotificationDeliveryStatus.choices, default=NotificationDeliveryStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["alert", "alerter"], name="unique_alert_alerter")]
+        indexes = [
+            # deliveries to be claimed by each alerter, the index contains only the pending ones
+            models.Index(fields=["alerter", "next_attempt_at"], name="delivery_pending", condition=models.Q(status=NotificationDeliveryStatus.PENDING)),
+            # watermark of the alerts added to the outbox by each alerter
+            models.Index(fields=["alerter", "created"], name="delivery_alerter_created"),
+        ]
+
+
 class UsersIP(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     ip = models.GenericIPAddressField()
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "ip"], name="usersip_user_ip")]
+
 
 class TaskSettings(models.Model):
     task_name = models.TextField()
@@ -228,6 +469,7 @@ class TaskSettings(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     execution_mode = models.CharField(max_length=20, choices=ExecutionModes.choices, default="automatic")
+    checkpoint = models.JSONField(default=dict, blank=True, help_text="Progress of the task, in order to resume it if interrupted")
 
     class Meta:
         constraints = [models.UniqueConstraint(fields=["task_name", "execution_mode"], name="unique_task_execution")]
@@ -412,7 +654,14 @@ class Config(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
+        adding = self._state.adding
+        previous_risk_alerts = None if adding else Config.objects.filter(pk=self.pk).values_list("risk_score_increment_alerts", flat=True).first()
         super().save(*args, **kwargs)
+        if previous_risk_alerts is not None and sorted(previous_risk_alerts) != sorted(self.risk_score_increment_alerts or []):
+            # the User.risk_alert_count counters depend on the risk_score_increment_alerts list: they are rebuilt by a task, after the commit
+            from impossible_travel.tasks import rebuild_user_counters
+
+            transaction.on_commit(rebuild_user_counters.delay)
 
     class Meta:
         constraints = [
@@ -1,66 +1,217 @@
 import logging
 import re
-from collections import Counter
+from bisect import bisect_right
 from datetime import datetime, timedelta, timezone
+from ipaddress import ip_address, ip_network
 
-from django.conf import settings
 from impossible_travel.constants import AlertDetectionType, AlertFilterType, ComparisonType, UserRiskScoreType
 from impossible_travel.models import Alert, Config, User
-from ua_parser import parse
+from impossible_travel.utils.utils import parse_user_agent
 
 logger = logging.getLogger(__name__)
 
+# fields of the Config compiled by the CompiledFilterSet
+FILTER_FIELDS = (
+    "ignored_users",
+    "enabled_users",
+    "vip_users",
+    "ignored_ips",
+    "allowed_countries",
+    "ignored_ISPs",
+    "filtered_alerts_types",
+    "ignored_impossible_travel_countries_couples",
+)
+# compiled filters of each Config, with the hash of the filter fields they have been built from: {config_id: (fields_hash, CompiledFilterSet)}
+_compiled_filter_sets = {}
+
+
+class CompiledFilterSet:
+    """
+    Filters of the Config, compiled once in order to check each alert in a time that doesn't depend on the number of configured values:
+
+    * the users lists (ignored_users, enabled_users) in a set of exact usernames and a single alternation regex of all the patterns without groups
+    * the ignored_ips in a set of exact values and, for each IP version, the sorted and merged intervals of the networks
+    * the other lists (vip_users, allowed_countries, ignored_ISPs, filtered_alerts_types and the impossible travel countries couples) in frozensets
+    """
+
+    def __init__(self, app_config: Config):
+        self.ignored_users = self._compile_users(app_config.ignored_users)
+        self.enabled_users = self._compile_users(app_config.enabled_users)
+        self.vip_users = frozenset(app_config.vip_users or [])
+        self.ignored_ips, self.ignored_networks = self._compile_ips(app_config.ignored_ips)
+        self.allowed_countries = frozenset(app_config.allowed_countries or [])
+        self.ignored_ISPs = frozenset(app_config.ignored_ISPs or [])
+        self.filtered_alerts_types = frozenset(app_config.filtered_alerts_types or [])
+        # the couples are sorted, so the order of the countries is ignored: ["Italy", "Germany"] == ["Germany", "Italy"]
+        self.ignored_countries_couples = frozenset(tuple(sorted(couple)) for couple in app_config.ignored_impossible_travel_countries_couples or [])
+
+    @staticmethod
+    def _compile_users(values_list: list) -> tuple:
+        """Compile a list of usernames and regex patterns into the set of the exact values and the list of the regexes to be searched
+
+        :param values_list: list of usernames or regex patterns
+        :type values_list: list
+
+        :return: the exact values and the compiled regexes (a single alternation regex for the patterns that can be combined)
+        :rtype: tuple(frozenset, list)
+        """
+        values_list = values_list or []
+        patterns = []
+        for item in values_list:
+            try:
+                patterns.append(re.compile(item))
+            except re.error:
+                logger.warning(f"The value {item} is not a valid regex, so it's checked only as exact username")
+        # the groups would be renumbered in the alternation, breaking the backreferences (e.g. "(a)\1"), so these patterns are kept separate
+        grouped_patterns = [pattern for pattern in patterns if pattern.groups]
+        plain_patterns = [pattern for pattern in patterns if not pattern.groups]
+        if len(plain_patterns) < 2:
+            return frozenset(values_list), plain_patterns + grouped_patterns
+        try:
+            return frozenset(values_list), [re.compile("|".join(f"(?:{pattern.pattern})" for pattern in plain_patterns))] + grouped_patterns
+        except re.error:
+            # e.g. patterns with global inline flags, which must be at the start of the regex
+            return frozenset(values_list), patterns
+
+    @staticmethod
+    def _compile_ips(values_list: list) -> tuple:
+        """Compile a list of IPs and networks into the set of the exact values and the sorted intervals of the networks, for each IP version
+
+        :param values_list: list of IPs or networks (CIDR notation)
+        :type values_list: list
+
+        :return: the exact values and, for each IP version, the (starts, ends) lists of the disjoint intervals, sorted by start
+        :rtype: tuple(frozenset, dict)
+        """
+        exact_values = set()
+        intervals = {4: [], 6: []}
+        for item in values_list or []:
+            exact_values.add(item)
+            try:
+                network = ip_network(item, strict=False)
+            except ValueError:
+                continue
+            intervals[network.version].append((int(network.network_address), int(network.broadcast_address)))
+        networks = {}
+        for version, version_intervals in intervals.items():
+            merged = []
+            for start, end in sorted(version_intervals):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            networks[version] = ([start for start, _ in merged], [end for _, end in merged])
+        return frozenset(exact_values), networks
+
+    @staticmethod
+    def _match_users(word: str, compiled_users: tuple) -> bool:
+        """Check if a string value is one of the exact values or matches one of the regexes"""
+        exact_values, regexes = compiled_users
+        return word in exact_values or any(regex.search(word) for regex in regexes)
+
+    def is_ignored_user(self, username: str) -> bool:
+        return self._match_users(username, self.ignored_users)
+
+    def is_enabled_user(self, username: str) -> bool:
+        return self._match_users(username, self.enabled_users)
+
+    def has_enabled_users(self) -> bool:
+        return bool(self.enabled_users[0])
+
+    def is_ignored_ip(self, ip: str) -> bool:
+        """Check if the IP is one of the ignored_ips or is inside one of the ignored networks, with a binary search on the intervals"""
+        if ip in self.ignored_ips:
+            return True
+        try:
+            address = ip_address(ip)
+        except ValueError:
+            return False
+        starts, ends = self.ignored_networks[address.version]
+        position = bisect_right(starts, int(address)) - 1
+        return position >= 0 and int(address) <= ends[position]
+
+    def is_ignored_countries_couple(self, country: str, other_country: str) -> bool:
+        return tuple(sorted([country, other_country])) in self.ignored_countries_couples
+
+
+def get_filter_set(app_config: Config) -> CompiledFilterSet:
+    """Return the compiled filters of the Config, built again only when its filter fields have changed (even if not saved yet)
 
-def match_filters(alert: Alert, app_config: Config) -> Alert:
+    :param app_config: the configuration object
+    :type app_config: Config
+
+    :return: the compiled filters
+    :rtype: CompiledFilterSet
+    """
+    if isinstance(getattr(app_config, "filter_set", None), CompiledFilterSet):
+        # Config snapshot, with the filters already compiled
+        return app_config.filter_set
+    fields_hash = hash(repr([getattr(app_config, field) for field in FILTER_FIELDS]))
+    cached = _compiled_filter_sets.get(app_config.pk)
+    if cached is None or cached[0] != fields_hash:
+        cached = (fields_hash, CompiledFilterSet(app_config))
+        _compiled_filter_sets[app_config.pk] = cached
+    return cached[1]
+
+
+def match_filters(alert: Alert, app_config: Config, save: bool = True) -> Alert:
+    """Check the Config filters for the alert, adding the matching ones to its filter_type field
+
+    :param alert: the alert to be checked
+    :type alert: Alert
+    :param app_config: buffalogs config object
+    :type app_config: Config
+    :param save: if the alert has to be saved (the alerts buffered by the detection are inserted in bulk later)
+    :type save: bool
+    """
     db_user = alert.user
+    filter_set = get_filter_set(app_config)
 
     # Detection filters - users
-    alert = _update_users_filters(db_alert=alert, app_config=app_config, db_user=db_user)
+    alert = _update_users_filters(db_alert=alert, app_config=app_config, db_user=db_user, filter_set=filter_set)
 
     # Detection filters - location
-    if alert.login_raw_data.get("ip", "") in app_config.ignored_ips:
+    if filter_set.is_ignored_ip(alert.login_raw_data.get("ip", "")):
         logger.debug(
             f"Alert: {alert.id} filtered for user: {db_user.username} because the login IP: {alert.login_raw_data['ip']} is in the ignored_ips Config list"
         )
         alert.filter_type.append(AlertFilterType.IGNORED_IP_FILTER)  # alert filtered because the ip is in the ignored_ips list
-    if alert.login_raw_data.get("country", "") in app_config.allowed_countries:
+    if alert.login_raw_data.get("country", "") in filter_set.allowed_countries:
         logger.debug(
             f"Alert: {alert.id} filtered for user: {db_user.username} because the login IP: {alert.login_raw_data['country']} is in the allower_countries Config list"
         )
         alert.filter_type.append(AlertFilterType.ALLOWED_COUNTRY_FILTER)  # alert filtered because the country is in the allowed_countries list
 
     # Detection filters - devices
-    if alert.login_raw_data.get("organization", "") in app_config.ignored_ISPs:
+    if alert.login_raw_data.get("organization", "") in filter_set.ignored_ISPs:
         logger.debug(
             f"Alert: {alert.id} filtered for user: {db_user.username} because the login ISP: {alert.login_raw_data['organization']} is in the ignored_ISPs Config list"
         )
         alert.filter_type.append(AlertFilterType.IGNORED_ISP_FILTER)
     if app_config.ignore_mobile_logins and alert.login_raw_data.get("agent", ""):
-        ua_parsed = parse(alert.login_raw_data["agent"])
-        if ua_parsed.os and ua_parsed.os.family in settings.CERTEGO_BUFFALOGS_MOBILE_DEVICES:
+        # the user-agent parsing is cached and shared with the device fingerprint of the detection
+        if parse_user_agent(alert.login_raw_data["agent"]).is_mobile:
             logger.debug(
                 f"Alert: {alert.id} filtered for user: {db_user.username} because the login user-agent: {alert.login_raw_data['agent']} is a mobile device and Config.ignore_mobile_logins: {app_config.ignore_mobile_logins}"
             )
             alert.filter_type.append(AlertFilterType.IS_MOBILE_FILTER)
 
     # Detection filters - alerts
-    if alert.name in app_config.filtered_alerts_types:
+    if alert.name in filter_set.filtered_alerts_types:
         alert.filter_type.append(AlertFilterType.FILTERED_ALERTS)
 
     if alert.name == AlertDetectionType.IMP_TRAVEL:
         # check ignored_impossible_travel_countries_couples and ignored_impossible_travel_all_same_country config filters
         if app_config.ignored_impossible_travel_all_same_country and alert.login_raw_data["country"] == alert.login_raw_data["buffalogs"]["start_country"]:
             alert.filter_type.append(AlertFilterType.IGNORED_IMP_TRAVEL_ALL_SAME_COUNTRY)
-        couple_country = [alert.login_raw_data["country"], alert.login_raw_data["buffalogs"]["start_country"]]
-        # using Counter to ignore the order: ["Italy", "Germany"] == ["Germany", "Italy"] and check only if the coutry couple is present in the ignored couples
-        for ignored_country_couple in app_config.ignored_impossible_travel_countries_couples:
-            if Counter(ignored_country_couple) == Counter(couple_country):
-                alert.filter_type.append(AlertFilterType.IGNORED_IMP_TRAVEL_COUNTRIES_COUPLE)
+        if filter_set.is_ignored_countries_couple(alert.login_raw_data["country"], alert.login_raw_data["buffalogs"]["start_country"]):
+            alert.filter_type.append(AlertFilterType.IGNORED_IMP_TRAVEL_COUNTRIES_COUPLE)
 
-    alert.save()
+    if save:
+        alert.save()
 
 
-def _update_users_filters(db_alert: Alert, app_config: Config, db_user: User) -> Alert:
+def _update_users_filters(db_alert: Alert, app_config: Config, db_user: User, filter_set: CompiledFilterSet = None) -> Alert:
     """Check all the filters relative to users (enabled_users, ignored_users, vip_users).
     Rules of alert filtering, in the check order:
     1. if Config.alert_is_vip_only == True
@@ -73,19 +224,20 @@ def _update_users_filters(db_alert: Alert, app_config: Config, db_user: User) ->
     5. if now-user.created < Config.user_learning_period --> USER_LEARNING_PERIOD
     """
     now = datetime.now(timezone.utc)
+    filter_set = filter_set or get_filter_set(app_config)
 
     if app_config.alert_is_vip_only:
         # 1. if the flag Config.is_vip_only is True, check only if the user is in the config.vip_users list
-        if db_user.username not in app_config.vip_users:
+        if db_user.username not in filter_set.vip_users:
             logger.debug(f"Alert: {db_alert.id} filtered because user: {db_user.username} not in vip_users and enabled_users Config lists")
             db_alert.filter_type.append(AlertFilterType.IS_VIP_FILTER)  # alert filtered because alert_is_vip_only=True but username not in vip_users list
     else:
-        if app_config.enabled_users and not _check_username_list_regex(word=db_user.username, values_list=app_config.enabled_users):
+        if filter_set.has_enabled_users() and not filter_set.is_enabled_user(db_user.username):
             # 2. alert filtered because the user is not in the enabled_users list
             logger.debug(f"Alert: {db_alert.id} filtered because user: {db_user.username} not in the enabled_users Config list")
             db_alert.filter_type.append(AlertFilterType.IGNORED_USER_FILTER)
         else:
-            if _check_username_list_regex(word=db_user.username, values_list=app_config.ignored_users):
+            if filter_set.is_ignored_user(db_user.username):
                 # 3. if the user is in the Config.ignored_users list, the user is immediately ignored
                 logger.debug(f"Alert: {db_alert.id} filtered because user: {db_user.username} is in the ignored_users Config list")
                 db_alert.filter_type.append(AlertFilterType.IGNORED_USER_FILTER)
@@ -101,17 +253,3 @@ def _update_users_filters(db_alert: Alert, app_config: Config, db_user: User) ->
         logger.debug(f"Alert: {db_alert.id} filtered because user: {db_user.username} is still into the learning period")
         db_alert.filter_type.append(AlertFilterType.USER_LEARNING_PERIOD)
     return db_alert
-
-
-def _check_username_list_regex(word: str, values_list: list) -> bool:
-    """Function to check if a string value is inside a list of string or match a regex in the list"""
-    for item in values_list:
-        if word == item:
-            # check if the word is exacly a value in the list
-            return True
-        else:
-            # else, check if the item in the list is a regex that matches the word
-            regexp = re.compile(item)
-            if regexp.search(word):
-                return True
-    return False
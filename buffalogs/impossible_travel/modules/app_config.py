@@ -0,0 +1,78 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from impossible_travel.models import Config
+from impossible_travel.modules.alert_filter import CompiledFilterSet
+
+# reentrant, because the Config created by get_app_config() triggers the invalidation receiver
+_lock = threading.RLock()
+# process-level cache: the last Config snapshot and the monotonic time of its last freshness check
+_snapshot = None
+_checked_at = 0.0
+
+
+class ConfigSnapshot:
+    """
+    Immutable and preprocessed copy of the Config, shared by all the detections of the worker process:
+
+    * the fields have the same names of the Config ones, so the snapshot can be used in place of the Config object
+    * the lists are converted to frozensets (the impossible travel countries couples to a tuple of tuples)
+    * filter_set: the CompiledFilterSet of the Config, with the users regexes and the IPs networks already compiled
+    """
+
+    def __init__(self, app_config: Config):
+        for field in Config._meta.concrete_fields:
+            value = getattr(app_config, field.attname)
+            if field.attname == "ignored_impossible_travel_countries_couples":
+                value = tuple(tuple(couple) for couple in value or [])
+            elif isinstance(value, list):
+                value = frozenset(value)
+            object.__setattr__(self, field.attname, value)
+        object.__setattr__(self, "pk", app_config.pk)
+        object.__setattr__(self, "filter_set", CompiledFilterSet(self))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("The Config snapshot is read-only, modify and save the Config object instead")
+
+    def __delattr__(self, name):
+        raise AttributeError("The Config snapshot is read-only, modify and save the Config object instead")
+
+    def __repr__(self):
+        return f"<ConfigSnapshot id={self.pk} updated={self.updated}>"
+
+
+def get_app_config() -> ConfigSnapshot:
+    """Return the snapshot of the Config, cached by the process.
+    The Config.updated field is checked at most every CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS,
+    and the snapshot is built again only if it has changed (or immediately, if the Config has been saved by this process)
+
+    :return: the current Config snapshot
+    :rtype: ConfigSnapshot
+    """
+    global _snapshot, _checked_at
+    with _lock:
+        now = time.monotonic()
+        if _snapshot is not None and now - _checked_at < settings.CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS:
+            return _snapshot
+        updated = Config.objects.filter(id=1).values_list("updated", flat=True).first()
+        if _snapshot is None or updated is None or updated != _snapshot.updated:
+            app_config, _ = Config.objects.get_or_create(id=1)
+            _snapshot = ConfigSnapshot(app_config)
+        _checked_at = now
+        return _snapshot
+
+
+def invalidate_app_config():
+    """Discard the cached Config snapshot, so it's read again from the DB at the next get_app_config() call"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+@receiver(post_save, sender=Config)
+@receiver(post_delete, sender=Config)
+def config_changed(sender, **kwargs):
+    invalidate_app_config()
@@ -1,156 +1,251 @@
 from datetime import datetime
+from itertools import islice
+from typing import Iterable
 
 from celery.utils.log import get_task_logger
-from django.db import DatabaseError, IntegrityError, transaction
-from django.utils import timezone
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, transaction
 from geopy.distance import geodesic
 from impossible_travel.constants import AlertDetectionType, ComparisonType, UserRiskScoreType
-from impossible_travel.models import Alert, Config, Login, User, UsersIP
+from impossible_travel.models import Alert, Config, Login, User
 from impossible_travel.modules import alert_filter
+from impossible_travel.modules.app_config import get_app_config
+from impossible_travel.modules.detection_context import DetectionContext, parse_login_timestamp
+from impossible_travel.modules.geo_distance import exceeds_distance, haversine_km
 from impossible_travel.utils.utils import build_device_fingerprint
 
 logger = get_task_logger(__name__)
 
 
-def update_risk_level(db_user: User, triggered_alert: Alert, app_config: Config) -> bool:
-    """Update user risk level depending on how many alerts were triggered and the Config.risk_score_increment_alerts
+def set_alert(db_user: User, login_alert: dict, alert_info: dict, app_config: Config, context: DetectionContext) -> Alert:
+    """Add the alert to the user's detection context and logs it: the alert is filtered by flush_alerts and inserted at the context flush
+
+    :param db_user: user from db
+    :type db_user: object
+    :param login_alert: dictionary login from elastic
+    :type login_alert: dict
+    :param alert_info: dictionary with alert info
+    :type alert_info: dict
+    :param app_config: buffalogs config object
+    :type app_config: Config
+    :param context: user's detection context
+    :type context: DetectionContext
+
+    :return: new buffalogs alert object
+    :rtype: Alert obj
+    """
+    logger.info(f"ALERT {alert_info['alert_name']} for User: {db_user.username} at: {login_alert['timestamp']}")
+    # copy of the login, because the same login dict can be enriched later by the detection (e.g. with the impossible travel info)
+    alert = Alert(user=db_user, login_raw_data=dict(login_alert), name=alert_info["alert_name"], description=alert_info["alert_desc"])
+    context.add_alert(alert)
+    return alert
+
+
+def flush_alerts(db_user: User, app_config: Config, context: DetectionContext):
+    """Filter the alerts buffered in the context and update the user's risk_score incrementally, in memory:
+    the alerts are inserted in bulk by the context flush and the risk_score is saved once, by update_user_risk, at the end of the detection.
+    The risk_score counts all the alerts in the Config.risk_score_increment_alerts list (User.risk_alert_count),
+    and it's updated only when a not filtered alert is triggered
 
     :param db_user: user from DB
     :type db_user: User object
-    :param triggered_alert: alert that has just been triggered
-    :type alert: Alert object
     :param app_config: buffalogs config object
-    :type app_config: Config object
+    :type app_config: Config
+    :param context: user's detection context
+    :type context: DetectionContext
+    """
+    for alert in context.new_alerts:
+        # the filters are checked with the risk_score updated by the previous alerts
+        alert_filter.match_filters(alert=alert, app_config=app_config, save=False)
+        if alert.name in app_config.risk_score_increment_alerts:
+            context.new_risk_alerts += 1
+        if not alert.is_filtered:
+            # the User.risk_alert_count counter, instead of counting the user's alerts
+            new_risk_level = UserRiskScoreType.get_risk_level(db_user.risk_alert_count + context.new_risk_alerts)
+            if UserRiskScoreType.compare_risk(db_user.risk_score, new_risk_level) == ComparisonType.HIGHER:
+                context.risk_alert = alert
+            db_user.risk_score = new_risk_level
+            context.risk_updated = True
+
+
+def update_user_risk(db_user: User, app_config: Config, context: DetectionContext) -> bool:
+    """Save the user's risk_score computed during the detection and, if it has been increased up to the Config.threshold_user_risk_alert,
+    trigger a single USER_RISK_THRESHOLD alert, even if more risk levels have been crossed in the same detection
 
-    :return: False if user.risk_score doesn't increased, True otherwise
+    :param db_user: user from DB
+    :type db_user: User object
+    :param app_config: buffalogs config object
+    :type app_config: Config
+    :param context: user's detection context
+    :type context: DetectionContext
+
+    :return: True if the USER_RISK_THRESHOLD alert has been triggered, False otherwise
     :rtype: bool
     """
+    if not context.risk_updated:
+        return False
     with transaction.atomic():
-        current_risk_score = db_user.risk_score
-        # for the risk_score consider the number of alerts that are not in the Config.risk_score_increment_alerts list
-        new_risk_level = UserRiskScoreType.get_risk_level(db_user.alert_set.filter(name__in=app_config.risk_score_increment_alerts).count())
-
         # update the risk_score anyway in order to keep the users up-to-date each time they are seen by the system
-        db_user.risk_score = new_risk_level
-        db_user.save()
-
-        risk_comparison = UserRiskScoreType.compare_risk(current_risk_score, new_risk_level)
+        # (only the risk_score, because the counters are updated by the context with F-expressions)
+        db_user.save(update_fields=["risk_score", "updated"])
+        initial_risk_score, new_risk_level = context.initial_risk_score, db_user.risk_score
+        context.initial_risk_score, context.risk_updated = new_risk_level, False
+        risk_comparison = UserRiskScoreType.compare_risk(initial_risk_score, new_risk_level)
         if risk_comparison in [ComparisonType.LOWER, ComparisonType.EQUAL]:
             logger.info(
-                f"The current user.risk_score ({current_risk_score}) is {risk_comparison.value} than the new risk_score: {new_risk_level}. The Config.risk_score_increment_alerts list contains: {app_config.risk_score_increment_alerts}"
+                f"The current user.risk_score ({initial_risk_score}) is {risk_comparison.value} than the new risk_score: {new_risk_level}. The Config.risk_score_increment_alerts list contains: {app_config.risk_score_increment_alerts}"
             )
-            return False  # risk_score doesn't increased, so no USER_RISK_THRESHOLD alert
-
-        # if the new_risk_level is higher than the current one
-        # and the new_risk_level is higher or equal than the threshold set in the config.threshold_user_risk_alert
-        # send the USER_RISK_THRESHOLD alert
-        config_threshold_comparison = UserRiskScoreType.compare_risk(app_config.threshold_user_risk_alert, new_risk_level)
-
-        if config_threshold_comparison in [ComparisonType.EQUAL, ComparisonType.HIGHER]:
-            alert_info = {
-                "alert_name": AlertDetectionType.USER_RISK_THRESHOLD.value,
-                "alert_desc": f"{AlertDetectionType.USER_RISK_THRESHOLD.label} for User: {db_user.username}, "
-                f"who changed risk_score from {current_risk_score} to {new_risk_level}",
-            }
-            logger.info(
-                f"Upgraded risk level for User: {db_user.username} to level: {new_risk_level}, detected {db_user.alert_set.count()} alerts. The Config.risk_score_increment_alerts list contains: {app_config.risk_score_increment_alerts}"
-            )
-            set_alert(db_user=db_user, login_alert=triggered_alert.login_raw_data, alert_info=alert_info, app_config=app_config)
+            return False
+        if UserRiskScoreType.compare_risk(app_config.threshold_user_risk_alert, new_risk_level) not in [ComparisonType.EQUAL, ComparisonType.HIGHER]:
+            return False
+        alert_info = {
+            "alert_name": AlertDetectionType.USER_RISK_THRESHOLD.value,
+            "alert_desc": f"{AlertDetectionType.USER_RISK_THRESHOLD.label} for User: {db_user.username}, "
+            f"who changed risk_score from {initial_risk_score} to {new_risk_level}",
+        }
+        logger.info(
+            f"Upgraded risk level for User: {db_user.username} to level: {new_risk_level}, detected {db_user.risk_alert_count + context.new_risk_alerts} risk alerts. The Config.risk_score_increment_alerts list contains: {app_config.risk_score_increment_alerts}"
+        )
+        set_alert(db_user=db_user, login_alert=context.risk_alert.login_raw_data, alert_info=alert_info, app_config=app_config, context=context)
+        flush_alerts(db_user, app_config, context)
+        context.flush()
+        if db_user.risk_score != new_risk_level:
+            # the USER_RISK_THRESHOLD alert itself is counted for the risk_score
+            db_user.save(update_fields=["risk_score", "updated"])
+        context.initial_risk_score, context.risk_updated = db_user.risk_score, False
+        return True
 
-            return True
 
+def check_fields(db_user: User, fields: Iterable[dict]):
+    """Check different types of alerts based on login fields.
+    The logins are consumed one by one, so they can be streamed directly from the ingestion source,
+    and they are processed in chunks of CERTEGO_BUFFALOGS_DETECTION_BATCH_SIZE logins: the new and updated rows of each chunk
+    are written in bulk, within a single transaction. A chunk that fails is rolled back and detected again login by login,
+    each one in its own transaction, so only the logins that fail are dropped, and logged one by one.
+    The DB connection errors and the errors of the ingestion source, raised while the logins are read, are propagated instead,
+    so the time window is detected again.
+    The alerts are filtered and inserted in bulk as well, while the user's risk_score is saved once, at the end of the detection.
 
-def set_alert(db_user: User, login_alert: dict, alert_info: dict, app_config: Config) -> Alert:
-    """Save the alert on db and logs it
+    :param db_user: user from DB
+    :type db_user: User object
+    :param fields: login data of the user, sorted from the oldest to the most recent one
+    :type fields: Iterable[dict]
+    """
 
-    :param db_user: user from db
-    :type db_user: object
-    :param login_alert: dictionary login from elastic
-    :type login_alert: dict
-    :param alert_info: dictionary with alert info
-    :type alert_info: dict
+    db_config = get_app_config()
+    # user's logins and IPs loaded once, then kept up-to-date while the logins are processed
+    context = DetectionContext(db_user)
+
+    logins = iter(fields)
+    while chunk := list(islice(logins, settings.CERTEGO_BUFFALOGS_DETECTION_BATCH_SIZE)):
+        risk_state = context.get_risk_state()
+        try:
+            check_chunk(db_user, chunk, db_config, context)
+        except (InterfaceError, OperationalError):
+            raise
+        except Exception as e:
+            logger.warning(f"Detection failed for User: {db_user.username}, detecting again one by one the {len(chunk)} logins of the chunk: {e}")
+            context.reset(risk_state)
+            for login in chunk:
+                risk_state = context.get_risk_state()
+                try:
+                    check_chunk(db_user, [login], db_config, context)
+                except (InterfaceError, OperationalError):
+                    raise
+                except Exception as e:
+                    logger.exception(f"Detection failed for User: {db_user.username}, dropped the login {login.get('id')} at {login.get('timestamp')}: {e}")
+                    context.reset(risk_state)
+    update_user_risk(db_user, db_config, context)
+
+
+def check_chunk(db_user: User, logins: list, app_config: Config, context: DetectionContext):
+    """Check the alerts for a chunk of logins of the user and write the changes to the DB, within a single transaction
 
-    :return: new buffalogs alert object
-    :rtype: Alert obj
+    :param db_user: user from DB
+    :type db_user: User object
+    :param logins: login data of the chunk
+    :type logins: list
+    :param app_config: buffalogs config object
+    :type app_config: Config
+    :param context: user's detection context
+    :type context: DetectionContext
     """
-    logger.info(f"ALERT {alert_info['alert_name']} for User: {db_user.username} at: {login_alert['timestamp']}")
-    alert = Alert.objects.create(user=db_user, login_raw_data=login_alert, name=alert_info["alert_name"], description=alert_info["alert_desc"])
-    alert.save()
-    # check filters
-    alert_filter.match_filters(alert=alert, app_config=app_config)
-    # update user.risk_score if necessary (not for filtered alerts)
-    if not alert.is_filtered:
-        update_risk_level(db_user=alert.user, triggered_alert=alert, app_config=app_config)
-    return alert
+    with transaction.atomic():
+        for login in logins:
+            check_login(db_user, login, app_config, context)
+        flush_alerts(db_user, app_config, context)
+        context.flush()
 
 
-def check_fields(db_user: User, fields: list):
-    """Check different types of alerts based on login fields.
+def check_login(db_user: User, login: dict, app_config: Config, context: DetectionContext):
+    """Check the alerts for a single login of the user and track its changes in the detection context
 
     :param db_user: user from DB
     :type db_user: User object
-    :param fields: list of login data of the user
-    :type fields: list
+    :param login: login data
+    :type login: dict
+    :param app_config: buffalogs config object
+    :type app_config: Config
+    :param context: user's detection context
+    :type context: DetectionContext
     """
-
-    db_config, _ = Config.objects.get_or_create(id=1)
-
-    for login in fields:
-        if login.get("intelligence_category", None) == "anonymizer":
-            # check the possible alert: ANONYMOUS_IP_LOGIN
-            alert_info = {
-                "alert_name": AlertDetectionType.ANONYMOUS_IP_LOGIN.value,
-                "alert_desc": f"{AlertDetectionType.ANONYMOUS_IP_LOGIN.label} from IP: {login['ip']} by User: {db_user.username}",
-            }
-            set_alert(db_user, login_alert=login, alert_info=alert_info, app_config=db_config)
-        if login["lat"] and login["lon"]:
-            if Login.objects.filter(user_id=db_user.id, index=login["index"]).exists():
-                agent_alert = False
-                country_alert = False
-                if login["agent"]:
-                    # check the possible alert: NEW_DEVICE
-                    agent_alert = check_new_device(db_user, login)
-                    if agent_alert:
-                        set_alert(db_user, login_alert=login, alert_info=agent_alert, app_config=db_config)
-
-                if login["country"]:
-                    # check the possible alerts: NEW_COUNTRY / ATYPICAL_COUNTRY
-                    country_alert = check_country(db_user, login, db_config)
-                    if country_alert:
-                        set_alert(db_user, login_alert=login, alert_info=country_alert, app_config=db_config)
-
-                if not db_user.usersip_set.filter(ip=login["ip"]).exists():
-                    last_user_login = db_user.login_set.latest("timestamp")
-                    logger.info(f"Calculating impossible travel: {login['id']}")
-                    travel_alert, travel_vel = calc_distance_impossible_travel(db_user, prev_login=last_user_login, last_login_user_fields=login)
-                    if travel_alert:
-                        # enrich imp_travel alert with related fields
-                        login["buffalogs"] = {
-                            "start_country": last_user_login.country,
-                            "avg_speed": travel_vel,
-                            "start_lat": last_user_login.latitude,
-                            "start_lon": last_user_login.longitude,
-                        }
-                        set_alert(db_user, login_alert=login, alert_info=travel_alert, app_config=db_config)
-                    #   Add the new ip address from which the login comes to the db
-                    UsersIP.objects.create(user=db_user, ip=login["ip"])
-
-                if Login.objects.filter(user=db_user, index=login["index"], country=login["country"], user_agent=login["agent"]).exists():
-                    logger.info(f"Updating login {login['id']} for user: {db_user.username}")
-                    update_model(db_user, login)
-                else:
-                    logger.info(f"Adding new login {login['id']} for user: {db_user.username}")
-                    add_new_login(db_user, login)
-
+    if login.get("intelligence_category", None) == "anonymizer":
+        # check the possible alert: ANONYMOUS_IP_LOGIN
+        alert_info = {
+            "alert_name": AlertDetectionType.ANONYMOUS_IP_LOGIN.value,
+            "alert_desc": f"{AlertDetectionType.ANONYMOUS_IP_LOGIN.label} from IP: {login['ip']} by User: {db_user.username}",
+        }
+        set_alert(db_user, login_alert=login, alert_info=alert_info, app_config=app_config, context=context)
+    if login["lat"] and login["lon"]:
+        if context.has_index(login["index"]):
+            agent_alert = False
+            country_alert = False
+            if login["agent"]:
+                # check the possible alert: NEW_DEVICE
+                agent_alert = check_new_device(db_user, login, context=context)
+                if agent_alert:
+                    set_alert(db_user, login_alert=login, alert_info=agent_alert, app_config=app_config, context=context)
+
+            if login["country"]:
+                # check the possible alerts: NEW_COUNTRY / ATYPICAL_COUNTRY
+                country_alert = check_country(db_user, login, app_config, context=context)
+                if country_alert:
+                    set_alert(db_user, login_alert=login, alert_info=country_alert, app_config=app_config, context=context)
+
+            if not context.has_ip(login["ip"]):
+                last_user_login = context.get_latest_login()
+                logger.info(f"Calculating impossible travel: {login['id']}")
+                travel_alert, travel_vel = calc_distance_impossible_travel(
+                    db_user, prev_login=last_user_login, last_login_user_fields=login, app_config=app_config
+                )
+                if travel_alert:
+                    # enrich imp_travel alert with related fields
+                    login["buffalogs"] = {
+                        "start_country": last_user_login.country,
+                        "avg_speed": travel_vel,
+                        "start_lat": last_user_login.latitude,
+                        "start_lon": last_user_login.longitude,
+                    }
+                    set_alert(db_user, login_alert=login, alert_info=travel_alert, app_config=app_config, context=context)
+                #   Add the new ip address from which the login comes to the db
+                add_new_ip(db_user, login["ip"], context=context)
+
+            if context.has_login(login["index"], login["country"], login["agent"]):
+                logger.info(f"Updating login {login['id']} for user: {db_user.username}")
+                update_model(db_user, login, context=context)
             else:
-                logger.info(f"Creating new login {login['id']} for user: {db_user.username}")
-                add_new_login(db_user, login)
-                UsersIP.objects.create(user=db_user, ip=login["ip"])
+                logger.info(f"Adding new login {login['id']} for user: {db_user.username}")
+                add_new_login(db_user, login, context=context)
+
         else:
-            logger.info(f"No latitude or longitude for User {db_user.username}")
+            logger.info(f"Creating new login {login['id']} for user: {db_user.username}")
+            add_new_login(db_user, login, context=context)
+            add_new_ip(db_user, login["ip"], context=context)
+    else:
+        logger.info(f"No latitude or longitude for User {db_user.username}")
 
 
-def check_country(db_user: User, login_field: dict, app_config: Config) -> dict:
+def check_country(db_user: User, login_field: dict, app_config: Config, context: DetectionContext) -> dict:
     """
     Check Login from new Country and send alert
 
@@ -160,21 +255,22 @@ def check_country(db_user: User, login_field: dict, app_config: Config) -> dict:
     :type login_field: dict
     :param app_config: buffalogs config object
     :type app_config: Config
+    :param context: user's detection context
+    :type context: DetectionContext
 
     :return: dictionary with alert info
     :rtype: dict
     """
     alert_info = {}
+    country_last_login = context.get_country_last_login(login_field["country"])
     # check "New Country" alert
-    if db_user.login_set.filter(country=login_field["country"]).count() == 0:
+    if country_last_login is None:
         alert_info["alert_name"] = AlertDetectionType.NEW_COUNTRY.value
         alert_info["alert_desc"] = (
             f"{AlertDetectionType.NEW_COUNTRY.label} for User: {db_user.username}, at: {login_field['timestamp']}, from: {login_field['country']}"
         )
     # check "Atypical Country" alert
-    elif (
-        datetime.fromisoformat(login_field["timestamp"]) - db_user.login_set.filter(country=login_field["country"]).last().timestamp
-    ).days >= app_config.atypical_country_days:
+    elif (datetime.fromisoformat(login_field["timestamp"]) - country_last_login.timestamp).days >= app_config.atypical_country_days:
         alert_info["alert_name"] = AlertDetectionType.ATYPICAL_COUNTRY.value
         alert_info["alert_desc"] = (
             f"{AlertDetectionType.ATYPICAL_COUNTRY.label} for User: {db_user.username}, at: {login_field['timestamp']}, from: {login_field['country']}"
@@ -182,7 +278,7 @@ def check_country(db_user: User, login_field: dict, app_config: Config) -> dict:
     return alert_info
 
 
-def check_new_device(db_user: User, login_field: dict) -> dict:
+def check_new_device(db_user: User, login_field: dict, context: DetectionContext) -> dict:
     """
     Check Login from new Device and send alert
 
@@ -190,12 +286,14 @@ def check_new_device(db_user: User, login_field: dict) -> dict:
     :type db_user: object
     :param login_field: last login to check
     :type login_field: dict
+    :param context: user's detection context
+    :type context: DetectionContext
 
     :return: dictionary with alert info
     :rtype: dict
     """
     # if the user has not registred logins yet -> no alerts
-    if not db_user.login_set.all():
+    if not context.has_logins():
         logger.info(f"User {db_user.username} has no registered devices yet. " f"Skipping NEW_DEVICE alert for login at {login_field['timestamp']}.")
         return {}
 
@@ -204,7 +302,7 @@ def check_new_device(db_user: User, login_field: dict) -> dict:
     logger.info(f"Device fingerprint for user {db_user.username} at login {login_field['timestamp']}: {current_fingerprint}")
 
     # If the device fingerprint is new -> alert
-    if not db_user.login_set.filter(device_fingerprint=current_fingerprint):
+    if not context.has_fingerprint(current_fingerprint):
         return {
             "alert_name": AlertDetectionType.NEW_DEVICE.value,
             "alert_desc": (f"{AlertDetectionType.NEW_DEVICE.label} for User: " f"{db_user.username}, at: {login_field['timestamp']}"),
@@ -214,17 +312,19 @@ def check_new_device(db_user: User, login_field: dict) -> dict:
     return {}
 
 
-def add_new_login(db_user: User, new_login_field: dict):
+def add_new_login(db_user: User, new_login_field: dict, context: DetectionContext):
     """Add new login if there isn't previous login on db relative to that user
 
     :param db_user: user from db
     :type db_user: User object
     :param new_login_field: dictionary with last login info
     :type new_login_field: dict
+    :param context: user's detection context to be kept up-to-date (the DB is written at the context flush)
+    :type context: DetectionContext
     """
-    Login.objects.create(
+    db_login = Login(
         user_id=db_user.id,
-        timestamp=new_login_field["timestamp"],
+        timestamp=parse_login_timestamp(new_login_field["timestamp"]),
         ip=new_login_field["ip"],
         latitude=new_login_field["lat"],
         longitude=new_login_field["lon"],
@@ -234,39 +334,51 @@ def add_new_login(db_user: User, new_login_field: dict):
         index=new_login_field["index"],
         event_id=new_login_field["id"],
     )
+    # inserted in bulk by the context
+    context.add_login(db_login)
+
+
+def add_new_ip(db_user: User, ip: str, context: DetectionContext):
+    """Add a new IP from which the user logged in
+
+    :param db_user: user from db
+    :type db_user: User object
+    :param ip: the IP address of the login
+    :type ip: str
+    :param context: user's detection context to be kept up-to-date (the DB is written at the context flush)
+    :type context: DetectionContext
+    """
+    # inserted in bulk by the context
+    context.add_ip(ip)
 
 
-def update_model(db_user: User, new_login: dict):
+def update_model(db_user: User, new_login: dict, context: DetectionContext):
     """Update DB entry with last login info (for same: User - index - country - agent)
 
     :param db_user: user from DB
     :type db_user: User object
     :param new_login: new login info to update in to the DB
     :type new_login: dict
+    :param context: user's detection context to be kept up-to-date (the DB is written at the context flush)
+    :type context: DetectionContext
     """
     try:
-        db_user.login_set.filter(user_agent=new_login["agent"], country=new_login["country"], index=new_login["index"]).update(
-            timestamp=new_login["timestamp"],
-            latitude=new_login["lat"],
-            longitude=new_login["lon"],
-            event_id=new_login["id"],
-            ip=new_login["ip"],
-        )
-    except IntegrityError as e:
-        logger.error(
-            f"Can't update a previous login in the DB for the User: {db_user.username} with the new login (event_id: {new_login['id']}) for an Integrity error: {e}"
-        )
-    except DatabaseError as e:
-        logger.error(
-            f"Can't update a previous login in the DB for the User: {db_user.username} with the new login (event_id: {new_login['id']}) for a Database error: {e}"
-        )
+        updated_fields = {
+            "timestamp": parse_login_timestamp(new_login["timestamp"]),
+            "latitude": new_login["lat"],
+            "longitude": new_login["lon"],
+            "event_id": new_login["id"],
+            "ip": new_login["ip"],
+        }
+        # updated in bulk by the context
+        context.track_login_update(new_login["index"], new_login["country"], new_login["agent"], **updated_fields)
     except Exception as e:
         logger.error(
             f"Unexpected error while updating a previous login in the DB for the User: {db_user.username} with the new login (event_id: {new_login['id']}): {e}"
         )
 
 
-def calc_distance_impossible_travel(db_user: User, prev_login: Login, last_login_user_fields: dict):
+def calc_distance_impossible_travel(db_user: User, prev_login: Login, last_login_user_fields: dict, app_config: Config = None):
     """Compute distance and velocity to alert if impossible travel occurs
 
     :param db_user: user from db
@@ -275,17 +387,27 @@ def calc_distance_impossible_travel(db_user: User, prev_login: Login, last_login
     :type prev_login: object
     :param last_login_user_fields: dictionary login from elastic
     :type last_login_user_fields: dict
+    :param app_config: buffalogs config object, the cached Config snapshot if not given
+    :type app_config: Config
 
     :return: dictionary with info about the impossible travel alert and velocity of travel
     :rtype: dict, int
     """
-    app_config = Config.objects.get(id=1)
+    app_config = app_config or get_app_config()
     alert_info = {}
     vel = 0
+    # the exact geodesic distance is computed only if the approximated one isn't certainly lower than the Config.distance_accepted
+    if (
+        exceeds_distance(
+            haversine_km(prev_login.latitude, prev_login.longitude, last_login_user_fields["lat"], last_login_user_fields["lon"]), app_config.distance_accepted
+        )
+        is False
+    ):
+        return alert_info, vel
     distance_km = geodesic((prev_login.latitude, prev_login.longitude), (last_login_user_fields["lat"], last_login_user_fields["lon"])).km
 
     if distance_km > app_config.distance_accepted:
-        last_timestamp_datetimeObj_aware = timezone.make_aware(datetime.strptime(last_login_user_fields["timestamp"], "%Y-%m-%dT%H:%M:%S.%fZ"))
+        last_timestamp_datetimeObj_aware = parse_login_timestamp(last_login_user_fields["timestamp"])
         prev_timestamp_datetimeObj_aware = prev_login.timestamp  # already aware in the db
 
         diff_timestamp = last_timestamp_datetimeObj_aware - prev_timestamp_datetimeObj_aware
@@ -0,0 +1,176 @@
+from datetime import datetime
+from itertools import chain
+
+from django.utils import timezone
+from impossible_travel.models import Alert, Login, User, UsersIP
+
+# fields of the Login updated when the same login (user, index, country, user_agent) is seen again
+LOGIN_UPDATE_FIELDS = ["timestamp", "latitude", "longitude", "event_id", "ip", "updated"]
+
+
+def parse_login_timestamp(value) -> datetime:
+    """Convert a login timestamp (ISO string or datetime) into an aware datetime, as it would be saved in the Login.timestamp field"""
+    timestamp = Login._meta.get_field("timestamp").to_python(value)
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def normalize_ip(ip: str) -> str:
+    """Normalize the IP as it would be saved in the UsersIP.ip field (IPv6 addresses are compressed)"""
+    return UsersIP._meta.get_field("ip").get_prep_value(ip)
+
+
+class DetectionContext:
+    """
+    Per-user detection state, loaded with a single query for each model at the beginning of the user detection
+    and kept up-to-date in memory while the user's logins are processed, in order to avoid the ORM lookups for each login:
+
+    * logins: the user's Login objects, grouped by the (index, country, user_agent) key
+    * indexes: the indexes of the user's logins
+    * fingerprints: the known device fingerprints of the user
+    * countries_last_login: for each country, the last Login (by insertion order) from that country
+    * latest_login: the most recent Login of the user (by timestamp)
+    * ips: the known IPs of the user
+
+    The rows produced by the detection are buffered in the context (unit of work) and written to the DB by flush(),
+    with bulk queries, instead of issuing an INSERT or UPDATE for each login.
+
+    The alerts are buffered as well, and the user's risk state is tracked for the whole detection pass, so the risk_score is computed incrementally:
+
+    * new_risk_alerts: the number of the buffered alerts in the Config.risk_score_increment_alerts list, not counted yet by User.risk_alert_count
+    * initial_risk_score: the user's risk_score at the beginning of the detection
+    * risk_updated: if the risk_score has to be saved, at the end of the detection
+    * risk_alert: the last not filtered alert that increased the risk_score
+    """
+
+    def __init__(self, db_user: User):
+        self.db_user = db_user
+        self.load()
+        # user's risk state for the whole detection
+        self.initial_risk_score = db_user.risk_score
+        self.risk_updated = False
+        self.risk_alert = None
+
+    def load(self):
+        """Load the user's logins and IPs from the DB, discarding the rows not written yet"""
+        self.logins = {}
+        self.indexes = set()
+        self.fingerprints = set()
+        self.countries_last_login = {}
+        self.latest_login = None
+        for db_login in self.db_user.login_set.order_by("id"):
+            self.track_login(db_login)
+        self.ips = set(self.db_user.usersip_set.values_list("ip", flat=True))
+        # unit of work: rows to be written to the DB at the next flush()
+        self.new_logins = []
+        self.updated_logins = {}
+        self.new_ips = []
+        self.new_alerts = []
+        self.new_risk_alerts = 0
+
+    def get_risk_state(self) -> tuple:
+        """Return the user's risk state, to be restored by reset() if the next flush fails"""
+        return self.db_user.risk_score, self.risk_updated, self.risk_alert
+
+    def reset(self, risk_state: tuple):
+        """Discard the changes rolled back by a failed flush: the user's state is loaded again from the DB and the risk state is restored
+
+        :param risk_state: the risk state before the failed changes, as returned by get_risk_state()
+        :type risk_state: tuple
+        """
+        self.db_user.refresh_from_db(fields=["login_count", "alert_count", "risk_alert_count", "last_login"])
+        self.db_user.risk_score, self.risk_updated, self.risk_alert = risk_state
+        self.load()
+
+    @staticmethod
+    def login_key(index: str, country: str, user_agent: str) -> tuple:
+        """Key identifying the unique login of a user"""
+        return index, country, user_agent
+
+    def has_logins(self) -> bool:
+        return bool(self.logins)
+
+    def has_index(self, index: str) -> bool:
+        return index in self.indexes
+
+    def has_login(self, index: str, country: str, user_agent: str) -> bool:
+        return self.login_key(index, country, user_agent) in self.logins
+
+    def has_fingerprint(self, fingerprint: str) -> bool:
+        return fingerprint in self.fingerprints
+
+    def has_ip(self, ip: str) -> bool:
+        return normalize_ip(ip) in self.ips
+
+    def get_country_last_login(self, country: str) -> Login | None:
+        return self.countries_last_login.get(country)
+
+    def get_latest_login(self) -> Login | None:
+        """Return the most recent login of the user, as Login.objects.latest("timestamp")"""
+        return self.latest_login
+
+    def track_login(self, db_login: Login):
+        """Add a new login of the user to the context"""
+        self.logins.setdefault(self.login_key(db_login.index, db_login.country, db_login.user_agent), []).append(db_login)
+        self.indexes.add(db_login.index)
+        self.fingerprints.add(db_login.device_fingerprint)
+        self.countries_last_login[db_login.country] = db_login
+        if self.latest_login is None or db_login.timestamp > self.latest_login.timestamp:
+            self.latest_login = db_login
+
+    def track_login_update(self, index: str, country: str, user_agent: str, **fields):
+        """Update the fields of the logins of the user with the given key"""
+        for db_login in self.logins.get(self.login_key(index, country, user_agent), []):
+            for field, value in fields.items():
+                setattr(db_login, field, value)
+            # the auto_now field isn't set by bulk_update
+            db_login.updated = timezone.now()
+            # the logins not saved yet are inserted with the updated values
+            if db_login.pk is not None:
+                self.updated_logins[db_login.pk] = db_login
+            if db_login.timestamp > self.latest_login.timestamp:
+                self.latest_login = db_login
+            elif db_login is self.latest_login and "timestamp" in fields:
+                # the latest login has been moved back in time (an older event processed late): look for the new latest one
+                self.latest_login = max(
+                    (key_login for key_logins in self.logins.values() for key_login in key_logins), key=lambda key_login: key_login.timestamp
+                )
+
+    def track_ip(self, ip: str):
+        """Add a new IP of the user to the context"""
+        self.ips.add(normalize_ip(ip))
+
+    def add_login(self, db_login: Login):
+        """Track a new login, to be inserted at the next flush()"""
+        self.new_logins.append(db_login)
+        self.track_login(db_login)
+
+    def add_ip(self, ip: str):
+        """Track a new IP, to be inserted at the next flush()"""
+        self.new_ips.append(UsersIP(user=self.db_user, ip=ip))
+        self.track_ip(ip)
+
+    def add_alert(self, alert: Alert):
+        """Track a new alert, to be filtered and inserted at the next flush()"""
+        self.new_alerts.append(alert)
+
+    def flush(self):
+        """Write the buffered rows to the DB with bulk queries and update the user's counters accordingly"""
+        if self.new_logins:
+            Login.objects.bulk_create(self.new_logins)
+        if self.updated_logins:
+            Login.objects.bulk_update(self.updated_logins.values(), fields=LOGIN_UPDATE_FIELDS)
+        if self.new_ips:
+            UsersIP.objects.bulk_create(self.new_ips)
+        if self.new_alerts:
+            Alert.objects.bulk_create(self.new_alerts)
+        timestamps = [db_login.timestamp for db_login in chain(self.new_logins, self.updated_logins.values())]
+        self.db_user.increment_counters(
+            logins=len(self.new_logins), alerts=len(self.new_alerts), risk_alerts=self.new_risk_alerts, last_login=max(timestamps, default=None)
+        )
+        self.new_logins = []
+        self.updated_logins = {}
+        self.new_ips = []
+        self.new_alerts = []
+        self.new_risk_alerts = 0
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+from geopy.distance import geodesic
+
+# mean Earth radius (km), used by the haversine approximation of the geodesic distance
+EARTH_RADIUS_KM = 6371.0088
+# maximum relative error of the haversine (spherical) distance compared to the geodesic (WGS-84 ellipsoid) one is about 0.56%,
+# so the pairs within this margin from the thresholds are checked with the exact geodesic distance
+HAVERSINE_TOLERANCE = 0.01
+# minimum time difference between two logins, to avoid the division by zero in the velocity
+MIN_DIFF_HOURS = 0.001
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance (km) between two points, on the spherical approximation of the Earth"""
+    # the coordinates can be numeric strings, as accepted by geopy
+    lat1, lon1, lat2, lon2 = (math.radians(float(value)) for value in (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_array(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Vectorized haversine_km, for arrays of points"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def exceeds_distance(distance_km: float, distance_accepted: float) -> bool | None:
+    """Check the haversine distance against the distance_accepted threshold
+
+    :return: True or False if the geodesic distance is certainly higher or not than the threshold, None if it's within the haversine error margin
+    :rtype: bool or None
+    """
+    if distance_km * (1 + HAVERSINE_TOLERANCE) <= distance_accepted:
+        return False
+    if distance_km * (1 - HAVERSINE_TOLERANCE) > distance_accepted:
+        return True
+    return None
+
+
+def _to_seconds(timestamps) -> np.ndarray:
+    """Convert an array of timestamps (numpy datetime64 or epoch seconds) to epoch seconds"""
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return (timestamps - np.datetime64(0, "s")) / np.timedelta64(1, "s")
+    return timestamps.astype(float)
+
+
+def batch_travel_velocity(prev_lat, prev_lon, prev_ts, lat, lon, ts, distance_accepted: float, vel_accepted: float) -> tuple:
+    """Compute the distance and the velocity of many couples of consecutive logins, with the same alerts of detection.calc_distance_impossible_travel.
+    The distances are approximated with the vectorized haversine formula, and the exact geodesic distance is computed for the candidates:
+    the couples that could be impossible travels, whose haversine distance and velocity, increased by HAVERSINE_TOLERANCE, exceed the thresholds.
+    Since the haversine error is lower than HAVERSINE_TOLERANCE (at most about 0.56% of the geodesic distance), the other couples aren't impossible travels,
+    and their distance and velocity are the haversine approximations, within HAVERSINE_TOLERANCE of the exact values.
+    As in calc_distance_impossible_travel, the velocity is 0 if the distance doesn't exceed the distance_accepted threshold.
+
+    :param prev_lat: latitudes of the previous logins
+    :type prev_lat: array-like of float
+    :param prev_lon: longitudes of the previous logins
+    :type prev_lon: array-like of float
+    :param prev_ts: timestamps of the previous logins (numpy datetime64 or epoch seconds)
+    :type prev_ts: array-like
+    :param lat: latitudes of the new logins
+    :type lat: array-like of float
+    :param lon: longitudes of the new logins
+    :type lon: array-like of float
+    :param ts: timestamps of the new logins (numpy datetime64 or epoch seconds)
+    :type ts: array-like
+    :param distance_accepted: the Config.distance_accepted threshold (km)
+    :type distance_accepted: float
+    :param vel_accepted: the Config.vel_accepted threshold (km/h)
+    :type vel_accepted: float
+
+    :return: the distances (km), the velocities (km/h), the boolean mask of the impossible travels
+        and the boolean mask of the candidates, whose distance and velocity are exact
+    :rtype: tuple(np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+    """
+    prev_lat, prev_lon, lat, lon = (np.asarray(values, dtype=float) for values in (prev_lat, prev_lon, lat, lon))
+    diff_hours = (_to_seconds(ts) - _to_seconds(prev_ts)) / 3600
+    diff_hours = np.where(diff_hours == 0, MIN_DIFF_HOURS, diff_hours)
+
+    distance_km = haversine_km_array(prev_lat, prev_lon, lat, lon)
+    # the couples that could be impossible travels, considering the haversine error
+    max_distance_km = distance_km * (1 + HAVERSINE_TOLERANCE)
+    candidates = (max_distance_km > distance_accepted) & (max_distance_km / diff_hours > vel_accepted)
+    for i in np.flatnonzero(candidates):
+        distance_km[i] = geodesic((prev_lat[i], prev_lon[i]), (lat[i], lon[i])).km
+
+    velocity = np.where(distance_km > distance_accepted, distance_km / diff_hours, 0.0)
+    return distance_km, velocity, candidates & (velocity > vel_accepted), candidates
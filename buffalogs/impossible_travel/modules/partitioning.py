@@ -0,0 +1,276 @@
+import re
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import Callable
+
+from celery.utils.log import get_task_logger
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection, models, transaction
+from impossible_travel.models import Alert, Login
+
+logger = get_task_logger(__name__)
+
+# models that can be partitioned by month, with their partition key
+PARTITION_KEYS = {Login: "timestamp", Alert: "created"}
+
+PARTITION_NAME_REGEX = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def quote_name(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def quote_timestamp(value: datetime) -> str:
+    """Literal of a partition bound (the DDL statements don't accept query parameters)"""
+    return f"'{value.astimezone(timezone.utc).isoformat()}'"
+
+
+def month_start(value: datetime) -> datetime:
+    """First instant (UTC) of the month of the given datetime"""
+    return value.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(model: type[models.Model], month: datetime) -> str:
+    return f"{model._meta.db_table}_p{month:%Y%m}"
+
+
+def default_partition_name(model: type[models.Model]) -> str:
+    return f"{model._meta.db_table}_default"
+
+
+def is_partitioned(model: type[models.Model]) -> bool:
+    """Check if the table of the model is partitioned"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [model._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def get_partitions(model: type[models.Model], parent: str = None) -> dict:
+    """Return the monthly partitions of the model table
+
+    :param model: Login or Alert
+    :type model: Model class
+    :param parent: the partitioned table, the table of the model by default
+    :type parent: str
+
+    :return: the partitions names, by the first instant of their month
+    :rtype: dict
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid WHERE pg_inherits.inhparent = to_regclass(%s)",
+            [parent or model._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        if match := PARTITION_NAME_REGEX.search(name):
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)] = name
+    return partitions
+
+
+def create_partition(model: type[models.Model], month: datetime, parent: str = None) -> bool:
+    """Create the partition of the month, moving into it the rows of that month already saved in the default partition
+
+    :param model: Login or Alert
+    :type model: Model class
+    :param month: any datetime of the month
+    :type month: datetime
+    :param parent: the partitioned table, the table of the model by default
+    :type parent: str
+
+    :return: True if the partition has been created, False if it already exists
+    :rtype: bool
+    """
+    month = month_start(month)
+    if month in get_partitions(model, parent):
+        return False
+    table, key = quote_name(parent or model._meta.db_table), quote_name(PARTITION_KEYS[model])
+    name, default = quote_name(partition_name(model, month)), quote_name(default_partition_name(model))
+    start, end = quote_timestamp(month), quote_timestamp(month + relativedelta(months=1))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        # the default partition can't contain rows in the range of the new partition
+        cursor.execute(f"WITH moved AS (DELETE FROM {default} WHERE {key} >= {start} AND {key} < {end} RETURNING *) INSERT INTO {name} SELECT * FROM moved")
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})")
+    logger.info(f"Created the partition {partition_name(model, month)}")
+    return True
+
+
+def ensure_partitions(model: type[models.Model], months_ahead: int = None, now: datetime = None, parent: str = None) -> list:
+    """Create the partitions from the current month to the next months_ahead months, if they don't exist yet
+
+    :return: the names of the created partitions
+    :rtype: list
+    """
+    months_ahead = settings.CERTEGO_BUFFALOGS_PARTITIONS_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current_month = month_start(now or datetime.now(timezone.utc))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = current_month + relativedelta(months=offset)
+        if create_partition(model, month, parent):
+            created.append(partition_name(model, month))
+    return created
+
+
+def drop_partition_copy(model: type[models.Model]):
+    """Drop the partitioned copy of the model table, with the trigger recording the changes of the original table, left by a failed partition_table"""
+    db_table = model._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {quote_name(f'{db_table}_partition_changes')} ON {quote_name(db_table)}")
+        cursor.execute(f"DROP FUNCTION IF EXISTS {quote_name(f'{db_table}_partition_log_change')}()")
+        cursor.execute(f"DROP TABLE IF EXISTS {quote_name(f'{db_table}_partition_changes')}, {quote_name(f'{db_table}_partitioned')}")
+
+
+def partition_table(model: type[models.Model], months_ahead: int = None, now: datetime = None, batch_size: int = None, after_batch: Callable = None):
+    """Convert the table of the model into a table partitioned by month on the partition key, with a partition for each month
+    of the existing rows (up to months_ahead months in the future) and a default partition for the rows out of those ranges.
+    The partitioned table is built next to the original one, copying the rows in batches of batch_size rows ordered by id, each one
+    committed in its own transaction, so the original table isn't locked during the copy. The ids of the rows inserted, updated or deleted
+    since the beginning of the copy are recorded by a trigger in a changes table, so, in a last short transaction holding an ACCESS EXCLUSIVE lock,
+    those rows are copied again (or removed, if deleted) and the tables are swapped.
+    The primary key becomes (id, partition key), because the unique constraints of a partitioned table must include the partition key
+
+    :param model: Login or Alert
+    :type model: Model class
+    :param batch_size: number of rows copied by each batch, CERTEGO_BUFFALOGS_RETENTION_BATCH_SIZE by default
+    :type batch_size: int
+    :param after_batch: called with the last copied id after each batch, e.g. to report the progress
+    :type after_batch: Callable
+    """
+    batch_size = batch_size or settings.CERTEGO_BUFFALOGS_RETENTION_BATCH_SIZE
+    db_table, key = model._meta.db_table, PARTITION_KEYS[model]
+    new_db_table = f"{db_table}_partitioned"
+    table, new_table = quote_name(db_table), quote_name(new_db_table)
+    changes_table, changes_function = quote_name(f"{db_table}_partition_changes"), quote_name(f"{db_table}_partition_log_change")
+    with transaction.atomic(), connection.cursor() as cursor:
+        # the deferred foreign keys checks pending on the table would prevent the creation of the indexes and the drop of the table
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        # the changes of the rows are recorded from before the copy, whatever the fields they update
+        cursor.execute(f"CREATE TABLE {changes_table} (id bigint NOT NULL)")
+        cursor.execute(
+            f"CREATE FUNCTION {changes_function}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+            f"INSERT INTO {changes_table} (id) VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END); RETURN NULL; END $$"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {quote_name(f'{db_table}_partition_changes')} AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {changes_function}()"
+        )
+        cursor.execute(f"CREATE TABLE {new_table} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({quote_name(key)})")
+        cursor.execute(f"CREATE TABLE {quote_name(default_partition_name(model))} PARTITION OF {new_table} DEFAULT")
+        cursor.execute(f"SELECT MIN({quote_name(key)}) FROM {table}")
+        first_date = cursor.fetchone()[0]
+        # the partitions are created before copying the rows, so they aren't moved from the default partition
+        month = month_start(first_date or now or datetime.now(timezone.utc))
+        while month <= month_start(now or datetime.now(timezone.utc)):
+            create_partition(model, month, new_db_table)
+            month += relativedelta(months=1)
+        ensure_partitions(model, months_ahead, now, new_db_table)
+        # the foreign keys keep their names, which are unique only within their table
+        cursor.execute("SELECT pg_get_constraintdef(oid), conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [db_table])
+        for definition, name in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {new_table} ADD CONSTRAINT {quote_name(name)} {definition}")
+
+    try:
+        last_id = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                # the foreign keys of the copied rows are checked by each batch, so no checks are left pending on the tables
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                cursor.execute(
+                    f"WITH copied AS (INSERT INTO {new_table} SELECT * FROM {table} WHERE id > %s ORDER BY id LIMIT %s RETURNING id) SELECT COUNT(*), MAX(id) FROM copied",
+                    [last_id, batch_size],
+                )
+                copied, max_copied_id = cursor.fetchone()
+            if copied:
+                last_id = max_copied_id
+                if after_batch:
+                    after_batch(last_id)
+            if copied < batch_size:
+                break
+
+        # the primary key and the indexes are built once after the copy, with temporary names (the index names are unique in the schema)
+        pkey = f"{db_table}_pkey"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT class.relname, pg_get_indexdef(pg_index.indexrelid) FROM pg_index JOIN pg_class class ON class.oid = pg_index.indexrelid "
+                "WHERE pg_index.indrelid = %s::regclass AND NOT pg_index.indisprimary",
+                [db_table],
+            )
+            indexes = {name: (f"{name[:50]}_partitioned", definition) for name, definition in cursor.fetchall()}
+            cursor.execute(f"ALTER TABLE {new_table} ADD CONSTRAINT {quote_name(f'{new_db_table}_pkey')} PRIMARY KEY (id, {quote_name(key)})")
+            for temporary_name, definition in indexes.values():
+                cursor.execute(re.sub(r"INDEX \S+ ON (ONLY )?\S+ USING ", f"INDEX {quote_name(temporary_name)} ON {new_table} USING ", definition, count=1))
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+            # the rows inserted, updated or deleted during the copy are removed and copied again from the original table, if they still exist
+            cursor.execute(f"DELETE FROM {new_table} WHERE id IN (SELECT id FROM {changes_table})")
+            cursor.execute(f"INSERT INTO {new_table} SELECT * FROM {table} WHERE id > %s OR id IN (SELECT id FROM {changes_table})", [last_id])
+            cursor.execute(f"SELECT MAX(id) FROM {table}")
+            max_id = cursor.fetchone()[0]
+            # the trigger is dropped with the table
+            cursor.execute(f"DROP TABLE {table}")
+            cursor.execute(f"DROP FUNCTION {changes_function}()")
+            cursor.execute(f"DROP TABLE {changes_table}")
+            cursor.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+            cursor.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {quote_name(f'{new_db_table}_pkey')} TO {quote_name(pkey)}")
+            for name, (temporary_name, _) in indexes.items():
+                cursor.execute(f"ALTER INDEX {quote_name(temporary_name)} RENAME TO {quote_name(name)}")
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {(max_id or 0) + 1})")
+    except Exception:
+        # the original table is left as it was, without the trigger
+        drop_partition_copy(model)
+        raise
+    logger.info(f"Partitioned the table {db_table} by month on the {key} field")
+
+
+def delete_old_partitioned_data(
+    model: type[models.Model], cutoff: datetime, detach_only: bool = None, batch_size: int = None, track_deletion: Callable = None
+) -> int:
+    """Retention of a partitioned table: the partitions of the months entirely before the cutoff are detached (and dropped),
+    while the older rows of the boundary partition (and of the default one) are deleted in batches of batch_size rows
+
+    :param model: Login or Alert
+    :type model: Model class
+    :param cutoff: the rows with the partition key before this datetime are deleted
+    :type cutoff: datetime
+    :param detach_only: detach the expired partitions without dropping them (e.g. to archive them)
+    :type detach_only: bool
+    :param track_deletion: called with the queryset of the rows of each detached partition or deleted batch, returns a context manager
+        wrapping their deletion in the same transaction (e.g. User.track_deleted_rows, to update the counters of the users)
+    :type track_deletion: Callable
+
+    :return: the number of rows deleted in batches
+    :rtype: int
+    """
+    detach_only = settings.CERTEGO_BUFFALOGS_PARTITIONS_DETACH_ONLY if detach_only is None else detach_only
+    batch_size = batch_size or settings.CERTEGO_BUFFALOGS_RETENTION_BATCH_SIZE
+    table, key = quote_name(model._meta.db_table), PARTITION_KEYS[model]
+    for month, name in sorted(get_partitions(model).items()):
+        if month + relativedelta(months=1) > cutoff:
+            break
+        rows = model.objects.filter(**{f"{key}__gte": month, f"{key}__lt": month + relativedelta(months=1)})
+        with transaction.atomic(), track_deletion(rows) if track_deletion else nullcontext(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {quote_name(name)}")
+            if not detach_only:
+                cursor.execute(f"DROP TABLE {quote_name(name)}")
+        logger.info(f"{'Detached' if detach_only else 'Dropped'} the expired partition {name}")
+
+    expired = model.objects.filter(**{f"{key}__lt": cutoff})
+    deleted = 0
+    while True:
+        # each batch is committed on its own, so the locks are held only for a short time
+        with transaction.atomic():
+            pks = list(expired.values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            # the partition key in the filter prunes the partitions not containing expired rows
+            rows = expired.filter(pk__in=pks)
+            with track_deletion(rows) if track_deletion else nullcontext():
+                batch_deleted = rows._raw_delete(rows.db)
+        deleted += batch_deleted
+        if batch_deleted < batch_size:
+            return deleted
@@ -0,0 +1,103 @@
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Callable
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.deletion import CASCADE, Collector
+
+logger = get_task_logger(__name__)
+
+
+def delete_rows(model: type[models.Model], pks: list, track_deletion: Callable = None) -> int:
+    """Delete the rows with the given primary keys, in a single transaction.
+    The rows without signals and related objects are deleted with a single DELETE, without loading them
+
+    :param track_deletion: called with the queryset of the rows to be deleted, returns a context manager wrapping the DELETE in the same transaction
+        (e.g. User.track_deleted_rows, to update the counters of the users)
+    :type track_deletion: Callable
+
+    :return: the number of deleted rows
+    :rtype: int
+    """
+    queryset = model.objects.filter(pk__in=pks)
+    with transaction.atomic(), track_deletion(queryset) if track_deletion else nullcontext():
+        if Collector(using=queryset.db).can_fast_delete(queryset):
+            return queryset._raw_delete(queryset.db)
+        return queryset.delete()[1].get(model._meta.label, 0)
+
+
+def delete_in_chunks(
+    queryset: models.QuerySet, batch_size: int = None, sleep_seconds: float = None, after_chunk: Callable = None, track_deletion: Callable = None
+) -> int:
+    """Delete the rows of the queryset in chunks of batch_size rows ordered by primary key, each one committed in its own transaction
+    and followed by a pause of sleep_seconds, so the locks are held for a short time and the concurrent detection isn't stalled.
+    The related rows deleted in cascade (e.g. the logins of the users) are deleted in chunks as well, before the chunk of their parents
+
+    :param queryset: the rows to be deleted
+    :type queryset: QuerySet
+    :param after_chunk: called with the last deleted primary key after each chunk, e.g. to save a checkpoint
+    :type after_chunk: Callable
+    :param track_deletion: wraps the deletion of each chunk of the queryset rows, see delete_rows
+    :type track_deletion: Callable
+
+    :return: the number of deleted rows of the queryset model
+    :rtype: int
+    """
+    batch_size = batch_size or settings.CERTEGO_BUFFALOGS_RETENTION_BATCH_SIZE
+    sleep_seconds = settings.CERTEGO_BUFFALOGS_RETENTION_SLEEP_SECONDS if sleep_seconds is None else sleep_seconds
+    model = queryset.model
+    cascades = [related for related in model._meta.related_objects if related.one_to_many and related.on_delete is CASCADE]
+    queryset = queryset.order_by("pk")
+    deleted = 0
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        for related in cascades:
+            delete_in_chunks(related.related_model.objects.filter(**{f"{related.field.name}__in": pks}), batch_size, sleep_seconds)
+        deleted += delete_rows(model, pks, track_deletion)
+        last_pk = pks[-1]
+        if after_chunk:
+            after_chunk(last_pk)
+        if len(pks) < batch_size:
+            return deleted
+        time.sleep(sleep_seconds)
+
+
+def delete_expired(model: type[models.Model], cutoff: datetime, checkpoint: dict, save_checkpoint: Callable = None, **kwargs) -> int:
+    """Delete the rows of the model not updated since the cutoff, resuming from the last primary key saved in the checkpoint
+    by a previous interrupted run. The checkpoint of the model is removed when all the expired rows have been deleted
+
+    :param model: the model to be cleaned
+    :type model: Model class
+    :param cutoff: the rows updated before this datetime are deleted
+    :type cutoff: datetime
+    :param checkpoint: last deleted primary key, by model name
+    :type checkpoint: dict
+    :param save_checkpoint: called after each chunk, to persist the checkpoint
+    :type save_checkpoint: Callable
+
+    :return: the number of deleted rows
+    :rtype: int
+    """
+    queryset = model.objects.filter(updated__lte=cutoff)
+    if model.__name__ in checkpoint:
+        logger.info(f"Resuming the deletion of the old {model.__name__} rows from the id {checkpoint[model.__name__]}")
+        queryset = queryset.filter(pk__gt=checkpoint[model.__name__])
+
+    def after_chunk(last_pk):
+        checkpoint[model.__name__] = last_pk
+        if save_checkpoint:
+            save_checkpoint()
+
+    deleted = delete_in_chunks(queryset, after_chunk=after_chunk, **kwargs)
+    checkpoint.pop(model.__name__, None)
+    if save_checkpoint:
+        save_checkpoint()
+    logger.info(f"Deleted {deleted} {model.__name__} rows updated before {cutoff}")
+    return deleted
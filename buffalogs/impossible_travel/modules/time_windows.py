@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from impossible_travel.ingestion.base_ingestion import BaseIngestion
+
+logger = get_task_logger(__name__)
+
+
+def plan_time_windows(ingestion: BaseIngestion, start_date: datetime, end_date: datetime, max_windows: int = None, keep_remainder: bool = False) -> list:
+    """Split the datetime range in consecutive windows sized on the logins density, measured with a count query for each candidate window:
+    a window with more than CERTEGO_BUFFALOGS_WINDOW_TARGET_LOGINS logins is halved (down to CERTEGO_BUFFALOGS_MIN_WINDOW_MINUTES),
+    while after a quiet window (less than 1/4 of the target) the next one is doubled (up to CERTEGO_BUFFALOGS_MAX_WINDOW_MINUTES).
+    If the ingestion source can't count the logins, the windows are CERTEGO_BUFFALOGS_WINDOW_MINUTES long.
+    The final part of the range shorter than the minimum window is left for the next run, unless keep_remainder is True.
+
+    :param ingestion: the ingestion source object
+    :type ingestion: BaseIngestion
+    :param start_date: the initial datetime of the range
+    :type start_date: datetime
+    :param end_date: the final datetime of the range
+    :type end_date: datetime
+    :param max_windows: maximum number of windows returned (no limit if None)
+    :type max_windows: int
+    :param keep_remainder: whether to include the final part of the range shorter than the minimum window
+    :type keep_remainder: bool
+
+    :return: list of (start_date, end_date) windows
+    :rtype: list
+    """
+    window = timedelta(minutes=settings.CERTEGO_BUFFALOGS_WINDOW_MINUTES)
+    min_window = timedelta(minutes=settings.CERTEGO_BUFFALOGS_MIN_WINDOW_MINUTES)
+    max_window = timedelta(minutes=settings.CERTEGO_BUFFALOGS_MAX_WINDOW_MINUTES)
+    target_logins = settings.CERTEGO_BUFFALOGS_WINDOW_TARGET_LOGINS
+    windows = []
+    window_start = start_date
+
+    while window_start < end_date and (max_windows is None or len(windows) < max_windows):
+        if end_date - window_start < min_window and not keep_remainder:
+            break
+        window_end = min(window_start + window, end_date)
+        logins_count = ingestion.count_logins(window_start, window_end)
+        if logins_count is not None:
+            if logins_count > target_logins and window_end - window_start > min_window:
+                # hot window: split it
+                window = max((window_end - window_start) / 2, min_window)
+                continue
+            if logins_count < target_logins / 4:
+                # quiet window: merge the next one
+                window = min(window * 2, max_window)
+        logger.info(f"Planned window from {window_start} to {window_end} with {logins_count} logins")
+        windows.append((window_start, window_end))
+        window_start = window_end
+
+    return windows
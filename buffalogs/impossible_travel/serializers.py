@@ -2,7 +2,6 @@ import json
 from typing import Any, Dict, List, Optional, Union
 
 from django.db import models
-from django.db.models import Max
 from impossible_travel.models import Alert, Login, User, UsersIP
 
 InstanceType = Union[models.Model, List[models.Model]]
@@ -68,9 +67,10 @@ class UserSerializer(Serializer):
             "id": item.id,
             "username": item.username,
             "risk_score": item.risk_score,
-            "login_count": Login.objects.filter(user=item).distinct().count(),
-            "alert_count": Alert.objects.filter(user=item).distinct().count(),
-            "last_login": Login.objects.filter(user=item).aggregate(Max("timestamp"))["timestamp__max"],
+            # denormalized counters, instead of the queries on the user's logins and alerts
+            "login_count": item.login_count,
+            "alert_count": item.alert_count,
+            "last_login": item.last_login,
         }
 
 
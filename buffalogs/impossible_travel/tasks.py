@@ -1,27 +1,32 @@
+import math
+import threading
+import zlib
 from collections import defaultdict
-from datetime import timedelta
-
-from celery import shared_task
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import chain
+from typing import Iterable
+
+from celery import chain as celery_chain
+from celery import chord, group, shared_task
 from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import connection, transaction
 from django.utils import timezone
 from impossible_travel.alerting.alert_factory import AlertFactory
+from impossible_travel.alerting.http_client import get_http_metrics
 from impossible_travel.ingestion.ingestion_factory import IngestionFactory
-from impossible_travel.models import Alert, Config, Login, TaskSettings, User
-from impossible_travel.modules import detection
+from impossible_travel.models import Alert, Config, Login, NotificationDelivery, TaskSettings, User, UsersIP
+from impossible_travel.modules import detection, partitioning, retention
+from impossible_travel.modules.time_windows import plan_time_windows
 
 logger = get_task_logger(__name__)
 
 
-def delete_old_data(model, days):
-    """Helper function to delete old data,takes model and days as args"""
-    now = timezone.now()
-    delete_time = now - timedelta(days=days)
-    model.objects.filter(updated__lte=delete_time).delete()
-
-
 @shared_task(name="BuffalogsCleanModelsPeriodicallyTask")
 def clean_models_periodically():
-    """Delete old data in the models"""
+    """Delete old data in the models, in chunks. The progress is saved in the TaskSettings.checkpoint, so an interrupted run is resumed by the next one"""
     now = timezone.now()
     task_settings, _ = TaskSettings.objects.get_or_create(
         task_name="BuffalogsCleanModelsPeriodicallyTask",
@@ -32,21 +37,50 @@ def clean_models_periodically():
     )
     app_config, _ = Config.objects.get_or_create(id=1)
 
-    delete_old_data(User, app_config.user_max_days)
-    delete_old_data(Login, app_config.login_max_days)
-    delete_old_data(Alert, app_config.alert_max_days)
+    def save_checkpoint():
+        task_settings.save(update_fields=["checkpoint", "updated"])
+
+    # the counters of the users are decreased in the same transaction of each deleted chunk of their logins and alerts
+    track_deletion = partial(User.track_deleted_rows, risk_alerts_types=app_config.risk_score_increment_alerts)
+    # the users are deleted first, with their logins, alerts and IPs
+    retention.delete_expired(User, now - timedelta(days=app_config.user_max_days), task_settings.checkpoint, save_checkpoint)
+    for model, max_days in ((Login, app_config.login_max_days), (Alert, app_config.alert_max_days)):
+        if partitioning.is_partitioned(model):
+            # the whole expired months are dropped, only the rows of the boundary month are deleted
+            partitioning.delete_old_partitioned_data(model, now - timedelta(days=max_days), track_deletion=track_deletion)
+        else:
+            retention.delete_expired(model, now - timedelta(days=max_days), task_settings.checkpoint, save_checkpoint, track_deletion=track_deletion)
+    retention.delete_expired(UsersIP, now - timedelta(days=app_config.ip_max_days), task_settings.checkpoint, save_checkpoint)
+    # the deliveries of the alerts in the dropped partitions (without a foreign key constraint) aren't deleted in cascade
+    retention.delete_expired(NotificationDelivery, now - timedelta(days=app_config.alert_max_days), task_settings.checkpoint, save_checkpoint)
 
     task_settings.start_date = task_settings.end_date
     task_settings.end_date = timezone.now()
     task_settings.save()
 
 
+@shared_task(name="BuffalogsRebuildUserCountersTask")
+def rebuild_user_counters():
+    """Recompute the denormalized counters of all the users, e.g. after a change of the Config.risk_score_increment_alerts"""
+    updated = User.rebuild_counters()
+    logger.info(f"Rebuilt the counters of {updated} users")
+
+
+@shared_task(name="BuffalogsManagePartitionsTask")
+def manage_partitions():
+    """Create in advance the monthly partitions of the partitioned tables (nothing to do if the tables aren't partitioned)"""
+    for model in partitioning.PARTITION_KEYS:
+        if partitioning.is_partitioned(model):
+            created = partitioning.ensure_partitions(model)
+            if created:
+                logger.info(f"Created the partitions: {', '.join(created)}")
+
+
 @shared_task(name="BuffalogsProcessLogsTask")
 def process_logs(start_date=None, end_date=None):
     """Set the datetime range within which the users must be considered and start the detection"""
     ingestion_factory = IngestionFactory()
     ingestion = ingestion_factory.get_ingestion_class()
-    date_ranges = []
     now = timezone.now()
     process_task, _ = TaskSettings.objects.get_or_create(
         task_name=process_logs.__name__,
@@ -56,50 +90,276 @@ def process_logs(start_date=None, end_date=None):
         },
     )
 
-    if start_date and end_date:
-        date_ranges.append((start_date, end_date))
+    manual_run = bool(start_date and end_date)
+    pending_dispatch = None if manual_run else get_pending_dispatch(process_task, now)
+    shards = None
+    if manual_run:
+        date_ranges = plan_time_windows(ingestion, start_date, end_date, keep_remainder=True)
+    elif pending_dispatch:
+        # the windows dispatched by a previous run are still being detected by the shards
+        logger.info(f"The detection of the logins until {pending_dispatch} is still running, nothing to dispatch")
+        return
+    elif expired_windows := get_expired_windows(process_task):
+        # the claim of a previous run has expired (e.g. a shard has failed): the same windows are dispatched again, skipping the completed shards
+        date_ranges = expired_windows
+        # the users are split among the same shards, so the completed ones are still valid
+        shards = process_task.checkpoint.get("shards")
+        logger.warning(f"Dispatching again the detection of the logins until {process_task.checkpoint['dispatched_end_date']}")
     else:
-
-        if (now - process_task.end_date).days < 1:
-            # Recovering old data avoiding task time limit
-            for _ in range(6):
-                start_date = process_task.end_date
-                end_date = start_date + timedelta(minutes=30)
-                if end_date < now:
-                    date_ranges.append((start_date, end_date))
-                    process_task.end_date = end_date
+        start_date = process_task.end_date
+        if settings.CERTEGO_BUFFALOGS_MAX_BACKLOG_DAYS:
+            # opt-in cutoff of the backlog
+            oldest_date = now - timedelta(days=settings.CERTEGO_BUFFALOGS_MAX_BACKLOG_DAYS)
+            if start_date < oldest_date:
+                logger.error(
+                    f"Data lost from {start_date} to {oldest_date}: the logins older than {settings.CERTEGO_BUFFALOGS_MAX_BACKLOG_DAYS} days are skipped"
+                )
+                start_date = oldest_date
+        # Recovering old data avoiding task time limit: the backlog is drained by the next runs, with a windows budget growing with the backlog
+        end_date = now - timedelta(minutes=1)
+        date_ranges = plan_time_windows(ingestion, start_date, end_date, max_windows=get_windows_budget(end_date - start_date))
+        if date_ranges and end_date - date_ranges[-1][1] >= timedelta(minutes=settings.CERTEGO_BUFFALOGS_MIN_WINDOW_MINUTES):
+            logger.warning(f"Backlog of the logins from {date_ranges[-1][1]} to {end_date} left for the next runs")
+
+    shards = shards or get_detection_shards(date_ranges)
+    if date_ranges and shards > 1:
+        # fan-out: the users are detected in parallel by the shard subtasks, and the TaskSettings are updated only when all of them succeed
+        if manual_run:
+            dispatch_detection_shards(ingestion, date_ranges, shards)
+        elif claim_dispatch(process_task, date_ranges, shards):
+            dispatch_detection_shards(ingestion, date_ranges, shards, completed_shards=process_task.checkpoint["completed_shards"])
         else:
-            logger.info(f"Data lost from {process_task.end_date} to now")
-            end_date = now - timedelta(minutes=1)
-            start_date = end_date - timedelta(minutes=30)
-            date_ranges.append((start_date, end_date))
-            process_task.end_date = end_date
+            logger.info("The logins have already been dispatched by a concurrent run")
 
-    if date_ranges:
+    elif date_ranges:
 
         # get the users that logged into the system in those time ranges
         for start_date, end_date in date_ranges:
+            # get the logins grouped by user (with a single query if supported by the ingestion source)
+            for username, user_logins in ingestion.process_logins_bulk(start_date, end_date):
+                detect_user(username, user_logins, ingestion)
+
+            # the window is marked as processed only after all its logins have been detected, so a failed window is processed again by the next run
             process_task.start_date = start_date
             process_task.end_date = end_date
             process_task.save()
 
-            usernames_list = ingestion.process_users(start_date, end_date)
 
-            # for each user returned, get the related logins
-            for username in usernames_list:
-                username = username.lower()
-                user_logins = ingestion.process_user_logins(start_date, end_date, username)
+def detect_user(username: str, user_logins: Iterable[dict], ingestion):
+    """Normalize the logins of the user and start the detection on them
+
+    :param username: the username, as returned by the ingestion source
+    :type username: str
+    :param user_logins: raw logins of the user, sorted by timestamp
+    :type user_logins: Iterable[dict]
+    :param ingestion: the ingestion source object
+    :type ingestion: BaseIngestion
+    """
+    username = username.lower()
+    # the logins are streamed from the ingestion source to the detection, without keeping them all in memory
+    parsed_logins = ingestion.iter_normalized_fields(logins=user_logins)
+    first_login = next(parsed_logins, None)
+
+    # if valid logins have been found, add the user into the DB and start the detection
+    if first_login is None:
+        logger.info(f"Got no actual useful logins for the user {username}")
+        return
+    db_user, created = User.objects.get_or_create(username=username)
+    # Saving user anyway to update updated_at field in order to take track of the recent users seen
+    db_user.save()
+    detection.check_fields(db_user=db_user, fields=chain([first_login], parsed_logins))
+
+
+def get_windows_budget(backlog: timedelta) -> int:
+    """Return the maximum number of time windows processed by a run: CERTEGO_BUFFALOGS_MAX_WINDOWS_PER_RUN, or more if the backlog
+    would need more than CERTEGO_BUFFALOGS_BACKLOG_DRAIN_RUNS runs to be drained with windows of CERTEGO_BUFFALOGS_WINDOW_MINUTES
+
+    :param backlog: the datetime range still to be processed
+    :type backlog: timedelta
+
+    :return: the windows budget of the run
+    :rtype: int
+    """
+    backlog_windows = backlog / timedelta(minutes=settings.CERTEGO_BUFFALOGS_WINDOW_MINUTES)
+    return max(settings.CERTEGO_BUFFALOGS_MAX_WINDOWS_PER_RUN, math.ceil(backlog_windows / settings.CERTEGO_BUFFALOGS_BACKLOG_DRAIN_RUNS))
+
+
+def get_detection_shards(date_ranges: list) -> int:
+    """Return the number of shards among which the users of the windows are split: CERTEGO_BUFFALOGS_DETECTION_SHARDS,
+    or CERTEGO_BUFFALOGS_BACKLOG_SHARDS if the run is catching up a backlog (more than CERTEGO_BUFFALOGS_MAX_WINDOWS_PER_RUN windows)
+    and the Celery result backend, required by the chords, is set
 
-                parsed_logins = ingestion.normalize_fields(logins=user_logins)
+    :param date_ranges: list of (start_date, end_date) to be processed
+    :type date_ranges: list
 
-                logger.info(f"Got {len(parsed_logins)} actual useful logins for the user {username}")
+    :return: the number of shards
+    :rtype: int
+    """
+    if len(date_ranges) > settings.CERTEGO_BUFFALOGS_MAX_WINDOWS_PER_RUN and settings.CELERY_RESULT_BACKEND:
+        return max(settings.CERTEGO_BUFFALOGS_DETECTION_SHARDS, settings.CERTEGO_BUFFALOGS_BACKLOG_SHARDS)
+    return settings.CERTEGO_BUFFALOGS_DETECTION_SHARDS
 
-                # if valid logins have been found, add the user into the DB and start the detection
-                if parsed_logins:
-                    db_user, created = User.objects.get_or_create(username=username)
-                    # Saving user anyway to update updated_at field in order to take track of the recent users seen
-                    db_user.save()
-                    detection.check_fields(db_user=db_user, fields=parsed_logins)
+
+def get_pending_dispatch(process_task: TaskSettings, now: datetime) -> str:
+    """Return the end date (ISO formatted) of the windows dispatched to the detection shards and not completed yet.
+    The claim expires after CERTEGO_BUFFALOGS_DETECTION_LEASE_SECONDS, so the windows are dispatched again if a shard has failed
+
+    :param process_task: the TaskSettings of the process_logs task
+    :type process_task: TaskSettings
+    :param now: the current datetime
+    :type now: datetime
+
+    :return: the end date of the dispatched windows, None if there isn't a pending dispatch
+    :rtype: str
+    """
+    dispatched_at = process_task.checkpoint.get("dispatched_at")
+    if dispatched_at and datetime.fromisoformat(dispatched_at) + timedelta(seconds=settings.CERTEGO_BUFFALOGS_DETECTION_LEASE_SECONDS) > now:
+        return process_task.checkpoint["dispatched_end_date"]
+    return None
+
+
+def get_expired_windows(process_task: TaskSettings) -> list:
+    """Return the windows dispatched to the detection shards under an expired claim and not completed yet
+
+    :param process_task: the TaskSettings of the process_logs task
+    :type process_task: TaskSettings
+
+    :return: list of (start_date, end_date) to be dispatched again
+    :rtype: list
+    """
+    windows = [(datetime.fromisoformat(start_date), datetime.fromisoformat(end_date)) for start_date, end_date in process_task.checkpoint.get("windows", [])]
+    return [(start_date, end_date) for start_date, end_date in windows if end_date > process_task.end_date]
+
+
+def claim_dispatch(process_task: TaskSettings, date_ranges: list, shards: int) -> bool:
+    """Save in the TaskSettings.checkpoint the windows dispatched to the detection shards, before dispatching them,
+    so the next runs don't dispatch them again while the chord is still running. The claim is released by the process_logs_completed callback.
+    The shards completed under an expired claim of the same windows are kept, so they aren't detected again
+
+    :param process_task: the TaskSettings of the process_logs task
+    :type process_task: TaskSettings
+    :param date_ranges: list of (start_date, end_date) to be dispatched
+    :type date_ranges: list
+    :param shards: number of shards among which the users are split
+    :type shards: int
+
+    :return: False if the windows have already been claimed by a concurrent run
+    :rtype: bool
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        locked_task = TaskSettings.objects.select_for_update().get(id=process_task.id)
+        if get_pending_dispatch(locked_task, now):
+            return False
+        locked_task.checkpoint = {
+            "dispatched_end_date": date_ranges[-1][1].isoformat(),
+            "dispatched_at": now.isoformat(),
+            "windows": [[start_date.isoformat(), end_date.isoformat()] for start_date, end_date in date_ranges],
+            "shards": shards,
+            "completed_shards": locked_task.checkpoint.get("completed_shards", []) if locked_task.checkpoint.get("shards") == shards else [],
+        }
+        locked_task.save(update_fields=["checkpoint", "updated"])
+    process_task.checkpoint = locked_task.checkpoint
+    return True
+
+
+def get_user_shard(username: str, shards: int) -> int:
+    """Return the shard of the user, stable across processes (the builtin hash() is salted for each process).
+    All the case variants of a username are in the same shard, because they are saved as the same user
+
+    :param username: the username
+    :type username: str
+    :param shards: number of shards
+    :type shards: int
+
+    :return: the shard number, from 0 to shards-1
+    :rtype: int
+    """
+    return zlib.crc32(username.lower().encode("utf-8")) % shards
+
+
+def dispatch_detection_shards(ingestion, date_ranges: list, shards: int, completed_shards: list = None):
+    """Split the users of each date range in shards and launch a detect_user_batch subtask for each of them.
+    The date ranges are processed in sequence (a chord for each one), so the logins of each user are still detected in order,
+    and the process_logs TaskSettings are advanced by the chord callback, only after all the shards of the range have succeeded.
+    The windows must be claimed with claim_dispatch before, so they aren't dispatched again by the next runs
+
+    :param ingestion: the ingestion source object
+    :type ingestion: BaseIngestion
+    :param date_ranges: list of (start_date, end_date) to be processed
+    :type date_ranges: list
+    :param shards: number of shards
+    :type shards: int
+    :param completed_shards: the shards already detected (see get_shard_key), skipped when the windows are dispatched again.
+        If given, each shard records its completion in the process_logs TaskSettings.checkpoint
+    :type completed_shards: list
+    """
+    ranges_signatures = []
+    for start_date, end_date in date_ranges:
+        shards_users = defaultdict(list)
+        for username in ingestion.process_users(start_date, end_date):
+            shard = get_user_shard(username, shards)
+            if completed_shards is None or get_shard_key(start_date.isoformat(), shard) not in completed_shards:
+                shards_users[shard].append(username)
+        callback = process_logs_completed.si(start_date.isoformat(), end_date.isoformat())
+        if shards_users:
+            logger.info(
+                f"Dispatching the detection of {sum(map(len, shards_users.values()))} users in {len(shards_users)} shards, from {start_date} to {end_date}"
+            )
+            # a list, not a generator: the group would evaluate it lazily, after the loop variables have changed
+            header = group(
+                [
+                    detect_user_batch.si(usernames, start_date.isoformat(), end_date.isoformat(), shard=None if completed_shards is None else shard)
+                    for shard, usernames in shards_users.items()
+                ]
+            )
+            ranges_signatures.append(chord(header, callback))
+        else:
+            ranges_signatures.append(callback)
+    celery_chain(*ranges_signatures).apply_async()
+
+
+def get_shard_key(start_date: str, shard: int) -> str:
+    """Return the key of a shard of a dispatched window, saved in the process_logs TaskSettings.checkpoint when the shard is completed"""
+    return f"{start_date}/{shard}"
+
+
+@shared_task(name="BuffalogsDetectUserBatchTask")
+def detect_user_batch(usernames: list, start_date: str, end_date: str, shard: int = None):
+    """Detection of a shard of users, for the logins in the given datetime range (ISO formatted).
+    If the shard number is given, its completion is recorded in the process_logs TaskSettings.checkpoint,
+    so the shard isn't detected again if the window is dispatched again (e.g. because another shard has failed)"""
+    ingestion = IngestionFactory().get_ingestion_class()
+    # the logins of the users are fetched concurrently, if supported by the ingestion source
+    for username, user_logins in ingestion.process_users_logins(datetime.fromisoformat(start_date), datetime.fromisoformat(end_date), usernames):
+        detect_user(username, user_logins, ingestion)
+    if shard is not None:
+        with transaction.atomic():
+            process_task = TaskSettings.objects.select_for_update().get(task_name=process_logs.__name__)
+            process_task.checkpoint.setdefault("completed_shards", []).append(get_shard_key(start_date, shard))
+            process_task.save(update_fields=["checkpoint", "updated"])
+
+
+@shared_task(name="BuffalogsProcessLogsCompletedTask")
+def process_logs_completed(start_date: str, end_date: str):
+    """Chord callback: all the shards of the datetime range (ISO formatted) have been detected, so the range is marked as processed"""
+    with transaction.atomic():
+        process_task, _ = TaskSettings.objects.select_for_update().get_or_create(
+            task_name=process_logs.__name__,
+            defaults={"start_date": start_date, "end_date": end_date},
+        )
+        process_task.start_date = datetime.fromisoformat(start_date)
+        process_task.end_date = datetime.fromisoformat(end_date)
+        dispatched_end_date = process_task.checkpoint.get("dispatched_end_date")
+        if dispatched_end_date and process_task.end_date >= datetime.fromisoformat(dispatched_end_date):
+            # all the dispatched windows have been detected, so the next run can dispatch the new ones
+            process_task.checkpoint = {}
+        elif "completed_shards" in process_task.checkpoint:
+            # the completed shards of the window aren't needed anymore
+            process_task.checkpoint["completed_shards"] = [
+                shard_key for shard_key in process_task.checkpoint["completed_shards"] if not shard_key.startswith(f"{start_date}/")
+            ]
+        process_task.save()
 
 
 @shared_task(name="NotifyAlertsTask")
@@ -119,8 +379,27 @@ def notify_alerts():
     end_date = task_settings.end_date
 
     active_alerters = AlertFactory().get_alert_classes()
-    for alerter in active_alerters:
-        alerter.notify_alerts(start_date=start_date, end_date=end_date)
+
+    def run_alerter(alerter):
+        # a failing alerter doesn't prevent the others from sending their notifications
+        try:
+            alerter.notify_alerts(start_date=start_date, end_date=end_date)
+        except Exception as e:
+            logger.exception(f"Notification of the alerts by {alerter.__class__.__name__} failed: {e}")
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
+    # the alerters run concurrently, so a slow destination doesn't delay the others
+    max_workers = min(len(active_alerters), settings.CERTEGO_BUFFALOGS_NOTIFY_MAX_WORKERS)
+    if max_workers <= 1:
+        for alerter in active_alerters:
+            run_alerter(alerter)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="notify_alerts") as executor:
+            list(executor.map(run_alerter, active_alerters))
+    for destination, metrics in get_http_metrics().items():
+        logger.info(f"Alerting HTTP connections to {destination}: {metrics['connections']} opened for {metrics['requests']} requests")
 
     # Update task_settings for next execution
     task_settings.start_date = task_settings.end_date
@@ -28,7 +28,7 @@ class TestDiscordAlerting(TestCase):
             login_raw_data={},
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_send_alert(self, mock_post):
         """Test that a properly formed alert is sent via POST"""
         mock_post.return_value = MagicMock(status_code=200)
@@ -53,7 +53,7 @@ class TestDiscordAlerting(TestCase):
             data=json.dumps(expected_payload),
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_no_alerts(self, mock_post):
         """Test that no alerts are sent when there are no alerts to notify"""
         for alert in Alert.objects.all():
@@ -67,7 +67,7 @@ class TestDiscordAlerting(TestCase):
         with self.assertRaises(ValueError):
             DiscordAlerting({})
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_alert_network_failure(self, mock_post):
         """Test that alert is not marked as notified if there are any Network Fails"""
         # Simulate network/API failure
@@ -79,7 +79,7 @@ class TestDiscordAlerting(TestCase):
         alert = Alert.objects.get(pk=self.alert.pk)
         self.assertFalse(alert.notified_status["discord"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_clubbed_alerts(self, mock_post):
         """Test that multiple similar alerts are clubbed into a single notification."""
         now = timezone.now()
@@ -38,6 +38,13 @@ class TestAlertFactory(TestCase):
             self.assertIn("MicrosoftTeamsAlerting", str(active_alerters[0]))
             self.assertIn("TelegramAlerting", str(active_alerters[1]))
 
+    def test_alerters_max_workers(self):
+        config = {**self.config, "telegram": {**self.config["telegram"], "max_workers": 3}}
+        with patch.object(AlertFactory, "_read_config", return_value=config):
+            teams_alerter, telegram_alerter = AlertFactory().get_alert_classes()
+        self.assertEqual(1, teams_alerter.max_workers)
+        self.assertEqual(3, telegram_alerter.max_workers)
+
     def test_send_actual_alert(self):
         with patch.object(AlertFactory, "_read_config", return_value=self.config):
             alert_factory = AlertFactory()
@@ -46,7 +53,7 @@ class TestAlertFactory(TestCase):
                 # This will again set the notified status to True
                 alerter.notify_alerts()
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_send_mock_alert(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -25,7 +25,7 @@ class TestGoogleChatAlerting(TestCase):
             name="Imp Travel", user=cls.user, notified_status={"googlechat": False}, description="Impossible travel detected", login_raw_data={}
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_send_alert(self, mock_post):
         """Doesn't actually sends the Alert,a mock request is sent"""
         mock_response = MagicMock()
@@ -50,7 +50,7 @@ class TestGoogleChatAlerting(TestCase):
             json=expected_payload,
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_no_alerts(self, mock_post):
         """Test that no alerts are sent when there are no alerts to notify"""
         for alert in Alert.objects.all():
@@ -64,7 +64,7 @@ class TestGoogleChatAlerting(TestCase):
         with self.assertRaises(ValueError):
             GoogleChatAlerting({})
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_alert_network_failure(self, mock_post):
         """Test that alert is not marked as notified if there are any Network Fails"""
         # Simulate network/API failure
@@ -76,7 +76,7 @@ class TestGoogleChatAlerting(TestCase):
         alert = Alert.objects.get(pk=self.alert.pk)
         self.assertFalse(alert.notified_status["googlechat"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_clubbed_alerts(self, mock_post):
         """Test that multiple similar alerts are clubbed into a single notification."""
         now = timezone.now()
@@ -25,7 +25,7 @@ class TestPushoverAlerting(TestCase):
             name="Imp Travel", user=cls.user, notified_status={"pushover": False}, description="Impossible travel detected", login_raw_data={}
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_send_alert(self, mock_post):
         """Doesn't actually sends the Alert,a mock request is sent"""
         mock_response = MagicMock()
@@ -40,7 +40,7 @@ class TestPushoverAlerting(TestCase):
 
         mock_post.assert_called_once_with("https://api.pushover.net/1/messages.json", data=expected_payload)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_no_alerts(self, mock_post):
         """Test that no alerts are sent when there are no alerts to notify"""
         for alert in Alert.objects.all():
@@ -54,7 +54,7 @@ class TestPushoverAlerting(TestCase):
         with self.assertRaises(ValueError):
             PushoverAlerting({})
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_alert_network_failure(self, mock_post):
         """Test that alert is not marked as notified if there are any Network Fails"""
         # Simulate network/API failure
@@ -66,7 +66,7 @@ class TestPushoverAlerting(TestCase):
         alert = Alert.objects.get(pk=self.alert.pk)
         self.assertFalse(alert.notified_status["pushover"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_clubbed_alerts(self, mock_post):
         """Test that multiple similar alerts are clubbed into a single notification."""
         now = timezone.now()
@@ -25,7 +25,7 @@ class TestRocketChatAlerting(TestCase):
             name="Imp Travel", user=cls.user, notified_status={"rocketchat": False}, description="Impossible travel detected", login_raw_data={}
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_send_alert(self, mock_post):
         """Doesn't actually sends the Alert,a mock request is sent"""
         mock_response = MagicMock()
@@ -47,7 +47,7 @@ class TestRocketChatAlerting(TestCase):
             data=expected_payload,
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_no_alerts(self, mock_post):
         """Test that no alerts are sent when there are no alerts to notify"""
         for alert in Alert.objects.all():
@@ -61,7 +61,7 @@ class TestRocketChatAlerting(TestCase):
         with self.assertRaises(ValueError):
             RocketChatAlerting({})
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_alert_network_failure(self, mock_post):
         """Test that alert is not marked as notified if there are any Network Fails"""
         # Simulate network/API failure
@@ -73,7 +73,7 @@ class TestRocketChatAlerting(TestCase):
         alert = Alert.objects.get(pk=self.alert.pk)
         self.assertFalse(alert.notified_status["rocketchat"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_clubbed_alerts(self, mock_post):
         """Test that multiple similar alerts are clubbed into a single notification."""
         now = timezone.now()
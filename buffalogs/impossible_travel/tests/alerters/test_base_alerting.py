@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from impossible_travel.alerting.base_alerting import BaseAlerting, get_template_environment
+from impossible_travel.alerting.dummy_alerting import DummyAlerting
+from impossible_travel.models import Alert, User
+
+
+class TestBaseAlerting(TestCase):
+    """Test the formatting of the alerts messages."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="testuser")
+        cls.alert = Alert.objects.create(name="Imp Travel", user=cls.user, description="Impossible travel detected", login_raw_data={})
+
+    def setUp(self):
+        self.config_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.config_path, "buffalogs"))
+        self.template_file = os.path.join(self.config_path, "buffalogs", "alert_template.jinja")
+        self.write_template("Title", 1_700_000_000)
+        self.addCleanup(shutil.rmtree, self.config_path)
+        self.addCleanup(get_template_environment.cache_clear)
+
+    def write_template(self, title: str, mtime: int):
+        with open(self.template_file, mode="w", encoding="utf-8") as f:
+            f.write(
+                f"{{% macro title(alert) %}}{title}: {{{{ alert.name }}}}{{% endmacro %}}{{% macro description(alert) %}}{{{{ alert.description }}}}{{% endmacro %}}"
+            )
+        os.utime(self.template_file, (mtime, mtime))
+
+    def test_alert_message_formatter(self):
+        with override_settings(CERTEGO_BUFFALOGS_CONFIG_PATH=self.config_path):
+            self.assertEqual(("Title: Imp Travel", "Impossible travel detected"), BaseAlerting.alert_message_formatter(self.alert))
+            env = get_template_environment(os.path.join(self.config_path, "buffalogs/"), None)
+            template = env.get_template("alert_template.jinja")
+            # the environment and the compiled template are reused
+            BaseAlerting.alert_message_formatter(self.alert)
+            self.assertIs(env, get_template_environment(os.path.join(self.config_path, "buffalogs/"), None))
+            self.assertIs(template, env.get_template("alert_template.jinja"))
+            # the template is compiled again when its file is modified
+            self.write_template("New title", 1_700_000_100)
+            self.assertEqual(("New title: Imp Travel", "Impossible travel detected"), BaseAlerting.alert_message_formatter(self.alert))
+
+    def test_bytecode_cache(self):
+        cache_path = os.path.join(self.config_path, "bytecode")
+        with override_settings(CERTEGO_BUFFALOGS_CONFIG_PATH=self.config_path, CERTEGO_BUFFALOGS_TEMPLATES_BYTECODE_CACHE_PATH=cache_path):
+            self.assertEqual(("Title: Imp Travel", "Impossible travel detected"), BaseAlerting.alert_message_formatter(self.alert))
+        self.assertEqual(1, len(os.listdir(cache_path)))
+
+    @patch("impossible_travel.alerting.base_alerting.MARK_NOTIFIED_BATCH_SIZE", 2)
+    def test_mark_notified(self):
+        alerts = [self.alert] + [
+            Alert.objects.create(name="Imp Travel", user=self.user, description="Impossible travel detected", login_raw_data={}) for _ in range(2)
+        ]
+        # for each batch of 2 alerts: an UPDATE of the alerts and one of their deliveries, in a transaction (a savepoint in the tests)
+        with self.assertNumQueries(8):
+            BaseAlerting.mark_notified(alerts, "slack")
+        self.assertTrue(all(alert.notified_status == {"slack": True} for alert in alerts))
+        self.assertEqual(3, Alert.objects.filter(notified_status__slack=True).count())
+
+    def test_run_concurrently(self):
+        alerter = DummyAlerting({})
+        alerter.max_workers = 2
+        # each message waits for the other one, so they are sent only if they run concurrently
+        barrier = threading.Barrier(2, timeout=10)
+        sent = []
+
+        def send(item):
+            barrier.wait()
+            sent.append(item)
+
+        alerter.run_concurrently(send, ["first", "second"])
+        self.assertListEqual(["first", "second"], sorted(sent))
+
+    def test_run_concurrently_sequential(self):
+        alerter = DummyAlerting({})
+        self.assertEqual(1, alerter.max_workers)
+        sent = []
+        alerter.run_concurrently(lambda item: sent.append((item, threading.current_thread())), ["first", "second"])
+        self.assertListEqual([("first", threading.main_thread()), ("second", threading.main_thread())], sent)
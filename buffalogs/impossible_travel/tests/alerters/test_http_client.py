@@ -0,0 +1,53 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import requests
+from django.test import SimpleTestCase, override_settings
+from impossible_travel.alerting import http_client
+from impossible_travel.alerting.base_alerting import BaseAlerting
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHTTPClient(SimpleTestCase):
+    def setUp(self):
+        http_client.close_http_sessions()
+        self.addCleanup(http_client.close_http_sessions)
+
+    def test_get_http_session(self):
+        session = http_client.get_http_session("https://hooks.slack.com/services/T000/B000/XXX")
+        self.assertIs(session, http_client.get_http_session("https://hooks.slack.com/services/T111/B111/YYY"))
+        self.assertIsNot(session, http_client.get_http_session("https://discord.com/api/webhooks/WEBHOOK"))
+
+    @override_settings(CERTEGO_BUFFALOGS_ALERTING_HTTP_TIMEOUT=2.5)
+    @patch("requests.adapters.HTTPAdapter.send")
+    def test_default_timeout(self, mock_send):
+        mock_send.return_value = requests.Response()
+        BaseAlerting.http_post("https://example.com/hook", json={})
+        self.assertEqual(2.5, mock_send.call_args.kwargs["timeout"])
+        BaseAlerting.http_post("https://example.com/hook", json={}, timeout=1)
+        self.assertEqual(1, mock_send.call_args.kwargs["timeout"])
+
+    def test_connection_reuse(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_port}/hook"
+        for _ in range(3):
+            self.assertTrue(BaseAlerting.http_post(url, json={"text": "alert"}).ok)
+        # the 3 requests are sent on the same kept-alive connection
+        self.assertDictEqual({"connections": 1, "requests": 3}, http_client.get_http_metrics()[f"http://127.0.0.1:{server.server_port}"])
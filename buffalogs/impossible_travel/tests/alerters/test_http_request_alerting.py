@@ -180,7 +180,7 @@ class TestHTTPRequestAlerting(TestCase):
         self.assertTrue(len(expected_output) == len(serialized))
         self.assertTrue(all(expected == data for data, expected in zip(serialized, expected_output)))
 
-    @mock.patch("requests.post", side_effect=mocked_requests_post_success)
+    @mock.patch("requests.Session.post", side_effect=mocked_requests_post_success)
     def test_alert_marked_as_notified(self, mock_request):
         """Test that alert are marked as notified."""
         test_endpoint = "http://localhost:5000/alert"
@@ -209,10 +209,31 @@ class TestHTTPRequestAlerting(TestCase):
         alert1 = Alert.objects.get(pk=alert1.pk)
         alert2 = Alert.objects.get(pk=alert2.pk)
 
-        self.assertTrue(alert1.notified_status["http_request"])
-        self.assertTrue(alert2.notified_status["http_request"])
+        self.assertTrue(alert1.notified_status["http_request:test_service"])
+        self.assertTrue(alert2.notified_status["http_request:test_service"])
 
-    @mock.patch("requests.post", side_effect=mocked_request_post_failure)
+    @mock.patch("requests.Session.post", side_effect=mocked_requests_post_success)
+    def test_notify_recipients(self, mock_request):
+        """Test that each recipient receives all the alerts, with its own deliveries in the outbox."""
+        alert = Alert.objects.create(
+            name="New Device",
+            user=self.user,
+            login_raw_data={"lat": 40.7128, "lon": -74.0060},
+            description="test alert",
+            notified_status={"http_request": False},
+        )
+        other_config = {**self.config, "name": "other_service", "endpoint": "http://127.0.0.1:8001"}
+        HTTPRequestAlerting(self.config).notify_alerts()
+        HTTPRequestAlerting(other_config).notify_alerts()
+        self.assertListEqual(["http://127.0.0.1:8000", "http://127.0.0.1:8001"], [call.args[0] for call in mock_request.call_args_list])
+        alert.refresh_from_db()
+        self.assertTrue(alert.notified_status["http_request:test_service"])
+        self.assertTrue(alert.notified_status["http_request:other_service"])
+        # the alerts already notified aren't sent again to the recipient
+        HTTPRequestAlerting(self.config).notify_alerts()
+        self.assertEqual(2, mock_request.call_count)
+
+    @mock.patch("requests.Session.post", side_effect=mocked_request_post_failure)
     def test_alerts_are_not_marked_as_notified_for_failed_request(self, mock_request):
 
         test_endpoint = "http://localhost:5000/alert"
@@ -288,8 +309,8 @@ class TestHTTPRequestAlerting(TestCase):
         alert1 = Alert.objects.get(pk=alert1)
         alert2 = Alert.objects.get(pk=alert2)
 
-        self.assertTrue(alert1.notified_status["http_request"])
-        self.assertTrue(alert2.notified_status["http_request"])
+        self.assertTrue(alert1.notified_status["http_request:test_service"])
+        self.assertTrue(alert2.notified_status["http_request:test_service"])
 
     @classmethod
     def tearDownClass(cls):
@@ -0,0 +1,139 @@
+import threading
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from impossible_travel.alerting.base_alerting import BaseAlerting
+from impossible_travel.constants import NotificationDeliveryStatus
+from impossible_travel.models import Alert, NotificationDelivery, User
+
+
+class TestNotificationOutbox(TestCase):
+    """Test the claim of the alerts to be notified from the NotificationDelivery outbox."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="testuser")
+        cls.alerts = [
+            Alert.objects.create(name="Imp Travel", user=cls.user, description="Impossible travel detected", login_raw_data={}, notified_status=status)
+            for status in ({}, {"slack": False}, {"slack": True}, {"email": False})
+        ]
+
+    def test_get_alerts_to_notify(self):
+        alerts = BaseAlerting.get_alerts_to_notify("slack")
+        # the alert already notified by the alerter isn't added to the outbox
+        self.assertListEqual([self.alerts[0], self.alerts[1], self.alerts[3]], alerts)
+        self.assertEqual(3, NotificationDelivery.objects.filter(alerter="slack", attempts=1).count())
+        # the claimed alerts aren't returned again, until the lease expires
+        self.assertListEqual([], BaseAlerting.get_alerts_to_notify("slack"))
+        new_alert = Alert.objects.create(name="Imp Travel", user=self.user, description="Impossible travel detected", login_raw_data={})
+        self.assertListEqual([new_alert], BaseAlerting.get_alerts_to_notify("slack"))
+        NotificationDelivery.objects.filter(alerter="slack").update(next_attempt_at=timezone.now())
+        self.assertEqual(4, len(BaseAlerting.get_alerts_to_notify("slack")))
+
+    def test_get_alerts_to_notify_late_commit(self):
+        # the delivery of an alert with a greater id was added before the other alerts were committed
+        NotificationDelivery.objects.create(alert=self.alerts[3], alerter="slack")
+        self.assertListEqual([self.alerts[0], self.alerts[1], self.alerts[3]], BaseAlerting.get_alerts_to_notify("slack"))
+        self.assertEqual(3, NotificationDelivery.objects.filter(alerter="slack").count())
+
+    @override_settings(CERTEGO_BUFFALOGS_NOTIFY_LOOKBACK_SECONDS=3600)
+    def test_get_alerts_to_notify_watermark(self):
+        BaseAlerting.get_alerts_to_notify("slack")
+        # the alerts created before the last enqueue (minus the lookback) aren't checked again
+        old_alert = Alert.objects.create(name="Imp Travel", user=self.user, description="Impossible travel detected", login_raw_data={})
+        late_alert = Alert.objects.create(name="Imp Travel", user=self.user, description="Impossible travel detected", login_raw_data={})
+        Alert.objects.filter(id=old_alert.id).update(created=timezone.now() - timedelta(hours=2))
+        Alert.objects.filter(id=late_alert.id).update(created=timezone.now() - timedelta(minutes=30))
+        self.assertListEqual([late_alert], BaseAlerting.get_alerts_to_notify("slack"))
+        # the older alerts are added when the range is given
+        self.assertListEqual([old_alert], BaseAlerting.get_alerts_to_notify("slack", timezone.now() - timedelta(hours=3), timezone.now()))
+
+    def test_get_alerts_to_notify_range(self):
+        start_date = timezone.now() - timedelta(minutes=30)
+        Alert.objects.filter(id=self.alerts[0].id).update(created=start_date - timedelta(hours=2))
+        alerts = BaseAlerting.get_alerts_to_notify("slack", start_date, timezone.now())
+        self.assertListEqual([self.alerts[1], self.alerts[3]], alerts)
+
+    @override_settings(CERTEGO_BUFFALOGS_NOTIFY_BATCH_SIZE=2)
+    def test_get_alerts_to_notify_batch(self):
+        self.assertEqual(2, len(BaseAlerting.get_alerts_to_notify("slack")))
+        self.assertEqual(1, len(BaseAlerting.get_alerts_to_notify("slack")))
+
+    def test_mark_notified(self):
+        alerts = BaseAlerting.get_alerts_to_notify("slack")
+        BaseAlerting.mark_notified(alerts[:2], "slack")
+        self.assertDictEqual(
+            {
+                self.alerts[0].id: NotificationDeliveryStatus.SENT,
+                self.alerts[1].id: NotificationDeliveryStatus.SENT,
+                self.alerts[3].id: NotificationDeliveryStatus.PENDING,
+            },
+            dict(NotificationDelivery.objects.values_list("alert_id", "status")),
+        )
+
+    @override_settings(CERTEGO_BUFFALOGS_NOTIFY_MAX_ATTEMPTS=2, CERTEGO_BUFFALOGS_NOTIFY_RETRY_SECONDS=60)
+    def test_mark_failed(self):
+        alert = self.alerts[0]
+        BaseAlerting.get_alerts_to_notify("slack")
+        BaseAlerting.mark_failed([alert], "slack", ConnectionError("endpoint unreachable"))
+        delivery = NotificationDelivery.objects.get(alert=alert, alerter="slack")
+        self.assertEqual(NotificationDeliveryStatus.PENDING, delivery.status)
+        self.assertEqual("endpoint unreachable", delivery.last_error)
+        self.assertAlmostEqual(timezone.now() + timedelta(seconds=60), delivery.next_attempt_at, delta=timedelta(seconds=5))
+        # the alert is sent again when the retry is due, and marked as failed after the maximum number of attempts
+        NotificationDelivery.objects.filter(id=delivery.id).update(next_attempt_at=timezone.now())
+        self.assertIn(alert, BaseAlerting.get_alerts_to_notify("slack"))
+        BaseAlerting.mark_failed([alert], "slack", "status: 500")
+        delivery.refresh_from_db()
+        self.assertEqual(NotificationDeliveryStatus.FAILED, delivery.status)
+        self.assertEqual("status: 500", delivery.last_error)
+        self.assertFalse(Alert.objects.get(id=alert.id).notified_status.get("slack"))
+
+    @override_settings(CERTEGO_BUFFALOGS_NOTIFY_MAX_ATTEMPTS=2)
+    def test_get_alerts_to_notify_lease_expired(self):
+        # the alerter raises an unexpected error, so the claimed deliveries are never marked
+        self.assertEqual(3, len(BaseAlerting.get_alerts_to_notify("slack")))
+        NotificationDelivery.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(3, len(BaseAlerting.get_alerts_to_notify("slack")))
+        NotificationDelivery.objects.update(next_attempt_at=timezone.now())
+        # the deliveries aren't claimed after the maximum number of attempts
+        with self.assertLogs("impossible_travel.alerting.base_alerting", level="WARNING"):
+            self.assertListEqual([], BaseAlerting.get_alerts_to_notify("slack"))
+        self.assertListEqual(
+            [(NotificationDeliveryStatus.FAILED, 2, "Not sent within the lease of the last attempt")] * 3,
+            list(NotificationDelivery.objects.values_list("status", "attempts", "last_error")),
+        )
+        self.assertListEqual([], BaseAlerting.get_alerts_to_notify("slack"))
+
+
+class TestNotificationOutboxConcurrency(TransactionTestCase):
+    """Test that the concurrent workers claim different alerts."""
+
+    def test_skip_locked(self):
+        user = User.objects.create(username="testuser")
+        alerts = [Alert.objects.create(name="Imp Travel", user=user, description="Impossible travel detected", login_raw_data={}) for _ in range(3)]
+        BaseAlerting.get_alerts_to_notify("slack")
+        NotificationDelivery.objects.update(next_attempt_at=timezone.now())
+        locked, release = threading.Event(), threading.Event()
+
+        def other_worker():
+            # another worker is still claiming the delivery of the first alert
+            try:
+                with transaction.atomic():
+                    NotificationDelivery.objects.select_for_update().filter(alert=alerts[0]).first()
+                    locked.set()
+                    release.wait(timeout=10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        self.assertTrue(locked.wait(timeout=10))
+        try:
+            # the locked delivery is skipped instead of waiting for it
+            self.assertListEqual(alerts[1:], BaseAlerting.get_alerts_to_notify("slack"))
+        finally:
+            release.set()
+            thread.join()
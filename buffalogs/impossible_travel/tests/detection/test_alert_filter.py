@@ -1,5 +1,5 @@
 from datetime import datetime, timezone
-from unittest.mock import patch
+from ipaddress import IPv4Address
 
 from django.conf import settings
 from django.test import TestCase
@@ -495,8 +495,7 @@ class TestAlertFilter(TestCase):
         db_alert.login_raw_data["agent"] = none_agent
         alert_filter.match_filters(alert=db_alert, app_config=db_config)
 
-    @patch("impossible_travel.modules.detection.update_risk_level")
-    def test_match_filters_ignored_impossible_travel_all_same_country(self, mock_update_risk_level):
+    def test_match_filters_ignored_impossible_travel_all_same_country(self):
         # test with ignored_impossible_travel_all_same_country = True
         db_config = Config.objects.create(
             ignored_impossible_travel_all_same_country=True,
@@ -528,10 +527,8 @@ class TestAlertFilter(TestCase):
         alert_filter.match_filters(alert=db_alert, app_config=db_config)
         self.assertTrue(db_alert.is_filtered)
         self.assertListEqual(["ignored_all_same_country"], db_alert.filter_type)
-        mock_update_risk_level.assert_not_called()
 
-    @patch("impossible_travel.modules.detection.update_risk_level")
-    def test_match_filters_ignored_country_couple(self, mock_update_risk_level):
+    def test_match_filters_ignored_country_couple(self):
         # test with ignored_country_couple = [["Germany", "Italy"], ["Romania", "Romania"]]
         db_config = Config.objects.create(
             ignored_impossible_travel_all_same_country=False,
@@ -608,10 +605,8 @@ class TestAlertFilter(TestCase):
         alert_filter.match_filters(alert=db_alert4, app_config=db_config)
         self.assertTrue(db_alert4.is_filtered)
         self.assertListEqual(["ignored_country_couple"], db_alert4.filter_type)
-        mock_update_risk_level.assert_not_called()
 
-    @patch("impossible_travel.modules.detection.update_risk_level")
-    def test_match_filters_user_learning_period(self, mock_update_risk_level):
+    def test_match_filters_user_learning_period(self):
         # test default value (14 days) as user behavior learning period
         db_config = Config.objects.create()
         self.assertEqual(14, db_config.user_learning_period)
@@ -620,5 +615,76 @@ class TestAlertFilter(TestCase):
         alert_filter.match_filters(alert=db_alert, app_config=db_config)
         self.assertTrue(db_alert.is_filtered)
         self.assertListEqual(["user_learning_period"], db_alert.filter_type)
-        # check that if the alert is filtered, the mock_update_risk_level function is not called
-        mock_update_risk_level.assert_not_called()
+
+    def test_match_filters_ignored_networks(self):
+        # the ignored_ips networks (CIDR notation) filter all the IPs inside them
+        db_config = Config.objects.create(
+            id=1,
+            ignored_ips=["1.2.0.0/16", "10.0.0.1"],
+            alert_minimum_risk_score=UserRiskScoreType.NO_RISK,
+            filtered_alerts_types=[],
+            ignore_mobile_logins=False,
+            allowed_countries=[],
+        )
+        db_alert1 = Alert.objects.get(user__username="Lorena Goldoni")
+        alert_filter.match_filters(alert=db_alert1, app_config=db_config)
+        self.assertListEqual([AlertFilterType.IGNORED_IP_FILTER], db_alert1.filter_type)
+        db_alert2 = Alert.objects.get(user__username="Lorygold")
+        alert_filter.match_filters(alert=db_alert2, app_config=db_config)
+        self.assertListEqual([], db_alert2.filter_type)
+
+    def test_compiled_filter_set(self):
+        db_config = Config.objects.create(
+            id=1,
+            ignored_users=["Lorena Goldoni", r"^[\w.-]+@stores\.company\.com$", "a+b", "(?i)^admin", r"^(\w+)\.\1$", r"^(?P<name>\w+)-(?P=name)$"],
+            ignored_ips=["192.0.2.0/25", "192.0.2.64/26", "192.0.2.200", "2001:db8::/32", "not an ip"],
+            ignored_impossible_travel_countries_couples=[["Italy", "Germany"]],
+        )
+        filter_set = alert_filter.CompiledFilterSet(db_config)
+        # users: exact values and patterns (the exact value "a+b" doesn't match its own regex)
+        self.assertTrue(filter_set.is_ignored_user("Lorena Goldoni"))
+        self.assertTrue(filter_set.is_ignored_user("store.user@stores.company.com"))
+        self.assertTrue(filter_set.is_ignored_user("a+b"))
+        self.assertTrue(filter_set.is_ignored_user("aab"))
+        self.assertTrue(filter_set.is_ignored_user("ADMIN_1"))
+        self.assertFalse(filter_set.is_ignored_user("Lorygold"))
+        # the backreferences of the patterns with groups still work
+        self.assertTrue(filter_set.is_ignored_user("test.test"))
+        self.assertTrue(filter_set.is_ignored_user("test-test"))
+        self.assertFalse(filter_set.is_ignored_user("test.other"))
+        self.assertFalse(filter_set.is_ignored_user("test-other"))
+        self.assertFalse(filter_set.has_enabled_users())
+        # IPs: overlapping networks are merged, IPv4 and IPv6 are checked separately
+        self.assertEqual(
+            [[int(IPv4Address("192.0.2.0")), int(IPv4Address("192.0.2.200"))], [int(IPv4Address("192.0.2.127")), int(IPv4Address("192.0.2.200"))]],
+            list(map(list, filter_set.ignored_networks[4])),
+        )
+        self.assertTrue(filter_set.is_ignored_ip("192.0.2.100"))
+        self.assertTrue(filter_set.is_ignored_ip("192.0.2.200"))
+        self.assertFalse(filter_set.is_ignored_ip("192.0.2.128"))
+        self.assertFalse(filter_set.is_ignored_ip("192.0.1.255"))
+        self.assertTrue(filter_set.is_ignored_ip("2001:db8::1"))
+        self.assertFalse(filter_set.is_ignored_ip("::ffff:c000:264"))
+        self.assertTrue(filter_set.is_ignored_ip("not an ip"))
+        self.assertFalse(filter_set.is_ignored_ip(""))
+        self.assertTrue(filter_set.is_ignored_countries_couple("Germany", "Italy"))
+        self.assertFalse(filter_set.is_ignored_countries_couple("Germany", "France"))
+
+    def test_get_filter_set_cache(self):
+        # the filters are compiled again only when the filter fields of the Config change
+        db_config = Config.objects.create(id=1, ignored_ips=["192.0.2.1"])
+        filter_set = alert_filter.get_filter_set(db_config)
+        self.assertIs(filter_set, alert_filter.get_filter_set(Config.objects.get(id=1)))
+        db_config.ignored_ips = ["192.0.2.2"]
+        db_config.save()
+        new_filter_set = alert_filter.get_filter_set(Config.objects.get(id=1))
+        self.assertIsNot(filter_set, new_filter_set)
+        self.assertTrue(new_filter_set.is_ignored_ip("192.0.2.2"))
+        self.assertFalse(new_filter_set.is_ignored_ip("192.0.2.1"))
+        # the unsaved changes are applied as well
+        db_config.ignored_ips = ["192.0.2.3"]
+        unsaved_filter_set = alert_filter.get_filter_set(db_config)
+        self.assertTrue(unsaved_filter_set.is_ignored_ip("192.0.2.3"))
+        # the other fields don't invalidate the cache
+        db_config.threshold_user_risk_alert = "High"
+        self.assertIs(unsaved_filter_set, alert_filter.get_filter_set(db_config))
@@ -0,0 +1,87 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from impossible_travel.constants import AlertDetectionType
+from impossible_travel.models import Config
+from impossible_travel.modules import alert_filter
+from impossible_travel.modules.app_config import ConfigSnapshot, get_app_config, invalidate_app_config
+
+
+@override_settings(CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS=60)
+class TestAppConfig(TestCase):
+
+    def setUp(self):
+        self.app_config = Config.objects.create(
+            id=1,
+            ignored_users=["admin", r"^svc-.*$"],
+            vip_users=["Lorena Goldoni"],
+            ignored_ips=["192.0.2.1", "198.51.100.0/24"],
+            ignored_impossible_travel_countries_couples=[["Italy", "Germany"]],
+            risk_score_increment_alerts=[AlertDetectionType.NEW_DEVICE, AlertDetectionType.IMP_TRAVEL],
+        )
+
+    def tearDown(self):
+        invalidate_app_config()
+
+    def test_snapshot(self):
+        snapshot = get_app_config()
+        self.assertIsInstance(snapshot, ConfigSnapshot)
+        self.assertEqual(1, snapshot.pk)
+        self.assertEqual(self.app_config.updated, snapshot.updated)
+        self.assertEqual(self.app_config.distance_accepted, snapshot.distance_accepted)
+        # lists converted to frozensets
+        self.assertEqual(frozenset(["Lorena Goldoni"]), snapshot.vip_users)
+        self.assertEqual(frozenset([AlertDetectionType.NEW_DEVICE, AlertDetectionType.IMP_TRAVEL]), snapshot.risk_score_increment_alerts)
+        self.assertEqual((("Italy", "Germany"),), snapshot.ignored_impossible_travel_countries_couples)
+        # filters already compiled
+        self.assertIs(snapshot.filter_set, alert_filter.get_filter_set(snapshot))
+        self.assertTrue(snapshot.filter_set.is_ignored_user("svc-backup"))
+        self.assertTrue(snapshot.filter_set.is_ignored_ip("198.51.100.7"))
+        self.assertTrue(snapshot.filter_set.is_ignored_countries_couple("Germany", "Italy"))
+
+    def test_snapshot_read_only(self):
+        snapshot = get_app_config()
+        with self.assertRaises(AttributeError):
+            snapshot.distance_accepted = 1
+        with self.assertRaises(AttributeError):
+            del snapshot.vip_users
+
+    def test_cached(self):
+        snapshot = get_app_config()
+        # within CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS, the snapshot is returned without queries
+        with self.assertNumQueries(0):
+            self.assertIs(snapshot, get_app_config())
+
+    def test_check_not_changed(self):
+        snapshot = get_app_config()
+        # after CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS, only the Config.updated field is read again
+        with patch("impossible_travel.modules.app_config.time.monotonic", return_value=10**9):
+            with self.assertNumQueries(1):
+                self.assertIs(snapshot, get_app_config())
+
+    def test_check_changed(self):
+        snapshot = get_app_config()
+        # Config changed by another process (without the post_save signal)
+        Config.objects.filter(id=1).update(distance_accepted=50, updated=self.app_config.updated.replace(year=2100))
+        self.assertIs(snapshot, get_app_config())
+        with patch("impossible_travel.modules.app_config.time.monotonic", return_value=10**9):
+            new_snapshot = get_app_config()
+        self.assertIsNot(snapshot, new_snapshot)
+        self.assertEqual(50, new_snapshot.distance_accepted)
+
+    def test_invalidated_on_save(self):
+        snapshot = get_app_config()
+        self.app_config.vip_users = ["Lorygold"]
+        self.app_config.save()
+        new_snapshot = get_app_config()
+        self.assertIsNot(snapshot, new_snapshot)
+        self.assertEqual(frozenset(["Lorygold"]), new_snapshot.vip_users)
+        self.assertFalse(new_snapshot.filter_set.vip_users == snapshot.filter_set.vip_users)
+
+    def test_invalidated_on_delete(self):
+        get_app_config()
+        Config.objects.all().delete()
+        # the Config is created again with the default values
+        snapshot = get_app_config()
+        self.assertTrue(Config.objects.filter(id=1).exists())
+        self.assertEqual(frozenset(), snapshot.vip_users)
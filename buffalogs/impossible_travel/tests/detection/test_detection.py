@@ -1,5 +1,4 @@
 import datetime
-from unittest.mock import patch
 
 from django.core.management import call_command
 from django.db.models import Count, Q
@@ -8,6 +7,7 @@ from django.utils import timezone
 from impossible_travel.constants import AlertDetectionType, AlertFilterType
 from impossible_travel.models import Alert, Config, Login, User, UsersIP
 from impossible_travel.modules import detection
+from impossible_travel.modules.detection_context import DetectionContext
 from impossible_travel.tests.utils import load_test_data
 
 
@@ -125,7 +125,9 @@ class DetectionTestCase(TestCase):
             "agent": "Mozilla/5.0 (X11;U; Linux i686; en-GB; rv:1.9.1) Gecko/20090624 Ubuntu/9.04 (jaunty) Firefox/3.5",
             "timestamp": new_time,
         }
-        detection.update_model(user_obj, new_login_fields)
+        context = DetectionContext(user_obj)
+        detection.update_model(user_obj, new_login_fields, context=context)
+        context.flush()
         new_login_db = Login.objects.get(user=user_obj, event_id="test2")
         # Index, country and user_agent fields must not change
         self.assertEqual(new_login_db.index, old_login.index)
@@ -151,7 +153,9 @@ class DetectionTestCase(TestCase):
             "agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Ubuntu Chromium/78.0.3904.108 Chrome/78.0.3904.108 Safari/537.36",
             "timestamp": new_time,
         }
-        detection.add_new_login(user_obj, new_login_fields)
+        context = DetectionContext(user_obj)
+        detection.add_new_login(user_obj, new_login_fields, context=context)
+        context.flush()
         self.assertTrue(Login.objects.filter(user=user_obj, event_id=new_login_fields["id"]).exists())
         new_login = Login.objects.get(user=user_obj, event_id=new_login_fields["id"])
         self.assertEqual(new_login.index, new_login_fields["index"])
@@ -173,13 +177,13 @@ class DetectionTestCase(TestCase):
             "country": "Italy",
             "user_agent": "Mozilla/5.0 (X11; U; Linux i686; es-AR; rv:1.9.1.8) Gecko/20100214 Ubuntu/9.10 (karmic) Firefox/3.5.8",
         }
-        self.assertDictEqual({}, detection.check_country(db_user, last_login_user_fields, db_config))
+        self.assertDictEqual({}, detection.check_country(db_user, last_login_user_fields, db_config, context=DetectionContext(db_user)))
 
     def test_check_country_new_country_alert(self):
         # testing function check_country with "New Country" alert
         db_config = Config.objects.get(id=1)
         db_user = User.objects.get(username="Lorena Goldoni")
-        alert_result = detection.check_country(db_user, self.raw_data_NEW_COUNTRY, db_config)
+        alert_result = detection.check_country(db_user, self.raw_data_NEW_COUNTRY, db_config, context=DetectionContext(db_user))
         self.assertEqual("New Country", alert_result["alert_name"])
         self.assertEqual(AlertDetectionType.NEW_COUNTRY.value, alert_result["alert_name"])
         self.assertEqual("Login from new country for User: Lorena Goldoni, at: 2025-02-13T09:16:25.000Z, from: India", alert_result["alert_desc"])
@@ -195,7 +199,7 @@ class DetectionTestCase(TestCase):
             "country": "Germany",
             "user_agent": "Mozilla/5.0 (X11; U; Linux i686; es-AR; rv:1.9.1.8) Gecko/20100214 Ubuntu/9.10 (karmic) Firefox/3.5.8",
         }
-        alert_result = detection.check_country(db_user, last_login_user_fields, db_config)
+        alert_result = detection.check_country(db_user, last_login_user_fields, db_config, context=DetectionContext(db_user))
         self.assertEqual("Atypical Country", alert_result["alert_name"])
         self.assertEqual(AlertDetectionType.ATYPICAL_COUNTRY.value, alert_result["alert_name"])
         self.assertEqual("Login from an atypical country for User: Lorena Goldoni, at: 2025-02-26T17:10:33.358Z, from: Germany", alert_result["alert_desc"])
@@ -219,7 +223,7 @@ class DetectionTestCase(TestCase):
             "country": "Sudan",
             "agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Ubuntu Chromium/78.0.3904.108 Chrome/78.0.3904.108 Safari/537.36",
         }
-        self.assertDictEqual({}, detection.check_new_device(db_user, last_login_user_fields))
+        self.assertDictEqual({}, detection.check_new_device(db_user, last_login_user_fields, context=DetectionContext(db_user)))
 
     def test_check_new_device_alert(self):
         # Test to check the triggering of the NEW_DEVICE alert
@@ -243,29 +247,37 @@ class DetectionTestCase(TestCase):
             "country": "Sudan",
             "agent": "Mozilla/5.0 (X11; U; Linux i686; es-AR; rv:1.9.1.8) Gecko/20100214 Ubuntu/9.10 (karmic) Firefox/3.5.8",
         }
-        alert_result = detection.check_new_device(db_user, last_login_user_fields)
+        alert_result = detection.check_new_device(db_user, last_login_user_fields, context=DetectionContext(db_user))
         self.assertEqual("New Device", alert_result["alert_name"])
         self.assertEqual("Login from new device for User: Lorena Goldoni, at: 2023-03-08T17:10:33.358Z", alert_result["alert_desc"])
 
-    def test_update_risk_level_norisk(self):
+    def trigger_alerts(self, db_user: User, db_config: Config, context: DetectionContext, *alerts) -> bool:
+        """Trigger the (alert_name, login_data) alerts in a detection pass of the user, as check_fields does"""
+        for name, login_data in alerts:
+            detection.set_alert(db_user, login_data, {"alert_name": name, "alert_desc": "Test_Description"}, db_config, context=context)
+        detection.flush_alerts(db_user, db_config, context)
+        context.flush()
+        return detection.update_user_risk(db_user, db_config, context)
+
+    def test_update_user_risk_norisk(self):
         """Test default no_risk level user"""
         # 0 alert --> no risk
-        self.assertTrue(User.objects.filter(username="Lorena Goldoni").exists())
+        db_config = Config.objects.get(id=1)
         db_user = User.objects.get(username="Lorena Goldoni")
         self.assertEqual("No risk", db_user.risk_score)
+        self.assertFalse(self.trigger_alerts(db_user, db_config, DetectionContext(db_user)))
+        self.assertEqual("No risk", User.objects.get(username="Lorena Goldoni").risk_score)
 
-    def test_update_risk_level_low(self):
-        """Test update_risk_level() function for low risk user, step-by-step alerts because every time both functions set_alert() and update_risk_level() are called and the "USER_RISK_THRESHOLD" alert could be triggered"""
-        # 2 alerts --> Low risk
+    def test_update_user_risk_low(self):
+        """Test update_user_risk() function for low risk user"""
+        # 1 alert --> Low risk
         db_config = Config.objects.get(id=1)
-        self.assertTrue(User.objects.filter(username="Lorena Goldoni").exists())
+        db_config.allowed_countries = []
         db_user = User.objects.get(username="Lorena Goldoni")
-        alert = Alert.objects.create(
-            user=db_user, name=AlertDetectionType.IMP_TRAVEL.value, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description"
-        )
-        self.assertTrue(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
-        self.assertEqual("Low", db_user.risk_score)
-        alerts_user = db_user.alert_set.all()
+        context = DetectionContext(db_user)
+        self.assertTrue(self.trigger_alerts(db_user, db_config, context, (AlertDetectionType.IMP_TRAVEL.value, self.raw_data_IMP_TRAVEL)))
+        self.assertEqual("Low", User.objects.get(username="Lorena Goldoni").risk_score)
+        alerts_user = db_user.alert_set.all().order_by("id")
         self.assertEqual(2, alerts_user.count())
         # first user's alert must be the IMP_TRAVEL one
         self.assertEqual(AlertDetectionType.IMP_TRAVEL.value, alerts_user[0].name)
@@ -273,131 +285,70 @@ class DetectionTestCase(TestCase):
         self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[1].name)
         self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from No risk to Low", alerts_user[1].description)
 
-    def test_update_risk_level_medium(self):
-        """Test update_risk_level() function for medium risk user, step-by-step alerts because every time both functions set_alert() and update_risk_level() are called and the "USER_RISK_THRESHOLD" alert could be triggered"""
+    def test_update_user_risk_medium(self):
+        """Test update_user_risk() function for medium risk user, with a detection pass for each step, so the "USER_RISK_THRESHOLD" alert could be triggered each time"""
         #   4 alerts --> Medium risk
         db_config = Config.objects.get(id=1)
-        self.assertTrue(User.objects.filter(username="Lorena Goldoni").exists())
+        db_config.allowed_countries = []
         db_user = User.objects.get(username="Lorena Goldoni")
+        context = DetectionContext(db_user)
         # first alert --> risk_score passes to Low
-        alert = Alert.objects.create(user=db_user, name=AlertDetectionType.IMP_TRAVEL, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description1")
-        self.assertTrue(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
+        self.assertTrue(self.trigger_alerts(db_user, db_config, context, (AlertDetectionType.IMP_TRAVEL.value, self.raw_data_IMP_TRAVEL)))
         self.assertEqual("Low", db_user.risk_score)
-        db_config.risk_score_increment_alerts = [AlertDetectionType.ATYPICAL_COUNTRY]
-        alerts_user = db_user.alert_set.all().order_by("created")
-        self.assertEqual(2, alerts_user.count())
-        # first user's alert must be the IMP_TRAVEL one
-        self.assertEqual(AlertDetectionType.IMP_TRAVEL.value, alerts_user[0].name)
-        # then, the second alert must be the USER_RISK_THRESHOLD
-        self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[1].name)
-        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from No risk to Low", alerts_user[1].description)
-        # second alert
-        alert = Alert.objects.create(user=db_user, name=AlertDetectionType.NEW_DEVICE, login_raw_data=self.raw_data_NEW_DEVICE, description="Test_Description2")
-        # no new USER_RISK_THRESHOLD alert and risk_score decreased to "No risk" because the config.rik_score_incrmenet_alerts changed to just ATYPICAL_COUNTRY alert
-        self.assertFalse(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
-        self.assertEqual("No risk", db_user.risk_score)
-        alerts_user = db_user.alert_set.all().order_by("created")
-        self.assertEqual(3, alerts_user.count())
-        # first user's alert must be the IMP_TRAVEL one
-        self.assertEqual(AlertDetectionType.IMP_TRAVEL.value, alerts_user[0].name)
-        # then, the second alert must be the USER_RISK_THRESHOLD
-        self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[1].name)
-        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from No risk to Low", alerts_user[1].description)
-        self.assertEqual(AlertDetectionType.NEW_DEVICE, alerts_user[2].name)
-        # fourth alert
-        alert = Alert.objects.create(
-            user=db_user, name=AlertDetectionType.ATYPICAL_COUNTRY, login_raw_data=self.raw_data_NEW_COUNTRY, description="Test_Description3"
+        # 3 alerts --> still Low, so no new USER_RISK_THRESHOLD alert
+        self.assertFalse(
+            self.trigger_alerts(
+                db_user,
+                db_config,
+                context,
+                (AlertDetectionType.ATYPICAL_COUNTRY.value, self.raw_data_NEW_COUNTRY),
+                (AlertDetectionType.ATYPICAL_COUNTRY.value, self.raw_data_NEW_COUNTRY),
+            )
         )
-        # USER_RISK_THRESHOLD alert
-        self.assertTrue(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
         self.assertEqual("Low", db_user.risk_score)
-        alerts_user = db_user.alert_set.all().order_by("created")
-        self.assertEqual(5, alerts_user.count())
-        # first user's alert must be the IMP_TRAVEL one
-        self.assertEqual(AlertDetectionType.IMP_TRAVEL.value, alerts_user[0].name)
-        # then, the second alert must be the USER_RISK_THRESHOLD
-        self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[1].name)
-        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from No risk to Low", alerts_user[1].description)
-        self.assertEqual(AlertDetectionType.NEW_DEVICE, alerts_user[2].name)
-        self.assertEqual(AlertDetectionType.ATYPICAL_COUNTRY, alerts_user[3].name)
-        self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[4].name)
-        # again from "No risk" to "Low" because Config.risk_score_increment_alerts changed
-        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from No risk to Low", alerts_user[4].description)
-        # fourth alert
-        alert = Alert.objects.create(
-            user=db_user, name=AlertDetectionType.ATYPICAL_COUNTRY, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description4"
-        )
-        alert = Alert.objects.create(
-            user=db_user, name=AlertDetectionType.ATYPICAL_COUNTRY, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description5"
-        )
-        alert = Alert.objects.create(
-            user=db_user, name=AlertDetectionType.ATYPICAL_COUNTRY, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description6"
-        )
-        # no new USER_RISK_THRESHOLD alert
-        self.assertTrue(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
+        # the NEW_DEVICE alert is filtered (Config.filtered_alerts_types), so the risk_score isn't updated
+        self.assertFalse(self.trigger_alerts(db_user, db_config, context, (AlertDetectionType.NEW_DEVICE.value, self.raw_data_NEW_DEVICE)))
+        self.assertEqual("Low", db_user.risk_score)
+        # fourth alert --> USER_RISK_THRESHOLD alert
+        self.assertTrue(self.trigger_alerts(db_user, db_config, context, (AlertDetectionType.ATYPICAL_COUNTRY.value, self.raw_data_NEW_COUNTRY)))
+        db_user = User.objects.get(username="Lorena Goldoni")
         self.assertEqual("Medium", db_user.risk_score)
-        alerts_user = db_user.alert_set.all().order_by("created")
-        self.assertEqual(9, alerts_user.count())
-        # first user's alert must be the IMP_TRAVEL one
-        self.assertEqual(AlertDetectionType.IMP_TRAVEL.value, alerts_user[0].name)
-        # then, the second alert must be the USER_RISK_THRESHOLD
-        self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[1].name)
-        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from No risk to Low", alerts_user[1].description)
-        self.assertEqual(AlertDetectionType.NEW_DEVICE, alerts_user[2].name)
-        self.assertEqual(AlertDetectionType.ATYPICAL_COUNTRY, alerts_user[3].name)
-        self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[4].name)
-        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from No risk to Low", alerts_user[4].description)
-        self.assertEqual(AlertDetectionType.ATYPICAL_COUNTRY, alerts_user[5].name)
-        self.assertEqual(AlertDetectionType.ATYPICAL_COUNTRY, alerts_user[6].name)
-        self.assertEqual(AlertDetectionType.ATYPICAL_COUNTRY, alerts_user[7].name)
-        self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[8].name)
-        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from Low to Medium", alerts_user[8].description)
-
-    def test_update_risk_level_high(self):
-        """Test update_risk_level() function for high risk user, step-by-step alerts because every time both functions set_alert() and update_risk_level() are called and the "USER_RISK_THRESHOLD" alert could be triggered"""
-        #   5 alerts --> High risk
+        self.assertEqual(4, db_user.risk_alert_count)
+        alerts_user = db_user.alert_set.all().order_by("id")
+        self.assertEqual(7, alerts_user.count())
+        self.assertListEqual(
+            [
+                AlertDetectionType.IMP_TRAVEL,
+                AlertDetectionType.USER_RISK_THRESHOLD,
+                AlertDetectionType.ATYPICAL_COUNTRY,
+                AlertDetectionType.ATYPICAL_COUNTRY,
+                AlertDetectionType.NEW_DEVICE,
+                AlertDetectionType.ATYPICAL_COUNTRY,
+                AlertDetectionType.USER_RISK_THRESHOLD,
+            ],
+            [alert.name for alert in alerts_user],
+        )
+        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from Low to Medium", alerts_user[6].description)
+
+    def test_update_user_risk_high(self):
+        """Test update_user_risk() function for high risk user, with more risk levels crossed in the same detection pass"""
+        #   7 alerts --> High risk
         db_config = Config.objects.get(id=1)
-        db_config.risk_score_increment_alerts.append("New Device")
-        db_config.save()
-        self.test_update_risk_level_medium()
+        db_config.allowed_countries = []
         db_user = User.objects.get(username="Lorena Goldoni")
-        alert = Alert.objects.create(user=db_user, name=AlertDetectionType.IMP_TRAVEL, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description7")
-        alert.save()
-        # new USER_RISK_THRESHOLD alert
-        self.assertTrue(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
-        alert = Alert.objects.create(user=db_user, name=AlertDetectionType.IMP_TRAVEL, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description8")
-        alert.save()
-        self.assertFalse(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
+        context = DetectionContext(db_user)
+        self.assertTrue(self.trigger_alerts(db_user, db_config, context, *[(AlertDetectionType.IMP_TRAVEL.value, self.raw_data_IMP_TRAVEL)] * 7))
+        self.assertEqual("High", User.objects.get(username="Lorena Goldoni").risk_score)
+        # a single USER_RISK_THRESHOLD alert, from the initial risk_score to the final one
+        threshold_alerts = db_user.alert_set.filter(name=AlertDetectionType.USER_RISK_THRESHOLD)
+        self.assertEqual(1, threshold_alerts.count())
+        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from No risk to High", threshold_alerts[0].description)
+        # no USER_RISK_THRESHOLD alert if the risk_score doesn't increase
+        self.assertFalse(self.trigger_alerts(db_user, db_config, context, (AlertDetectionType.IMP_TRAVEL.value, self.raw_data_IMP_TRAVEL)))
         self.assertEqual("High", db_user.risk_score)
-        alerts_user = db_user.alert_set.all().order_by("created")
-        self.assertEqual(12, alerts_user.count())
-        # the first 9 alerts have been checked in the previous function, called also at the beginning of this test
-        self.assertEqual(AlertDetectionType.IMP_TRAVEL, alerts_user[9].name)
-        self.assertEqual("Test_Description7", alerts_user[9].description)
-        self.assertEqual(AlertDetectionType.USER_RISK_THRESHOLD, alerts_user[10].name)
-        self.assertEqual("User risk_score increased for User: Lorena Goldoni, who changed risk_score from Medium to High", alerts_user[10].description)
-        self.assertEqual(AlertDetectionType.IMP_TRAVEL, alerts_user[11].name)
-        self.assertEqual("Test_Description8", alerts_user[11].description)
-        # add some other alerts
-        alert = Alert.objects.create(user=db_user, name=AlertDetectionType.IMP_TRAVEL, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description9")
-        # no USER_RISK_THRESHOLD alert
-        self.assertFalse(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
-        self.assertEqual("High", db_user.risk_score)
-        self.assertEqual(13, db_user.alert_set.count())
-        self.assertEqual(AlertDetectionType.IMP_TRAVEL, alerts_user[12].name)
-        self.assertEqual("Test_Description9", alerts_user[12].description)
-        alert = Alert.objects.create(
-            user=db_user, name=AlertDetectionType.IMP_TRAVEL, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description10"
-        )
-        # no USER_RISK_THRESHOLD alert
-        self.assertFalse(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config))
-        self.assertEqual("High", db_user.risk_score)
-        self.assertEqual(14, db_user.alert_set.count())
-        self.assertEqual(AlertDetectionType.IMP_TRAVEL, alerts_user[13].name)
-        self.assertEqual("Test_Description10", alerts_user[13].description)
+        self.assertEqual(9, db_user.alert_set.count())
 
-    @patch("impossible_travel.modules.detection.update_risk_level")
-    def test_set_alert(self, mock_update_risk_level):
+    def test_set_alert(self):
         db_config = Config.objects.get(id=1)
         # Add an alert and check if it is correctly inserted in the Alert Model
         db_user = User.objects.get(username="Lorena Goldoni")
@@ -413,54 +364,51 @@ class DetectionTestCase(TestCase):
             "alert_name": name,
             "alert_desc": desc,
         }
-        detection.set_alert(db_user, login_data, alert_info, db_config)
+        context = DetectionContext(db_user)
+        self.assertFalse(self.trigger_alerts(db_user, db_config, context, (name, login_data)))
         db_alert = Alert.objects.get(user=db_user, name=AlertDetectionType.IMP_TRAVEL)
         self.assertIsNotNone(db_alert)
         self.assertEqual("Imp Travel", db_alert.name)
+        self.assertEqual(alert_info["alert_name"], db_alert.name)
         self.assertTrue(db_alert.is_filtered)
         self.assertListEqual([AlertFilterType.ALLOWED_COUNTRY_FILTER], db_alert.filter_type)
-        mock_update_risk_level.assert_not_called()
+        # the filtered alert doesn't update the risk_score
+        self.assertEqual("No risk", User.objects.get(username="Lorena Goldoni").risk_score)
 
-    @patch("impossible_travel.modules.detection.update_risk_level")
-    def test_set_alert_vip_user(self, mock_update_risk_level):
+    def test_set_alert_vip_user(self):
         db_config = Config.objects.get(id=1)
         db_config.alert_is_vip_only = True
         db_config.save()
         # Test for alert in case of a vip_user
         db_user = User.objects.get(username="Lorena Goldoni")
-        db_login = Login.objects.filter(user=db_user).first()
-        timestamp = db_login.timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-        login_data = self.raw_data_IMP_TRAVEL
-        name = AlertDetectionType.IMP_TRAVEL
-        desc = f"{name} for User: {db_user.username}, \
-                    at: {timestamp}, from: ({db_login.latitude}, {db_login.longitude})"
-        alert_info = {
-            "alert_name": name,
-            "alert_desc": desc,
-        }
-        detection.set_alert(db_user, login_data, alert_info, db_config)
+        context = DetectionContext(db_user)
+        self.assertFalse(self.trigger_alerts(db_user, db_config, context, (AlertDetectionType.IMP_TRAVEL, self.raw_data_IMP_TRAVEL)))
         db_alert = Alert.objects.get(user=db_user, name=AlertDetectionType.IMP_TRAVEL)
         self.assertTrue(db_alert.is_filtered)
         self.assertEqual([AlertFilterType.IS_VIP_FILTER, AlertFilterType.ALLOWED_COUNTRY_FILTER], db_alert.filter_type)
-        mock_update_risk_level.assert_not_called()
+        self.assertEqual("No risk", User.objects.get(username="Lorena Goldoni").risk_score)
 
-    @patch("impossible_travel.modules.detection.update_risk_level")
-    def test_set_alert_not_filtered_alert(self, mock_update_risk_level):
-        # test if the update_risk_level is correctly called for a not filtered alert
+    def test_set_alert_not_filtered_alert(self):
+        # test if the risk_score is correctly updated for a not filtered alert
         db_user = User.objects.get(username="Lorena Goldoni")
         db_config = Config.objects.get(id=1)
         db_config.allowed_countries = []
         db_config.save()
-        alert_info = {
-            "alert_name": AlertDetectionType.IMP_TRAVEL,
-            "alert_desc": "description_fake",
-        }
-        login_data = self.raw_data_IMP_TRAVEL
-        detection.set_alert(db_user, login_data, alert_info, db_config)
+        context = DetectionContext(db_user)
+        alert = detection.set_alert(
+            db_user, self.raw_data_IMP_TRAVEL, {"alert_name": AlertDetectionType.IMP_TRAVEL, "alert_desc": "description_fake"}, db_config, context=context
+        )
+        # the alert is buffered in the context, until the flush
+        self.assertListEqual([alert], context.new_alerts)
+        self.assertFalse(Alert.objects.filter(user=db_user).exists())
+        detection.flush_alerts(db_user, db_config, context)
+        context.flush()
         db_alert = Alert.objects.get(user=db_user, name=AlertDetectionType.IMP_TRAVEL)
         self.assertFalse(db_alert.is_filtered)
         self.assertEqual([], db_alert.filter_type)
-        mock_update_risk_level.assert_called_once_with(db_user=db_user, triggered_alert=db_alert, app_config=db_config)
+        self.assertEqual(db_alert, context.risk_alert)
+        self.assertTrue(context.risk_updated)
+        self.assertEqual("Low", db_user.risk_score)
 
     def test_check_fields_logins(self):
         fields1 = load_test_data("test_check_fields_part1")
@@ -560,40 +508,32 @@ class DetectionTestCase(TestCase):
         detection.check_fields(db_user, fields1)
         # First part - Expected alerts in Alert Model:
         #   1. (2° login - id:2) at 2023-05-03T06:55:31.768Z alert NEW DEVICE (device_fingerprint="windows-10-desktop-other")
-        #   2. (2° login - id:2) alert User Risk Threshold (from No risk to Low level)
-        #   3. (2° login - id:2) at 2023-05-03T06:55:31.768Z alert NEW COUNTRY
-        #   4. (2° login - id:2) at 2023-05-03T06:55:31.768Z alert IMP TRAVEL
+        #   2. (2° login - id:2) at 2023-05-03T06:55:31.768Z alert NEW COUNTRY
+        #   3. (2° login - id:2) at 2023-05-03T06:55:31.768Z alert IMP TRAVEL
         # ---
-        #   5. (3° login - id: 3) at 2023-05-03T06:57:27.768Z alert ANONYMOUS_IP_LOGIN
-        #   6. (3° login - id:3) alert User Risk Threshold (from Low to Medium level)
-        #   7. (3° login - id: 3) at 2023-05-03T06:57:27.768Z alert NEW COUNTRY
-        #   8. (3° login - id: 3) at 2023-05-03T06:57:27.768Z alert IMP TRAVEL
-
-        #   9.(3° login - id: 3) alert User Risk Threshold (from Medium to High level)
+        #   4. (3° login - id: 3) at 2023-05-03T06:57:27.768Z alert ANONYMOUS_IP_LOGIN
+        #   5. (3° login - id: 3) at 2023-05-03T06:57:27.768Z alert NEW COUNTRY
+        #   6. (3° login - id: 3) at 2023-05-03T06:57:27.768Z alert IMP TRAVEL
         # ---
-        #   10. (4° login - id: 4) at 2023-05-03T07:10:23.154Z alert IMP TRAVEL
-        total_alerts = db_user.alert_set.filter().order_by("created")
-        self.assertEqual("2023-05-03T06:55:31.768Z", total_alerts[0].login_raw_data["timestamp"])
-        self.assertEqual("New Device", total_alerts[0].name)
-        self.assertEqual("2023-05-03T06:55:31.768Z", total_alerts[1].login_raw_data["timestamp"])
-        self.assertEqual("User Risk Threshold", total_alerts[1].name)
-        self.assertEqual("2023-05-03T06:55:31.768Z", total_alerts[2].login_raw_data["timestamp"])
-        self.assertEqual("New Country", total_alerts[2].name)
-        self.assertEqual("2023-05-03T06:55:31.768Z", total_alerts[3].login_raw_data["timestamp"])
-        self.assertEqual("Imp Travel", total_alerts[3].name)
-        self.assertEqual("2023-05-03T06:57:27.768Z", total_alerts[4].login_raw_data["timestamp"])
-        self.assertEqual("Anonymous IP Login", total_alerts[4].name)
-        self.assertEqual("2023-05-03T06:57:27.768Z", total_alerts[5].login_raw_data["timestamp"])
-        self.assertEqual("User Risk Threshold", total_alerts[5].name)
-        self.assertEqual("2023-05-03T06:57:27.768Z", total_alerts[6].login_raw_data["timestamp"])
-        self.assertEqual("New Country", total_alerts[6].name)
-        self.assertEqual("2023-05-03T06:57:27.768Z", total_alerts[7].login_raw_data["timestamp"])
-        self.assertEqual("Imp Travel", total_alerts[7].name)
-        self.assertEqual("2023-05-03T07:10:23.154Z", total_alerts[8].login_raw_data["timestamp"])
-        self.assertEqual("Imp Travel", total_alerts[8].name)
-        self.assertEqual("2023-05-03T07:10:23.154Z", total_alerts[9].login_raw_data["timestamp"])
-        self.assertEqual("User Risk Threshold", total_alerts[9].name)
-        self.assertEqual(10, len(total_alerts))
+        #   7. (4° login - id: 4) at 2023-05-03T07:10:23.154Z alert IMP TRAVEL
+        # ---
+        #   8. (4° login - id: 4) a single alert User Risk Threshold at the end of the detection (from No risk to High level)
+        total_alerts = db_user.alert_set.filter().order_by("id")
+        expected_alerts = [
+            ("2023-05-03T06:55:31.768Z", "New Device"),
+            ("2023-05-03T06:55:31.768Z", "New Country"),
+            ("2023-05-03T06:55:31.768Z", "Imp Travel"),
+            ("2023-05-03T06:57:27.768Z", "Anonymous IP Login"),
+            ("2023-05-03T06:57:27.768Z", "New Country"),
+            ("2023-05-03T06:57:27.768Z", "Imp Travel"),
+            ("2023-05-03T07:10:23.154Z", "Imp Travel"),
+            ("2023-05-03T07:10:23.154Z", "User Risk Threshold"),
+        ]
+        self.assertListEqual(expected_alerts, [(alert.login_raw_data["timestamp"], alert.name) for alert in total_alerts])
+        # the alerts of the same login don't share the enrichment of the impossible travel alert
+        self.assertNotIn("buffalogs", total_alerts[3].login_raw_data)
+        self.assertIn("buffalogs", total_alerts[5].login_raw_data)
+        self.assertEqual(8, len(total_alerts))
         for alert in total_alerts:
             if alert.is_filtered:
                 count_filtered_alerts += 1
@@ -610,7 +550,7 @@ class DetectionTestCase(TestCase):
         imp_travel_alerts_fields1 = Alert.objects.filter(user=db_user, name=AlertDetectionType.IMP_TRAVEL).order_by("created")
         self.assertEqual(3, imp_travel_alerts_fields1.count())
         user_risk_threshold_alerts_fields1 = Alert.objects.filter(user=db_user, name=AlertDetectionType.USER_RISK_THRESHOLD).order_by("created")
-        self.assertEqual(3, user_risk_threshold_alerts_fields1.count())
+        self.assertEqual(1, user_risk_threshold_alerts_fields1.count())
         anonymous_ip_alerts_fields1 = Alert.objects.filter(user=db_user, name=AlertDetectionType.ANONYMOUS_IP_LOGIN).order_by("created")
         self.assertEqual(1, anonymous_ip_alerts_fields1.count())
 
@@ -643,19 +583,10 @@ class DetectionTestCase(TestCase):
         # check user_risk_threshold alerts for fields1 logins
         self.assertEqual("User Risk Threshold", user_risk_threshold_alerts_fields1[0].name)
         self.assertEqual(
-            "User risk_score increased for User: Aisha Delgado, who changed risk_score from No risk to Low",
+            "User risk_score increased for User: Aisha Delgado, who changed risk_score from No risk to High",
             user_risk_threshold_alerts_fields1[0].description,
         )
-        self.assertEqual("User Risk Threshold", user_risk_threshold_alerts_fields1[1].name)
-        self.assertEqual(
-            "User risk_score increased for User: Aisha Delgado, who changed risk_score from Low to Medium",
-            user_risk_threshold_alerts_fields1[1].description,
-        )
-        self.assertEqual("User Risk Threshold", user_risk_threshold_alerts_fields1[2].name)
-        self.assertEqual(
-            "User risk_score increased for User: Aisha Delgado, who changed risk_score from Medium to High",
-            user_risk_threshold_alerts_fields1[2].description,
-        )
+        self.assertEqual("High", User.objects.get(username="Aisha Delgado").risk_score)
         # check anonymous_ip_login alerts for fields1 logins
         self.assertEqual("Anonymous IP Login", anonymous_ip_alerts_fields1[0].name)
         self.assertEqual(
@@ -686,7 +617,7 @@ class DetectionTestCase(TestCase):
         self.assertEqual(3, all_new_device_alerts.count())
         new_device_alerts_fields2 = all_new_device_alerts.exclude(id__in=new_device_alerts_fields1_ids).order_by("created")
         self.assertEqual(2, new_device_alerts_fields2.count())
-        self.assertEqual(15, Alert.objects.filter(user=db_user).count())
+        self.assertEqual(13, Alert.objects.filter(user=db_user).count())
         # check new_device alerts for fields2
         self.assertEqual("New Device", new_device_alerts_fields2[0].name)
         self.assertEqual("Login from new device for User: Aisha Delgado, at: 2023-05-03T07:14:22.768Z", new_device_alerts_fields2[0].description)
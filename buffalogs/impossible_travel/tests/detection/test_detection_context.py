@@ -0,0 +1,216 @@
+import datetime
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from impossible_travel.constants import AlertDetectionType, UserRiskScoreType
+from impossible_travel.models import Login, User, UsersIP
+from impossible_travel.modules import detection
+from impossible_travel.modules.app_config import get_app_config
+from impossible_travel.modules.detection_context import DetectionContext
+from impossible_travel.utils.utils import build_device_fingerprint
+
+
+class DetectionContextTestCase(TestCase):
+
+    def setUp(self):
+        # executed once per test (at the beginning)
+        call_command("loaddata", "tests-fixture.json", verbosity=0)
+        User.rebuild_counters()
+        self.db_user = User.objects.get(username="Lorena Goldoni")
+        UsersIP.objects.create(user=self.db_user, ip="192.0.2.1")
+        UsersIP.objects.create(user=self.db_user, ip="2001:0db8:0000:0000:0000:0000:0000:0001")
+
+    def tearDown(self):
+        # executed once per test (at the end)
+        User.objects.all().delete()
+
+    def test_load(self):
+        # the context is loaded with one query for the logins and one for the IPs
+        with self.assertNumQueries(2):
+            context = DetectionContext(self.db_user)
+        self.assertTrue(context.has_logins())
+        self.assertTrue(context.has_index("cloud"))
+        self.assertFalse(context.has_index("fw-proxy"))
+        self.assertTrue(context.has_login("cloud", "Italy", "Mozilla/5.0 (X11;U; Linux i686; en-GB; rv:1.9.1) Gecko/20090624 Ubuntu/9.04 (jaunty) Firefox/3.5"))
+        self.assertFalse(context.has_login("cloud", "Italy", ""))
+        self.assertTrue(context.has_ip("192.0.2.1"))
+        self.assertTrue(context.has_ip("2001:db8::1"))
+        self.assertFalse(context.has_ip("192.0.2.2"))
+        self.assertEqual(Login.objects.get(event_id="event_id_1"), context.get_country_last_login("Germany"))
+        self.assertIsNone(context.get_country_last_login("France"))
+        self.assertEqual(self.db_user.login_set.latest("timestamp"), context.get_latest_login())
+
+    def test_empty_user(self):
+        context = DetectionContext(User.objects.get(username="Aisha Delgado"))
+        self.assertFalse(context.has_logins())
+        self.assertFalse(context.has_ip("192.0.2.1"))
+
+    def test_tracking(self):
+        # the context is kept up-to-date, without queries, by the detection functions
+        context = DetectionContext(self.db_user)
+        new_login = {
+            "id": "test_id_1",
+            "index": "fw-proxy",
+            "ip": "203.0.113.1",
+            "lat": 48.8566,
+            "lon": 2.3522,
+            "country": "France",
+            "agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "timestamp": "2025-02-25T10:00:00.000Z",
+        }
+        detection.add_new_login(self.db_user, new_login, context=context)
+        detection.add_new_ip(self.db_user, new_login["ip"], context=context)
+        # the new rows are buffered until the flush
+        self.assertFalse(Login.objects.filter(event_id="test_id_1").exists())
+        self.assertFalse(UsersIP.objects.filter(ip="203.0.113.1").exists())
+        self.assertTrue(context.has_index("fw-proxy"))
+        self.assertTrue(context.has_login("fw-proxy", "France", new_login["agent"]))
+        self.assertTrue(context.has_ip("203.0.113.1"))
+        self.assertTrue(context.has_fingerprint("windows-10-desktop-chrome"))
+        self.assertEqual("test_id_1", context.get_latest_login().event_id)
+        self.assertEqual(datetime.datetime(2025, 2, 25, 10, tzinfo=datetime.timezone.utc), context.get_country_last_login("France").timestamp)
+        # bulk insert of the logins and of the IPs + update of the user's counters
+        with self.assertNumQueries(3):
+            context.flush()
+        self.assertTrue(Login.objects.filter(event_id="test_id_1").exists())
+        self.assertTrue(UsersIP.objects.filter(user=self.db_user, ip="203.0.113.1").exists())
+
+        updated_login = {**new_login, "id": "test_id_2", "ip": "203.0.113.2", "timestamp": "2025-02-26T10:00:00.000Z"}
+        detection.update_model(self.db_user, updated_login, context=context)
+        latest_login = context.get_latest_login()
+        self.assertEqual("test_id_2", latest_login.event_id)
+        self.assertEqual("203.0.113.2", latest_login.ip)
+        self.assertEqual(datetime.datetime(2025, 2, 26, 10, tzinfo=datetime.timezone.utc), latest_login.timestamp)
+        with self.assertNumQueries(2):
+            context.flush()
+        # the context is consistent with the DB
+        self.assertEqual(self.db_user.login_set.latest("timestamp"), latest_login)
+        self.assertEqual(latest_login.timestamp, self.db_user.login_set.latest("timestamp").timestamp)
+
+    def test_latest_login(self):
+        # the latest login is tracked without scanning the user's logins
+        context = DetectionContext(self.db_user)
+        latest_login = context.get_latest_login()
+        previous_login = self.db_user.login_set.exclude(id=latest_login.id).latest("timestamp")
+        # an older event of the latest login moves it back in time, before the previous one
+        older_login = {
+            "id": "test_id_1",
+            "index": latest_login.index,
+            "ip": latest_login.ip,
+            "lat": latest_login.latitude,
+            "lon": latest_login.longitude,
+            "country": latest_login.country,
+            "agent": latest_login.user_agent,
+            "timestamp": previous_login.timestamp - datetime.timedelta(days=1),
+        }
+        detection.update_model(self.db_user, older_login, context=context)
+        self.assertEqual(previous_login, context.get_latest_login())
+        self.assertIsNone(DetectionContext(User.objects.get(username="Aisha Delgado")).get_latest_login())
+
+    def test_flush_empty(self):
+        context = DetectionContext(self.db_user)
+        with self.assertNumQueries(0):
+            context.flush()
+
+    def test_check_fields_queries(self):
+        # the queries don't depend on the number of logins: the user state is read once and the writes are performed in bulk
+        login = {
+            "id": "test_id",
+            "index": "cloud",
+            "ip": "192.0.2.1",
+            "lat": 44.4937,
+            "lon": 24.3456,
+            "country": "Germany",
+            "agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Ubuntu Chromium/78.0.3904.108 Chrome/78.0.3904.108 Safari/537.36",
+        }
+        Login.objects.filter(event_id="event_id_1").update(device_fingerprint=build_device_fingerprint(login["agent"]))
+        logins = [{**login, "timestamp": f"2025-01-01T18:0{i}:00.000Z"} for i in range(5)]
+        # the Config snapshot is cached by the process
+        get_app_config()
+        # 2 queries to load the context + savepoint, bulk update, counters update and release of the transaction
+        with self.assertNumQueries(6):
+            detection.check_fields(self.db_user, logins)
+        self.assertEqual("2025-01-01T18:04:00+00:00", Login.objects.get(event_id="test_id").timestamp.isoformat())
+
+    @override_settings(CERTEGO_BUFFALOGS_DETECTION_BATCH_SIZE=2)
+    def test_check_fields_chunks(self):
+        # the logins are written in a transaction for each chunk
+        login = {
+            "index": "fw-proxy",
+            "ip": "192.0.2.1",
+            "lat": 44.4937,
+            "lon": 24.3456,
+            "country": "Germany",
+            "agent": "",
+        }
+        logins = [{**login, "id": f"test_id_{i}", "country": f"Country {i}", "timestamp": f"2025-01-01T18:0{i}:00.000Z"} for i in range(5)]
+        with patch("impossible_travel.modules.detection.DetectionContext.flush", autospec=True, side_effect=DetectionContext.flush) as mock_flush:
+            detection.check_fields(self.db_user, iter(logins))
+        # a flush for each chunk, plus one for the USER_RISK_THRESHOLD alert triggered at the end of the detection
+        self.assertEqual(4, mock_flush.call_count)
+        self.assertListEqual(
+            [f"test_id_{i}" for i in range(5)], list(self.db_user.login_set.filter(index="fw-proxy").order_by("id").values_list("event_id", flat=True))
+        )
+
+    @override_settings(CERTEGO_BUFFALOGS_DETECTION_BATCH_SIZE=2)
+    def test_check_fields_chunk_failed(self):
+        # a chunk that fails is rolled back and detected again login by login, so only the failed login is dropped
+        login = {"index": "fw-proxy", "ip": "192.0.2.1", "lat": 44.4937, "lon": 24.3456, "agent": "", "intelligence_category": "anonymizer"}
+        logins = [{**login, "id": f"test_id_{i}", "country": f"Country {i}", "timestamp": f"2025-01-01T18:0{i}:00.000Z"} for i in range(5)]
+
+        def check_login(db_user, login, app_config, context):
+            if login["id"] == "test_id_3":
+                raise ValueError("invalid login")
+            detection_check_login(db_user, login, app_config, context)
+
+        detection_check_login = detection.check_login
+        with patch("impossible_travel.modules.detection.check_login", side_effect=check_login):
+            with self.assertLogs("impossible_travel.modules.detection", level="ERROR") as logs:
+                detection.check_fields(self.db_user, iter(logins))
+        errors = [output for output in logs.output if output.startswith("ERROR")]
+        self.assertEqual(1, len(errors))
+        self.assertIn("dropped the login test_id_3 at 2025-01-01T18:03:00.000Z", errors[0])
+        self.assertListEqual(
+            ["test_id_0", "test_id_1", "test_id_2", "test_id_4"],
+            list(self.db_user.login_set.filter(index="fw-proxy").order_by("id").values_list("event_id", flat=True)),
+        )
+        # the counters and the risk_score are consistent with the rows written
+        db_user = User.objects.get(id=self.db_user.id)
+        self.assertEqual(self.db_user.login_set.count(), db_user.login_count)
+        self.assertEqual(self.db_user.alert_set.count(), db_user.alert_count)
+        self.assertEqual(4, self.db_user.alert_set.filter(name=AlertDetectionType.ANONYMOUS_IP_LOGIN).count())
+        self.assertEqual(self.db_user.login_set.latest("timestamp").timestamp, db_user.last_login)
+
+    def test_check_fields_db_error(self):
+        # the DB connection errors are raised, so the time window is detected again
+        login = {"id": "test_id", "index": "fw-proxy", "ip": "192.0.2.1", "lat": 44.4937, "lon": 24.3456, "agent": "", "country": "France"}
+        with patch("impossible_travel.modules.detection.check_login", side_effect=OperationalError("server closed the connection")):
+            with self.assertRaises(OperationalError):
+                detection.check_fields(self.db_user, [{**login, "timestamp": "2025-01-01T18:00:00.000Z"}])
+        self.assertFalse(Login.objects.filter(event_id="test_id").exists())
+
+    def test_check_fields_alerts_batch(self):
+        # the alerts of the user are inserted in bulk, the risk_score is computed with a single COUNT and saved once
+        self.db_user.created = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        self.db_user.save()
+        login = {"index": "cloud", "ip": "192.0.2.1", "lat": 44.4937, "lon": 24.3456, "agent": "", "intelligence_category": "anonymizer"}
+        logins = [{**login, "id": f"test_id_{i}", "country": f"Country {i}", "timestamp": f"2025-01-01T18:0{i}:00.000Z"} for i in range(8)]
+        with CaptureQueriesContext(connection) as queries:
+            detection.check_fields(self.db_user, logins)
+        sql = [query["sql"] for query in queries.captured_queries]
+        # the risk_score is computed from the User.risk_alert_count counter, without counting the alerts
+        self.assertEqual(0, len([query for query in sql if query.startswith("SELECT COUNT(*)") and "impossible_travel_alert" in query]))
+        # a single save of the risk_score, plus the counters updates of the chunk and of the USER_RISK_THRESHOLD alert
+        self.assertEqual(1, len([query for query in sql if query.startswith('UPDATE "impossible_travel_user" SET "risk_score"')]))
+        self.assertEqual(2, len([query for query in sql if query.startswith('UPDATE "impossible_travel_user"') and '"alert_count" = ' in query]))
+        # 8 ANONYMOUS_IP_LOGIN alerts, 8 NEW_COUNTRY alerts and a single USER_RISK_THRESHOLD alert
+        self.assertEqual(17, self.db_user.alert_set.count())
+        self.assertEqual(1, self.db_user.alert_set.filter(name=AlertDetectionType.USER_RISK_THRESHOLD).count())
+        db_user = User.objects.get(id=self.db_user.id)
+        self.assertEqual(UserRiskScoreType.HIGH, db_user.risk_score)
+        self.assertEqual(17, db_user.alert_count)
+        self.assertEqual(self.db_user.login_set.count(), db_user.login_count)
+        self.assertEqual(self.db_user.login_set.latest("timestamp").timestamp, db_user.last_login)
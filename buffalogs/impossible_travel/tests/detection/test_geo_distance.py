@@ -0,0 +1,123 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.test import TestCase
+from geopy.distance import geodesic
+from impossible_travel.models import Config, Login, User
+from impossible_travel.modules import detection
+from impossible_travel.modules.geo_distance import HAVERSINE_TOLERANCE, batch_travel_velocity, exceeds_distance, haversine_km, haversine_km_array
+
+
+class GeoDistanceTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.db_user = User.objects.create(username="Lorena Goldoni")
+        cls.app_config, _ = Config.objects.get_or_create(id=1)
+
+    def test_haversine_km(self):
+        # the haversine distance is within the tolerance from the geodesic one
+        rome, new_york, sydney = (41.8919, 12.5113), (40.7143, -74.006), (-33.8678, 151.2073)
+        for point1, point2 in [(rome, new_york), (new_york, sydney), (rome, sydney), (rome, rome)]:
+            self.assertAlmostEqual(geodesic(point1, point2).km, haversine_km(*point1, *point2), delta=geodesic(point1, point2).km * 0.006)
+        np.testing.assert_allclose(
+            [haversine_km(*rome, *new_york), haversine_km(*new_york, *sydney)],
+            haversine_km_array(
+                np.array([rome[0], new_york[0]]), np.array([rome[1], new_york[1]]), np.array([new_york[0], sydney[0]]), np.array([new_york[1], sydney[1]])
+            ),
+        )
+
+    def test_exceeds_distance(self):
+        self.assertFalse(exceeds_distance(90, 100))
+        self.assertTrue(exceeds_distance(110, 100))
+        # within the haversine error margin
+        self.assertIsNone(exceeds_distance(100.5, 100))
+        self.assertIsNone(exceeds_distance(99.5, 100))
+
+    def test_calc_distance_prefilter(self):
+        # the haversine prefilter doesn't change the results of the exact geodesic computation
+        rng = random.Random(42)
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        couples = []
+        for _ in range(300):
+            prev_ts = start + timedelta(minutes=rng.randint(0, 10000))
+            couples.append(
+                (
+                    rng.uniform(-80, 80),
+                    rng.uniform(-180, 180),
+                    prev_ts,
+                    rng.uniform(-80, 80),
+                    rng.uniform(-180, 180),
+                    prev_ts + timedelta(minutes=rng.choice([1, 30, 600, 6000])),
+                )
+            )
+        # couples near the distance_accepted threshold
+        couples.append((45.0, 9.0, start, 45.0 + self.app_config.distance_accepted / 111.2, 9.0, start + timedelta(minutes=1)))
+        couples.append((45.0, 9.0, start, 45.001, 9.0, start + timedelta(minutes=1)))
+        alerts = 0
+        for couple in couples:
+            prev_login = Login(user=self.db_user, latitude=couple[0], longitude=couple[1], timestamp=couple[2])
+            login = {"lat": couple[3], "lon": couple[4], "timestamp": couple[5].strftime("%Y-%m-%dT%H:%M:%S.%fZ"), "country": "Italy"}
+            alert_info, vel = detection.calc_distance_impossible_travel(self.db_user, prev_login, login, app_config=self.app_config)
+            distance_km = geodesic(couple[0:2], couple[3:5]).km
+            expected_vel = distance_km / ((couple[5] - couple[2]).total_seconds() / 3600) if distance_km > self.app_config.distance_accepted else 0
+            self.assertEqual(int(expected_vel), vel)
+            self.assertEqual(expected_vel > self.app_config.vel_accepted, bool(alert_info))
+            alerts += bool(alert_info)
+        self.assertTrue(0 < alerts < len(couples))
+
+    def test_batch_travel_velocity_matches_single(self):
+        # the batch results match the calc_distance_impossible_travel function, login by login
+        rng = random.Random(42)
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        couples = []
+        for _ in range(300):
+            prev_ts = start + timedelta(minutes=rng.randint(0, 10000))
+            couples.append(
+                (
+                    rng.uniform(-80, 80),
+                    rng.uniform(-180, 180),
+                    prev_ts,
+                    rng.uniform(-80, 80),
+                    rng.uniform(-180, 180),
+                    prev_ts + timedelta(minutes=rng.choice([0, 1, 30, 600, 6000, -60])),
+                )
+            )
+        # couples near the distance_accepted threshold
+        couples.append((45.0, 9.0, start, 45.0 + self.app_config.distance_accepted / 111.2, 9.0, start + timedelta(minutes=1)))
+        couples.append((45.0, 9.0, start, 45.001, 9.0, start + timedelta(minutes=1)))
+        prev_lat, prev_lon, prev_ts, lat, lon, ts = zip(*couples)
+        distances, velocities, alerts, candidates = batch_travel_velocity(
+            prev_lat,
+            prev_lon,
+            np.array([t.replace(tzinfo=None) for t in prev_ts], dtype="datetime64[us]"),
+            lat,
+            lon,
+            np.array([t.replace(tzinfo=None) for t in ts], dtype="datetime64[us]"),
+            self.app_config.distance_accepted,
+            self.app_config.vel_accepted,
+        )
+        self.assertTrue(alerts.any())
+        self.assertFalse(alerts.all())
+        for i, couple in enumerate(couples):
+            prev_login = Login(user=self.db_user, latitude=couple[0], longitude=couple[1], timestamp=couple[2])
+            login = {"lat": couple[3], "lon": couple[4], "timestamp": couple[5].strftime("%Y-%m-%dT%H:%M:%S.%fZ"), "country": "Italy"}
+            alert_info, vel = detection.calc_distance_impossible_travel(self.db_user, prev_login, login, app_config=self.app_config)
+            self.assertEqual(bool(alert_info), alerts[i])
+            distance_km = geodesic(couple[0:2], couple[3:5]).km
+            if candidates[i]:
+                # the distance and the velocity of the candidates are exact
+                self.assertAlmostEqual(distance_km, distances[i])
+                self.assertEqual(vel, int(velocities[i]))
+            else:
+                # the haversine distance of the other couples is within the documented error bound
+                self.assertFalse(alert_info)
+                self.assertAlmostEqual(distance_km, distances[i], delta=distance_km * HAVERSINE_TOLERANCE)
+
+    def test_batch_travel_velocity_epoch_seconds(self):
+        # 1000 km in 1 hour --> impossible travel
+        distances, velocities, alerts, candidates = batch_travel_velocity([0.0], [0.0], [0], [0.0], [8.9932], [3600], distance_accepted=100, vel_accepted=300)
+        self.assertAlmostEqual(geodesic((0, 0), (0, 8.9932)).km, distances[0])
+        self.assertAlmostEqual(distances[0], velocities[0])
+        self.assertTrue(alerts[0])
+        self.assertTrue(candidates[0])
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from django.test import TestCase, override_settings
+from impossible_travel.modules.time_windows import plan_time_windows
+
+
+@override_settings(
+    CERTEGO_BUFFALOGS_WINDOW_MINUTES=30,
+    CERTEGO_BUFFALOGS_MIN_WINDOW_MINUTES=5,
+    CERTEGO_BUFFALOGS_MAX_WINDOW_MINUTES=240,
+    CERTEGO_BUFFALOGS_WINDOW_TARGET_LOGINS=1000,
+)
+class TimeWindowsTestCase(TestCase):
+
+    def setUp(self):
+        self.start_date = datetime(2025, 2, 24, 0, 0, tzinfo=timezone.utc)
+        self.ingestion = MagicMock()
+
+    def _count_logins_per_minute(self, logins_per_minute):
+        # mock count query: the logins density (per minute) is given by a function of the minute of the day
+        def count_logins(start_date, end_date):
+            minutes = int((end_date - start_date).total_seconds() // 60)
+            return sum(logins_per_minute(start_date + timedelta(minutes=minute)) for minute in range(minutes))
+
+        return count_logins
+
+    def _assert_consecutive(self, windows, start_date, end_date):
+        self.assertEqual(start_date, windows[0][0])
+        self.assertEqual(end_date, windows[-1][1])
+        for (_, previous_end), (next_start, _) in zip(windows, windows[1:]):
+            self.assertEqual(previous_end, next_start)
+
+    def test_no_count(self):
+        # if the ingestion source doesn't support the count, the windows have the default size
+        self.ingestion.count_logins.return_value = None
+        windows = plan_time_windows(self.ingestion, self.start_date, self.start_date + timedelta(minutes=100))
+        self.assertListEqual([timedelta(minutes=30)] * 3 + [timedelta(minutes=10)], [end - start for start, end in windows])
+        # the remainder shorter than the minimum window (3 minutes) is left for the next run, unless requested
+        windows = plan_time_windows(self.ingestion, self.start_date, self.start_date + timedelta(minutes=93))
+        self.assertListEqual([timedelta(minutes=30)] * 3, [end - start for start, end in windows])
+        windows = plan_time_windows(self.ingestion, self.start_date, self.start_date + timedelta(minutes=93), keep_remainder=True)
+        self.assertListEqual([timedelta(minutes=30)] * 3 + [timedelta(minutes=3)], [end - start for start, end in windows])
+
+    def test_hot_windows_split(self):
+        # 100 logins per minute from 9:00 to 10:00, 10 logins per minute otherwise
+        self.ingestion.count_logins.side_effect = self._count_logins_per_minute(lambda minute: 100 if minute.hour == 9 else 10)
+        end_date = self.start_date + timedelta(hours=11)
+        windows = plan_time_windows(self.ingestion, self.start_date + timedelta(hours=8), end_date)
+        self._assert_consecutive(windows, self.start_date + timedelta(hours=8), end_date)
+        for start, end in windows:
+            self.assertLessEqual(self.ingestion.count_logins.side_effect(start, end), 1000)
+        hot_windows = [end - start for start, end in windows if start.hour == 9]
+        self.assertTrue(all(window <= timedelta(minutes=10) for window in hot_windows))
+
+    def test_quiet_windows_merged(self):
+        # 1 login per minute: the windows grow up to the maximum size
+        self.ingestion.count_logins.side_effect = self._count_logins_per_minute(lambda minute: 1)
+        end_date = self.start_date + timedelta(days=1)
+        windows = plan_time_windows(self.ingestion, self.start_date, end_date)
+        self._assert_consecutive(windows, self.start_date, end_date)
+        self.assertListEqual(
+            [timedelta(minutes=30), timedelta(minutes=60), timedelta(minutes=120)] + [timedelta(minutes=240)] * 5 + [timedelta(minutes=30)],
+            [end - start for start, end in windows],
+        )
+
+    def test_max_windows(self):
+        self.ingestion.count_logins.return_value = 500
+        windows = plan_time_windows(self.ingestion, self.start_date, self.start_date + timedelta(days=1), max_windows=6)
+        self._assert_consecutive(windows, self.start_date, self.start_date + timedelta(hours=3))
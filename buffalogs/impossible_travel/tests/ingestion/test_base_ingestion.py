@@ -1,5 +1,12 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Iterator
+from unittest.mock import AsyncMock, MagicMock, patch
+
 from django.test import TestCase
+from impossible_travel.ingestion.base_ingestion import compile_field_accessor
 from impossible_travel.ingestion.elasticsearch_ingestion import ElasticsearchIngestion
+from impossible_travel.ingestion.opensearch_ingestion import OpensearchIngestion
 from impossible_travel.tests.utils import load_ingestion_config_data, load_test_data
 
 
@@ -177,3 +184,185 @@ class TestBaseIngestion(TestCase):
         ]
         self.assertEqual(len(expected_result), len(actual_result))
         self.assertListEqual(expected_result, actual_result)
+
+    def test_iter_normalized_fields(self):
+        # test that iter_normalized_fields() lazily normalizes the logins, skipping the invalid ones
+        logins_returned_user4 = load_test_data("test_data_elasticsearch_returned_logins_user4")
+        ingestor = ElasticsearchIngestion(
+            ingestion_config=self.ingestion_config["elasticsearch"], mapping=self.ingestion_config["elasticsearch"]["custom_mapping"]
+        )
+        actual_result = ingestor.iter_normalized_fields(logins=iter(logins_returned_user4))
+        self.assertIsInstance(actual_result, Iterator)
+        self.assertListEqual(ingestor.normalize_fields(logins=logins_returned_user4), list(actual_result))
+
+    def test_process_logins_bulk_default(self):
+        # test the default process_logins_bulk() implementation, that streams the logins of each user returned by process_users()
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+        logins_returned_user1 = load_test_data("test_data_elasticsearch_returned_logins_user1")
+        logins_returned_user2 = load_test_data("test_data_elasticsearch_returned_logins_user2")
+        ingestor = OpensearchIngestion(ingestion_config=self.ingestion_config["opensearch"], mapping=self.ingestion_config["opensearch"]["custom_mapping"])
+        with patch.object(ingestor, "process_users", return_value=["Stitch", "scooby.doo@gmail.com"]), patch.object(
+            ingestor, "iter_user_logins", side_effect=[iter(logins_returned_user1), iter(logins_returned_user2)]
+        ) as mock_iter_user_logins:
+            actual_result = [(username, list(user_logins)) for username, user_logins in ingestor.process_logins_bulk(start_date, end_date)]
+        self.assertListEqual([("Stitch", logins_returned_user1), ("scooby.doo@gmail.com", logins_returned_user2)], actual_result)
+        mock_iter_user_logins.assert_any_call(start_date, end_date, "Stitch")
+        mock_iter_user_logins.assert_any_call(start_date, end_date, "scooby.doo@gmail.com")
+
+    def test_elasticsearch_user_logins_single_page(self):
+        # the logins of a user that fit in a page are fetched with a single search, without a point in time
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+        hit = {"_id": "log_id_1", "_index": "cloud-test_data", "_source": {"user": {"name": "Stitch"}}}
+        ingestor = ElasticsearchIngestion(
+            ingestion_config=self.ingestion_config["elasticsearch"], mapping=self.ingestion_config["elasticsearch"]["custom_mapping"]
+        )
+        response = MagicMock()
+        response.hits.hits = [MagicMock(to_dict=MagicMock(return_value=hit))]
+        expected_login = {"_index": "cloud", "_id": "log_id_1", "user": {"name": "Stitch"}}
+        with patch("impossible_travel.ingestion.elasticsearch_ingestion.Search.execute", return_value=response) as mock_execute, patch(
+            "impossible_travel.ingestion.elasticsearch_ingestion.Search.point_in_time"
+        ) as mock_point_in_time:
+            self.assertListEqual([expected_login], list(ingestor.iter_user_logins(start_date, end_date, "Stitch")))
+        mock_execute.assert_called_once()
+        mock_point_in_time.assert_not_called()
+        client = MagicMock(search=AsyncMock(return_value={"hits": {"hits": [hit]}}), open_point_in_time=AsyncMock())
+        self.assertListEqual([expected_login], asyncio.run(ingestor._async_user_logins(client, start_date, end_date, "Stitch")))
+        client.search.assert_awaited_once()
+        client.open_point_in_time.assert_not_called()
+
+    def test_iter_concurrently(self):
+        # test that _iter_concurrently() runs at most "concurrency" requests in flight, returning the logins of all the users
+        ingestor = OpensearchIngestion(
+            ingestion_config={**self.ingestion_config["opensearch"], "concurrency": 3}, mapping=self.ingestion_config["opensearch"]["custom_mapping"]
+        )
+        client = MagicMock(close=AsyncMock())
+        in_flight = []
+        max_in_flight = 0
+
+        async def fetch(fetch_client, username):
+            nonlocal max_in_flight
+            self.assertIs(client, fetch_client)
+            in_flight.append(username)
+            max_in_flight = max(max_in_flight, len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(username)
+            if username == "user_error":
+                raise ValueError("query error")
+            return [{"_id": f"{username}_login"}]
+
+        usernames = [f"user_{i}" for i in range(10)]
+        actual_result = dict(ingestor._iter_concurrently(client_factory=lambda: client, fetch=fetch, usernames=usernames))
+        self.assertEqual(3, max_in_flight)
+        self.assertCountEqual(usernames, actual_result.keys())
+        self.assertListEqual([{"_id": "user_0_login"}], actual_result["user_0"])
+        client.close.assert_awaited_once()
+
+    def test_iter_concurrently_error(self):
+        # test that the error of a user is raised to the consumer, instead of returning the user without logins
+        ingestor = OpensearchIngestion(
+            ingestion_config={**self.ingestion_config["opensearch"], "concurrency": 3}, mapping=self.ingestion_config["opensearch"]["custom_mapping"]
+        )
+        client = MagicMock(close=AsyncMock())
+        fetched = []
+
+        async def fetch(fetch_client, username):
+            await asyncio.sleep(0.01)
+            if username == "user_error":
+                raise ValueError("query error")
+            fetched.append(username)
+            return [{"_id": f"{username}_login"}]
+
+        usernames = ["user_0", "user_error"] + [f"user_{i}" for i in range(1, 100)]
+        actual_result = {}
+        with self.assertLogs(ingestor.logger, level="ERROR"):
+            with self.assertRaises(ValueError):
+                for username, user_logins in ingestor._iter_concurrently(client_factory=lambda: client, fetch=fetch, usernames=usernames):
+                    actual_result[username] = user_logins
+        self.assertNotIn("user_error", actual_result)
+        # the other workers don't fetch the next users, and the client is closed
+        self.assertLess(len(fetched), 99)
+        client.close.assert_awaited_once()
+
+    def test_iter_concurrently_early_stop(self):
+        # test that the event loop is stopped if the consumer doesn't consume all the results
+        ingestor = OpensearchIngestion(
+            ingestion_config={**self.ingestion_config["opensearch"], "concurrency": 2}, mapping=self.ingestion_config["opensearch"]["custom_mapping"]
+        )
+        client = MagicMock(close=AsyncMock())
+        fetched = []
+
+        async def fetch(fetch_client, username):
+            fetched.append(username)
+            return []
+
+        results = ingestor._iter_concurrently(client_factory=lambda: client, fetch=fetch, usernames=[f"user_{i}" for i in range(100)])
+        next(results)
+        results.close()
+        client.close.assert_awaited_once()
+        self.assertLess(len(fetched), 100)
+
+    def test_compile_field_accessor(self):
+        # the compiled accessors return the value of the (nested) field, or an empty string if the path doesn't exist
+        login = {"_id": "log_id_0", "source": {"ip": "192.0.2.1", "geo": {"location": {"lat": 37.2924}}, "as": ""}}
+        self.assertEqual("log_id_0", compile_field_accessor("_id")(login))
+        self.assertEqual("", compile_field_accessor("_index")(login))
+        self.assertEqual("192.0.2.1", compile_field_accessor("source.ip")(login))
+        self.assertEqual(37.2924, compile_field_accessor("source.geo.location.lat")(login))
+        self.assertEqual("", compile_field_accessor("source.geo.location.lon")(login))
+        self.assertEqual("", compile_field_accessor("source.as.organization.name")(login))
+        self.assertEqual("", compile_field_accessor("source.ip.version")(login))
+
+    def test_mapping_compiled(self):
+        # the extraction plan is compiled again when the mapping is changed
+        ingestor = ElasticsearchIngestion(
+            ingestion_config=self.ingestion_config["elasticsearch"], mapping=self.ingestion_config["elasticsearch"]["custom_mapping"]
+        )
+        ingestor.mapping = {"@timestamp": "timestamp", "source.ip": "ip", "source.geo.country_name": "country", "lat": "lat", "lon": "lon"}
+        login = {"@timestamp": "2025-02-26T13:40:15.173Z", "source": {"ip": "192.0.2.1", "geo": {"country_name": "Japan"}}, "lat": 37.2924, "lon": 136.2759}
+        self.assertListEqual(
+            [{"timestamp": "2025-02-26T13:40:15.173Z", "ip": "192.0.2.1", "country": "Japan", "lat": 37.2924, "lon": 136.2759}],
+            ingestor.normalize_fields(logins=[login]),
+        )
+        # without all the required fields in the mapping, all the logins are skipped
+        ingestor.mapping = {"@timestamp": "timestamp"}
+        self.assertListEqual([], ingestor.normalize_fields(logins=[login]))
+
+    def test_normalize_fields_compiled(self):
+        # the compiled extraction plan normalizes the hits as walking the mapping for each login does
+        def normalize_fields_not_compiled(mapping: dict, logins: list) -> list:
+            normalized_logins = []
+            for login in logins:
+                normalized_data = {}
+                for ingestion_key, buffalogs_key in mapping.items():
+                    value = login
+                    for k in ingestion_key.split("."):
+                        value = value[k] if isinstance(value, dict) and k in value else ""
+                    normalized_data[buffalogs_key] = value
+                if all(normalized_data.get(field) for field in ("timestamp", "ip", "country", "lat", "lon")):
+                    normalized_logins.append(normalized_data)
+            return normalized_logins
+
+        mapping = self.ingestion_config["elasticsearch"]["custom_mapping"]
+        ingestor = ElasticsearchIngestion(ingestion_config=self.ingestion_config["elasticsearch"], mapping=mapping)
+        hits = [
+            {
+                "_id": f"log_id_{i}",
+                "_index": "cloud",
+                "@timestamp": "2025-02-26T13:40:15.173Z",
+                "user": {"name": f"user_{i % 100}"},
+                "user_agent": {"original": "Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:109.0) Gecko/20100101 Firefox/109.0"},
+                "source": {
+                    "ip": "192.0.2.1",
+                    "as": {"organization": {"name": "ISP"}},
+                    "geo": {"country_name": "Japan", "location": {"lat": 37.2924, "lon": 136.2759}},
+                },
+            }
+            for i in range(1_000)
+        ]
+        # every 10th hit has no geolocation, so it's skipped
+        for hit in hits[::10]:
+            del hit["source"]["geo"]
+
+        self.assertListEqual(normalize_fields_not_compiled(mapping, hits), ingestor.normalize_fields(logins=hits))
@@ -1,5 +1,5 @@
 from datetime import datetime, timezone
-from typing import List
+from typing import Iterator, List
 
 import elasticsearch
 from django.test import TestCase
@@ -198,3 +198,51 @@ class ElasticsearchIngestionTestCase(TestCase):
         user5_logins = elastic_ingestor.process_user_logins(start_date, end_date, username="bugs.bunny2")
         self.assertEqual(1, len(user5_logins))
         self.assertListEqual(expected_return_user5, user5_logins)
+
+    def test_process_logins_bulk_Exception(self):
+        # test the function process_logins_bulk with a generic exception (e.g. for wrong indexes)
+        self.elastic_config["indexes"] = "unexisting-index"
+        start_date = datetime(2025, 2, 26, 11, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 12, 00, tzinfo=timezone.utc)
+        elastic_ingestor = ElasticsearchIngestion(ingestion_config=self.elastic_config, mapping=self.elastic_config["custom_mapping"])
+        # the error is raised, so the time window isn't marked as processed
+        with self.assertLogs(elastic_ingestor.logger, level="ERROR"), self.assertRaises(elasticsearch.NotFoundError):
+            list(elastic_ingestor.process_logins_bulk(start_date, end_date))
+
+    def test_process_logins_bulk_data_all(self):
+        # test the function process_logins_bulk with all data on Elasticsearch in the specific datetime range, paginating 1 login per page
+        self.elastic_config["bucket_size"] = 1
+        start_date = datetime(2025, 2, 26, 10, 40, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 18, 10, tzinfo=timezone.utc)
+        elastic_ingestor = ElasticsearchIngestion(ingestion_config=self.elastic_config, mapping=self.elastic_config["custom_mapping"])
+        # the logins are grouped by user, sorted by username
+        users_logins = {username: list(user_logins) for username, user_logins in elastic_ingestor.process_logins_bulk(start_date, end_date)}
+        self.assertListEqual(["Stitch", "bugs-bunny@organization.com", "bugs.bunny", "bugs.bunny2", "scooby.doo@gmail.com"], list(users_logins))
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user1"), users_logins["Stitch"])
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user2"), users_logins["scooby.doo@gmail.com"])
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user3"), users_logins["bugs-bunny@organization.com"])
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user4"), users_logins["bugs.bunny"])
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user5"), users_logins["bugs.bunny2"])
+
+    def test_iter_user_logins_data_all(self):
+        # test the function iter_user_logins with all data on Elasticsearch in the specific datetime range, paginating 1 login per page
+        self.elastic_config["bucket_size"] = 1
+        start_date = datetime(2025, 2, 26, 10, 40, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 18, 10, tzinfo=timezone.utc)
+        elastic_ingestor = ElasticsearchIngestion(ingestion_config=self.elastic_config, mapping=self.elastic_config["custom_mapping"])
+        user_logins = elastic_ingestor.iter_user_logins(start_date, end_date, username="scooby.doo@gmail.com")
+        self.assertIsInstance(user_logins, Iterator)
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user2"), list(user_logins))
+
+    def test_process_users_logins_concurrent_data_all(self):
+        # test the function process_users_logins querying the users concurrently with the asynchronous client, paginating 1 login per page
+        self.elastic_config["bucket_size"] = 1
+        self.elastic_config["concurrency"] = 2
+        start_date = datetime(2025, 2, 26, 10, 40, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 18, 10, tzinfo=timezone.utc)
+        elastic_ingestor = ElasticsearchIngestion(ingestion_config=self.elastic_config, mapping=self.elastic_config["custom_mapping"])
+        users_logins = dict(elastic_ingestor.process_users_logins(start_date, end_date, ["Stitch", "scooby.doo@gmail.com", "bugs.bunny"]))
+        self.assertCountEqual(["Stitch", "scooby.doo@gmail.com", "bugs.bunny"], users_logins.keys())
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user1"), users_logins["Stitch"])
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user2"), users_logins["scooby.doo@gmail.com"])
+        self.assertListEqual(load_test_data("test_data_elasticsearch_returned_logins_user4"), users_logins["bugs.bunny"])
@@ -1,5 +1,5 @@
 from datetime import datetime, timezone
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from django.test import TestCase
 from impossible_travel.ingestion.opensearch_ingestion import OpensearchIngestion
@@ -148,6 +148,101 @@ class OpensearchIngestionTestCase(TestCase):
         self.assertEqual(result[0]["_index"], "cloud")  # Should be normalized to "cloud"
         mock_client.search.assert_called_once()
 
+    @patch("impossible_travel.ingestion.opensearch_ingestion.helpers.scan")
+    @patch("impossible_travel.ingestion.opensearch_ingestion.OpenSearch")
+    def test_iter_user_logins(self, mock_opensearch, mock_scan):
+        """Test iter_user_logins method streaming the hits of a mocked sorted scroll search"""
+        mock_client = MagicMock()
+        mock_opensearch.return_value = mock_client
+        mock_scan.return_value = iter(self.user_logins_response["hits"]["hits"])
+
+        ingestor = OpensearchIngestion(self.opensearch_config, mapping={})
+
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+        result = ingestor.iter_user_logins(start_date, end_date, "Stitch")
+        mock_scan.assert_not_called()  # lazy generator
+        result = list(result)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0]["user.name"], "Stitch")
+        self.assertEqual(result[0]["_index"], "cloud")
+        _, kwargs = mock_scan.call_args
+        self.assertEqual(kwargs["size"], self.opensearch_config["bucket_size"])
+        self.assertTrue(kwargs["preserve_order"])
+        self.assertNotIn("size", kwargs["query"])
+
+    @patch("impossible_travel.ingestion.opensearch_ingestion.helpers.scan")
+    @patch("impossible_travel.ingestion.opensearch_ingestion.OpenSearch")
+    def test_iter_user_logins_error(self, mock_opensearch, mock_scan):
+        """Test that an error in the middle of the scroll search is raised, instead of returning only the first logins"""
+        mock_opensearch.return_value = MagicMock()
+
+        def scan(*args, **kwargs):
+            yield self.user_logins_response["hits"]["hits"][0]
+            raise TimeoutError("scroll expired")
+
+        mock_scan.side_effect = scan
+        ingestor = OpensearchIngestion(self.opensearch_config, mapping={})
+
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+        with self.assertLogs(ingestor.logger, level="ERROR"):
+            with self.assertRaises(TimeoutError):
+                list(ingestor.iter_user_logins(start_date, end_date, "Stitch"))
+
+    @patch("impossible_travel.ingestion.opensearch_ingestion.helpers.async_scan")
+    @patch("impossible_travel.ingestion.opensearch_ingestion.AsyncOpenSearch", create=True)
+    @patch("impossible_travel.ingestion.opensearch_ingestion.OpenSearch")
+    def test_process_users_logins_concurrent(self, mock_opensearch, mock_async_opensearch, mock_async_scan):
+        """Test process_users_logins method querying the users concurrently with the asynchronous client"""
+        mock_async_opensearch.return_value = MagicMock(close=AsyncMock())
+        hits = self.user_logins_response["hits"]["hits"]
+
+        async def async_scan(client, query, index, size, preserve_order):
+            for hit in hits:
+                yield hit
+
+        mock_async_scan.side_effect = async_scan
+        ingestor = OpensearchIngestion({**self.opensearch_config, "concurrency": 2}, mapping={})
+
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+        result = {username: list(logins) for username, logins in ingestor.process_users_logins(start_date, end_date, ["Stitch", "Jessica", "Andrew"])}
+        self.assertCountEqual(["Stitch", "Jessica", "Andrew"], result.keys())
+        self.assertEqual(["log_id_0", "log_id_1"], [login["_id"] for login in result["Stitch"]])
+        self.assertEqual(3, mock_async_scan.call_count)
+        _, kwargs = mock_async_opensearch.call_args
+        self.assertEqual(self.opensearch_config["pool_size"], kwargs["pool_maxsize"])
+        mock_async_opensearch.return_value.close.assert_awaited_once()
+
+    @patch("impossible_travel.ingestion.opensearch_ingestion.OpenSearch")
+    def test_process_users_logins_sequential(self, mock_opensearch):
+        """Test process_users_logins method with the default concurrency, querying the users one after the other"""
+        ingestor = OpensearchIngestion(self.opensearch_config, mapping={})
+        with patch.object(ingestor, "iter_user_logins", side_effect=lambda start_date, end_date, username: iter([username])) as mock_iter_user_logins:
+            result = list(ingestor.process_users_logins(None, None, ["Stitch", "Jessica"]))
+        self.assertEqual(["Stitch", "Jessica"], [username for username, _ in result])
+        self.assertEqual(2, mock_iter_user_logins.call_count)
+
+    @patch("impossible_travel.ingestion.opensearch_ingestion.OpenSearch")
+    def test_count_logins(self, mock_opensearch):
+        """Test count_logins method, returning None if the count query fails"""
+        mock_client = MagicMock()
+        mock_opensearch.return_value = mock_client
+        mock_client.count.return_value = {"count": 42}
+        ingestor = OpensearchIngestion(self.opensearch_config, mapping={})
+
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+        self.assertEqual(42, ingestor.count_logins(start_date, end_date))
+        mock_client.count.side_effect = ConnectionError("Connection failed")
+        with self.assertLogs(ingestor.logger, level="ERROR"):
+            self.assertIsNone(ingestor.count_logins(start_date, end_date))
+
     @patch("impossible_travel.ingestion.opensearch_ingestion.OpenSearch")
     def test_process_user_logins_empty_result(self, mock_opensearch):
         """Test process_user_logins with empty search results"""
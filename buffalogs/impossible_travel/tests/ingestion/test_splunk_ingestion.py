@@ -1,3 +1,5 @@
+import io
+import json
 from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
 
@@ -120,6 +122,119 @@ class SplunkIngestionTestCase(TestCase):
             self.assertEqual(result[0]["user.name"], "Stitch")
             mock_service.jobs.create.assert_called_once()
 
+    @patch("splunklib.client.connect")
+    def test_iter_user_logins_pages(self, mock_connect):
+        mock_service = MagicMock()
+        mock_connect.return_value = mock_service
+        mock_job = MagicMock()
+        mock_job.is_done.return_value = True
+        mock_service.jobs.create.return_value = mock_job
+
+        # 1 login per page: the 2 full pages are followed by an empty one
+        with patch("splunklib.results.ResultsReader", side_effect=[[self.user1_test_data[0]], [self.user1_test_data[1]], []]):
+            ingestor = SplunkIngestion({**self.splunk_config, "bucket_size": 1}, mapping={})
+
+            start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+            end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+            result = list(ingestor.iter_user_logins(start_date, end_date, "Stitch"))
+        self.assertListEqual(self.user1_test_data, result)
+        mock_service.jobs.create.assert_called_once()
+        self.assertListEqual([0, 1, 2], [kwargs["offset"] for _, kwargs in mock_job.results.call_args_list])
+
+    @patch("splunklib.client.connect")
+    def test_iter_user_logins_error(self, mock_connect):
+        mock_service = MagicMock()
+        mock_connect.return_value = mock_service
+        mock_service.jobs.create.return_value = MagicMock()
+
+        # the first page is read, then the request of the second page fails
+        with patch("splunklib.results.ResultsReader", side_effect=[[self.user1_test_data[0]], ConnectionError("Connection failed")]):
+            ingestor = SplunkIngestion({**self.splunk_config, "bucket_size": 1}, mapping={})
+
+            start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+            end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+            with self.assertLogs(ingestor.logger, level="ERROR"):
+                with self.assertRaises(ConnectionError):
+                    list(ingestor.iter_user_logins(start_date, end_date, "Stitch"))
+
+    @patch("splunklib.client.connect")
+    def test_process_logins_bulk(self, mock_connect):
+        mock_service = MagicMock()
+        mock_connect.return_value = mock_service
+        user2_login = {**self.user1_test_data[0], "user.name": "scooby.doo@gmail.com", "_id": "log_id_2"}
+        export_lines = [
+            {"preview": True, "offset": 0, "result": self.user1_test_data[1]},
+            {"messages": [{"type": "INFO", "text": "test message"}]},
+            {"preview": False, "offset": 0, "result": self.user1_test_data[0]},
+            {"preview": False, "offset": 1, "result": self.user1_test_data[1]},
+            {"preview": False, "offset": 2, "lastrow": True, "result": user2_login},
+        ]
+        mock_service.jobs.export.return_value = io.BytesIO("\n".join(json.dumps(line) for line in export_lines).encode())
+        ingestor = SplunkIngestion(self.splunk_config, mapping={})
+
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+        result = [(username, list(user_logins)) for username, user_logins in ingestor.process_logins_bulk(start_date, end_date)]
+        # a single export search for the whole time window, without per-user jobs
+        self.assertListEqual([("Stitch", self.user1_test_data), ("scooby.doo@gmail.com", [user2_login])], result)
+        mock_service.jobs.export.assert_called_once()
+        mock_service.jobs.create.assert_not_called()
+        _, kwargs = mock_service.jobs.export.call_args
+        self.assertEqual("json", kwargs["output_mode"])
+        self.assertEqual("2025-02-26T13:30:00.000Z", kwargs["earliest_time"])
+
+    @patch("splunklib.client.connect")
+    def test_process_logins_bulk_connection_error(self, mock_connect):
+        mock_service = MagicMock()
+        mock_connect.return_value = mock_service
+        mock_service.jobs.export.side_effect = ConnectionError("Connection failed")
+        ingestor = SplunkIngestion(self.splunk_config, mapping={})
+
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+        with self.assertLogs(ingestor.logger, level="ERROR"):
+            with self.assertRaises(ConnectionError):
+                list(ingestor.process_logins_bulk(start_date, end_date))
+
+    @patch("splunklib.client.connect")
+    def test_process_logins_bulk_stream_error(self, mock_connect):
+        mock_connect.return_value = MagicMock()
+        ingestor = SplunkIngestion(self.splunk_config, mapping={})
+
+        def export_lines(stream):
+            yield json.dumps({"preview": False, "offset": 0, "result": self.user1_test_data[0]}).encode()
+            raise ConnectionResetError("Connection reset by peer")
+
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+        # the error in the middle of the stream is raised, instead of returning only the logins read before it
+        with patch("impossible_travel.ingestion.splunk_ingestion.io.BufferedReader", side_effect=export_lines):
+            with self.assertLogs(ingestor.logger, level="ERROR"):
+                with self.assertRaises(ConnectionResetError):
+                    [list(user_logins) for _, user_logins in ingestor.process_logins_bulk(start_date, end_date)]
+
+    @patch("splunklib.client.connect")
+    def test_count_logins(self, mock_connect):
+        mock_service = MagicMock()
+        mock_connect.return_value = mock_service
+        mock_service.jobs.export.return_value = io.BytesIO(json.dumps({"preview": False, "offset": 0, "result": {"count": "42"}}).encode())
+        ingestor = SplunkIngestion(self.splunk_config, mapping={})
+
+        start_date = datetime(2025, 2, 26, 13, 30, tzinfo=timezone.utc)
+        end_date = datetime(2025, 2, 26, 14, 0, tzinfo=timezone.utc)
+
+        self.assertEqual(42, ingestor.count_logins(start_date, end_date))
+        # the logins are counted from the indexed metadata, without scanning the raw events
+        self.assertTrue(mock_service.jobs.export.call_args.args[0].startswith("| tstats count"))
+        mock_service.jobs.export.side_effect = ConnectionError("Connection failed")
+        with self.assertLogs(ingestor.logger, level="ERROR"):
+            self.assertIsNone(ingestor.count_logins(start_date, end_date))
+
     @patch("splunklib.client.connect")
     def test_process_user_logins_empty_result(self, mock_connect):
         mock_service = MagicMock()
@@ -1,3 +1,6 @@
+from importlib import import_module
+from unittest.mock import patch
+
 from django.test import TransactionTestCase
 from django_test_migrations.migrator import Migrator
 
@@ -72,3 +75,39 @@ class TestDeviceFingerprintMigration0022(BaseMigrationTestCase):
 
         second_record = LoginNew.objects.get(user_agent=ua)
         self.assertEqual(second_record.device_fingerprint, "windows-10-desktop-chrome")
+
+
+class TestAlertLoginFieldsMigration0025(BaseMigrationTestCase):
+    migrate_from = "0024_composite_indexes"
+    migrate_to = "0025_alert_login_fields"
+
+    def test_migration_backfill(self):
+        User = self.old_state.apps.get_model(self.app_name, "User")
+        Alert = self.old_state.apps.get_model(self.app_name, "Alert")
+
+        test_user = User.objects.create(username="backfill_user")
+        login_raw_data = {
+            "ip": "203.0.113.4",
+            "lat": 37.7468,
+            "lon": -84.3014,
+            "agent": "Mozilla/5.0",
+            "country": "United States",
+            "timestamp": "2025-03-14T14:16:05.401Z",
+        }
+        Alert.objects.create(user_id=test_user.id, name="New Device", login_raw_data=login_raw_data, description="test")
+        Alert.objects.create(user_id=test_user.id, name="New Device", login_raw_data={}, description="empty login")
+
+        # a chunk for each alert
+        with patch.object(import_module("impossible_travel.migrations.0025_alert_login_fields"), "BACKFILL_BATCH_SIZE", 1):
+            new_state = self.apply_tested_migration()
+        AlertNew = new_state.apps.get_model(self.app_name, "Alert")
+        record = AlertNew.objects.get(description="test")
+        self.assertEqual("2025-03-14T14:16:05.401000+00:00", record.login_timestamp.isoformat())
+        self.assertEqual("United States", record.country)
+        self.assertEqual("203.0.113.4", record.ip)
+        self.assertEqual(37.7468, record.latitude)
+        self.assertEqual(-84.3014, record.longitude)
+        self.assertEqual("Mozilla/5.0", record.user_agent)
+        record = AlertNew.objects.get(description="empty login")
+        self.assertIsNone(record.login_timestamp)
+        self.assertEqual("", record.country)
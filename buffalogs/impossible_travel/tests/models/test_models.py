@@ -1,6 +1,11 @@
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from unittest.mock import patch
+
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from impossible_travel.models import Alert, AlertDetectionType, AlertFilterType, Config, ExecutionModes, Login, TaskSettings, User, UserRiskScoreType, UsersIP
 
@@ -16,7 +21,20 @@ class UserModelTest(TestCase):
         """Check the existing model fields"""
         model_fields = [f.name for f in User._meta.get_fields()]
         # add also foreignkey fields
-        expected_fields = ["id", "risk_score", "username", "created", "updated", "login", "alert", "usersip"]
+        expected_fields = [
+            "id",
+            "risk_score",
+            "username",
+            "created",
+            "updated",
+            "risk_alert_count",
+            "alert_count",
+            "login_count",
+            "last_login",
+            "login",
+            "alert",
+            "usersip",
+        ]
         self.assertCountEqual(model_fields, expected_fields)
 
     def test_user_creation(self):
@@ -56,6 +74,32 @@ class UserModelTest(TestCase):
         with self.assertRaises(IntegrityError):
             invalid_user.save()
 
+    def test_increment_counters(self):
+        """Test the atomic update of the denormalized counters, in the DB and in the object"""
+        last_login = timezone.now()
+        self.user.increment_counters(logins=2, alerts=3, risk_alerts=1, last_login=last_login)
+        # an older login doesn't change the last_login
+        self.user.increment_counters(logins=1, last_login=last_login - timezone.timedelta(days=1))
+        db_user = User.objects.get(id=self.user.id)
+        for user in [self.user, db_user]:
+            self.assertEqual(3, user.login_count)
+            self.assertEqual(3, user.alert_count)
+            self.assertEqual(1, user.risk_alert_count)
+            self.assertEqual(last_login, user.last_login)
+
+    def test_rebuild_counters(self):
+        """Test the counters recomputed from the logins and alerts of the users"""
+        Login.objects.create(user=self.user, index="cloud", country="Italy", timestamp=timezone.now())
+        Alert.objects.create(user=self.user, name=AlertDetectionType.IMP_TRAVEL, login_raw_data={}, description="test")
+        Alert.objects.create(user=self.user, name=AlertDetectionType.NEW_DEVICE, login_raw_data={}, description="test")
+        User.objects.create(username="no_logins_user", login_count=5)
+        self.assertEqual(2, User.rebuild_counters(risk_alerts_types=[AlertDetectionType.IMP_TRAVEL]))
+        self.user.refresh_from_db()
+        self.assertEqual((1, 2, 1), (self.user.login_count, self.user.alert_count, self.user.risk_alert_count))
+        self.assertEqual(self.user.login_set.get().timestamp, self.user.last_login)
+        no_logins_user = User.objects.get(username="no_logins_user")
+        self.assertEqual((0, 0, 0, None), (no_logins_user.login_count, no_logins_user.alert_count, no_logins_user.risk_alert_count, no_logins_user.last_login))
+
 
 class LoginModelTest(TestCase):
     def setUp(self):
@@ -268,9 +312,55 @@ class AlertModelTest(TestCase):
             "filter_type",
             "tags",
             "notified_status",
+            "login_timestamp",
+            "country",
+            "ip",
+            "latitude",
+            "longitude",
+            "user_agent",
+            "notificationdelivery",
         ]
         self.assertCountEqual(model_fields, expected_fields)
 
+    def test_login_fields(self):
+        """The login columns are copied from the login_raw_data when the alert is saved"""
+        self.assertEqual("1.1.1.1", self.alert.ip)
+        self.assertIsNone(self.alert.login_timestamp)
+        self.alert.login_raw_data = {
+            "ip": "2001:0db8::0001",
+            "lat": "45.4642",
+            "lon": 9.19,
+            "country": "Italy",
+            "agent": "Mozilla/5.0",
+            "timestamp": "2025-03-14T14:16:05.401Z",
+        }
+        self.alert.save(update_fields=["login_raw_data"])
+        alert = Alert.objects.get(id=self.alert.id)
+        self.assertEqual(datetime(2025, 3, 14, 14, 16, 5, 401000, tzinfo=dt_timezone.utc), alert.login_timestamp)
+        self.assertEqual("Italy", alert.country)
+        self.assertEqual("2001:db8::1", alert.ip)
+        self.assertEqual(45.4642, alert.latitude)
+        self.assertEqual(9.19, alert.longitude)
+        self.assertEqual("Mozilla/5.0", alert.user_agent)
+
+    def test_login_fields_invalid(self):
+        """The missing or invalid values of the login_raw_data are ignored"""
+        alert = Alert(name=AlertDetectionType.NEW_DEVICE, user=self.user, login_raw_data={"ip": "not-an-ip", "lat": None, "timestamp": "yesterday"})
+        alert.set_login_fields()
+        self.assertIsNone(alert.ip)
+        self.assertIsNone(alert.latitude)
+        self.assertIsNone(alert.login_timestamp)
+        self.assertEqual("", alert.country)
+
+    def test_login_fields_bulk_create(self):
+        """The login columns are filled also by bulk_create()"""
+        Alert.objects.bulk_create(
+            [Alert(name=AlertDetectionType.IMP_TRAVEL, user=self.user, login_raw_data={"country": "France", "timestamp": "2025-01-01T00:00:00Z"})]
+        )
+        alert = Alert.objects.get(name=AlertDetectionType.IMP_TRAVEL)
+        self.assertEqual("France", alert.country)
+        self.assertEqual(datetime(2025, 1, 1, tzinfo=dt_timezone.utc), alert.login_timestamp)
+
     def test_alert_creation(self):
         """Check correct alert creation"""
         self.assertIsInstance(self.alert, Alert)
@@ -336,6 +426,19 @@ class AlertModelTest(TestCase):
         self.alert.refresh_from_db()
         self.assertGreater(self.alert.updated, old_updated)
 
+    def test_mark_notified(self):
+        """The notified status of the alerter is merged into the notified_status JSON, with a single UPDATE"""
+        Alert.objects.filter(id=self.alert.id).update(notified_status={"slack": False, "email": True})
+        other_alert = Alert.objects.create(name=AlertDetectionType.NEW_COUNTRY, user=self.user, login_raw_data={}, description="test")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(2, Alert.objects.filter(user=self.user).mark_notified("slack"))
+        self.assertEqual(1, len(queries))
+        self.assertNotIn("login_raw_data", queries[0]["sql"])
+        self.alert.refresh_from_db()
+        other_alert.refresh_from_db()
+        self.assertDictEqual({"slack": True, "email": True}, self.alert.notified_status)
+        self.assertDictEqual({"slack": True}, other_alert.notified_status)
+
 
 class TaskSettingsModelTest(TestCase):
     def setUp(self):
@@ -433,6 +536,19 @@ class ConfigModelTest(TestCase):
         self.assertIsNotNone(self.config.created)
         self.assertIsNotNone(self.config.updated)
 
+    def test_config_rebuild_counters(self):
+        """The counters of the users are rebuilt by a task, after the commit, only if the risk_score_increment_alerts change"""
+        with patch("impossible_travel.tasks.rebuild_user_counters.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.config.vel_accepted = 900
+                self.config.save()
+            self.assertEqual([], callbacks)
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.config.risk_score_increment_alerts = [AlertDetectionType.NEW_DEVICE, AlertDetectionType.IMP_TRAVEL]
+                self.config.save()
+            self.assertEqual(1, len(callbacks))
+        mock_delay.assert_called_once_with()
+
     def test_config_singleton_constraint(self):
         """Test that only one Config object can exist"""
         with self.assertRaises(ValidationError):
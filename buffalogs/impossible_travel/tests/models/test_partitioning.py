@@ -0,0 +1,145 @@
+import io
+from datetime import datetime, timezone
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from impossible_travel.constants import AlertDetectionType
+from impossible_travel.models import Alert, Login, User
+from impossible_travel.modules import partitioning
+
+NOW = datetime(2025, 3, 10, tzinfo=timezone.utc)
+
+
+def table_exists(name: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        return cursor.fetchone()[0] is not None
+
+
+class TestPartitioning(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="Lorena Goldoni")
+        for day in (datetime(2025, 1, 5), datetime(2025, 1, 20), datetime(2025, 2, 3), datetime(2025, 2, 25)):
+            Login.objects.create(user=self.user, timestamp=day.replace(tzinfo=timezone.utc), index="cloud", country="Italy", event_id=f"{day:%m%d}")
+        alert = Alert.objects.create(user=self.user, name=AlertDetectionType.NEW_DEVICE, login_raw_data={}, description="test")
+        Alert.objects.filter(id=alert.id).update(created=datetime(2025, 1, 10, tzinfo=timezone.utc))
+
+    def test_partition_table(self):
+        self.assertFalse(partitioning.is_partitioned(Login))
+        max_id = Login.objects.latest("id").id
+        partitioning.partition_table(Login, months_ahead=1, now=NOW)
+        self.assertTrue(partitioning.is_partitioned(Login))
+        self.assertListEqual(
+            ["impossible_travel_login_p202501", "impossible_travel_login_p202502", "impossible_travel_login_p202503", "impossible_travel_login_p202504"],
+            [name for _, name in sorted(partitioning.get_partitions(Login).items())],
+        )
+        # the rows, the identity and the relations are preserved
+        self.assertEqual(4, self.user.login_set.count())
+        new_login = Login.objects.create(user=self.user, timestamp=NOW, index="cloud")
+        self.assertGreater(new_login.id, max_id)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM impossible_travel_login_p202503")
+            self.assertEqual(1, cursor.fetchone()[0])
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'impossible_travel_login'")
+            self.assertIn("login_user_timestamp", [row[0] for row in cursor.fetchall()])
+        self.user.delete()
+        self.assertFalse(Login.objects.exists())
+
+    def test_partition_table_batches(self):
+        logins = list(Login.objects.order_by("id"))
+        login_ids = [login.id for login in logins]
+        copied_batches = []
+
+        def after_batch(last_id):
+            # the rows added and updated while the table is copied are copied again before the swap
+            if not copied_batches:
+                Login.objects.create(user=self.user, timestamp=NOW, index="cloud", event_id="during_copy")
+                logins[0].country = "France"
+                logins[0].save()
+                # the bulk updates of the detection don't change the updated field
+                logins[2].ip = "192.0.2.10"
+                Login.objects.bulk_update([logins[2]], fields=["ip"])
+                # a row already copied is deleted
+                logins[1].delete()
+            copied_batches.append(last_id)
+
+        partitioning.partition_table(Login, months_ahead=0, now=NOW, batch_size=2, after_batch=after_batch)
+        self.assertListEqual([login_ids[1], login_ids[3], login_ids[3] + 1], copied_batches)
+        self.assertEqual(4, Login.objects.count())
+        self.assertEqual("France", Login.objects.get(id=logins[0].id).country)
+        self.assertEqual("192.0.2.10", Login.objects.get(id=logins[2].id).ip)
+        self.assertFalse(Login.objects.filter(id=login_ids[1]).exists())
+        self.assertTrue(Login.objects.filter(event_id="during_copy").exists())
+        self.assertFalse(table_exists("impossible_travel_login_partitioned"))
+        self.assertFalse(table_exists("impossible_travel_login_partition_changes"))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = 'impossible_travel_login'::regclass AND contype = 'p'")
+            self.assertListEqual([("impossible_travel_login_pkey",)], cursor.fetchall())
+
+    def test_partition_table_failed(self):
+        def after_batch(last_id):
+            raise RuntimeError("copy interrupted")
+
+        with self.assertRaises(RuntimeError):
+            partitioning.partition_table(Login, months_ahead=0, now=NOW, batch_size=2, after_batch=after_batch)
+        # the copy and the trigger recording the changes are dropped, the original table is left as it was
+        self.assertFalse(partitioning.is_partitioned(Login))
+        self.assertFalse(table_exists("impossible_travel_login_partitioned"))
+        self.assertFalse(table_exists("impossible_travel_login_partition_changes"))
+        Login.objects.create(user=self.user, timestamp=NOW, index="cloud")
+        self.assertEqual(5, Login.objects.count())
+
+    def test_create_partition_moves_default_rows(self):
+        partitioning.partition_table(Login, months_ahead=0, now=NOW)
+        # a login out of the existing partitions is saved in the default partition
+        Login.objects.create(user=self.user, timestamp=datetime(2025, 6, 1, tzinfo=timezone.utc), index="cloud", event_id="future")
+        created = partitioning.ensure_partitions(Login, months_ahead=1, now=datetime(2025, 5, 20, tzinfo=timezone.utc))
+        self.assertListEqual(["impossible_travel_login_p202505", "impossible_travel_login_p202506"], created)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT event_id FROM impossible_travel_login_p202506")
+            self.assertListEqual([("future",)], cursor.fetchall())
+            cursor.execute("SELECT COUNT(*) FROM impossible_travel_login_default")
+            self.assertEqual(0, cursor.fetchone()[0])
+        # nothing to do if the partitions already exist
+        self.assertListEqual([], partitioning.ensure_partitions(Login, months_ahead=1, now=datetime(2025, 5, 20, tzinfo=timezone.utc)))
+
+    def test_retention(self):
+        partitioning.partition_table(Login, months_ahead=0, now=NOW)
+        deleted = partitioning.delete_old_partitioned_data(Login, datetime(2025, 2, 15, tzinfo=timezone.utc), detach_only=False, batch_size=1)
+        # the January partition is dropped, the older login of February is deleted
+        self.assertEqual(1, deleted)
+        self.assertFalse(table_exists("impossible_travel_login_p202501"))
+        self.assertListEqual(["0225"], list(Login.objects.values_list("event_id", flat=True)))
+
+    def test_retention_counters(self):
+        User.rebuild_counters()
+        other_user = User.objects.create(username="Aisha Delgado", login_count=10)
+        partitioning.partition_table(Login, months_ahead=0, now=NOW)
+        partitioning.delete_old_partitioned_data(
+            Login, datetime(2025, 2, 15, tzinfo=timezone.utc), detach_only=False, batch_size=1, track_deletion=User.track_deleted_rows
+        )
+        # the counters of the users of the dropped partition and of the deleted rows are updated
+        self.user.refresh_from_db()
+        self.assertEqual(1, self.user.login_count)
+        self.assertEqual(datetime(2025, 2, 25, tzinfo=timezone.utc), self.user.last_login)
+        # the other users aren't updated
+        other_user.refresh_from_db()
+        self.assertEqual(10, other_user.login_count)
+
+    def test_retention_detach_only(self):
+        partitioning.partition_table(Alert, months_ahead=0, now=NOW)
+        partitioning.delete_old_partitioned_data(Alert, datetime(2025, 2, 1, tzinfo=timezone.utc), detach_only=True)
+        self.assertFalse(Alert.objects.exists())
+        # the detached partition is kept as a standalone table
+        self.assertTrue(table_exists("impossible_travel_alert_p202501"))
+        self.assertNotIn(datetime(2025, 1, 1, tzinfo=timezone.utc), partitioning.get_partitions(Alert))
+
+    def test_partition_tables_command(self):
+        out = io.StringIO()
+        call_command("partition_tables", "--model", "alert", stdout=out)
+        self.assertTrue(partitioning.is_partitioned(Alert))
+        self.assertFalse(partitioning.is_partitioned(Login))
+        self.assertIn("Partitioned the table impossible_travel_alert", out.getvalue())
+        call_command("partition_tables", "--model", "alert", stdout=out)
+        self.assertIn("The table impossible_travel_alert is already partitioned", out.getvalue())
@@ -124,6 +124,9 @@ class TestSerializers(TestCase):
                 ),
             ]
         )
+        # the logins and alerts are created in bulk, so the users' counters are rebuilt
+        User.rebuild_counters()
+        cls.db_user_alice.refresh_from_db()
 
     # ----------------------------------------------------------------------
     # Test QSerializer (Base for LoginSerializer and AlertSerializer)
@@ -1,4 +1,6 @@
 import io
+import json
+from datetime import datetime, timezone
 from unittest.mock import patch
 
 from django.conf import settings
@@ -8,7 +10,9 @@ from django.test import TestCase
 from impossible_travel.constants import AlertDetectionType, UserRiskScoreType
 from impossible_travel.management.commands.setup_config import Command, parse_field_value
 from impossible_travel.models import (
+    Alert,
     Config,
+    Login,
     User,
     get_default_allowed_countries,
     get_default_enabled_users,
@@ -317,3 +321,73 @@ class ResetUserRiskScoreCommandTests(TestCase):
             mock_update.assert_called_once_with(risk_score="Low")
             self.assertFalse(mock_save.called)
             self.assertIn("Successfully updated risk_score for 2 users to 'Low'.", out.getvalue())
+
+
+class BenchmarkPipelineCommandTests(TestCase):
+    def test_benchmark_json(self):
+        out = io.StringIO()
+        call_command(
+            "benchmark_pipeline", "--allow-live", "--users", "3", "--logins-per-user", "10", "--seed", "1", "--anomaly-rate", "0.5", "--json", stdout=out
+        )
+        results = json.loads(out.getvalue()[out.getvalue().index("{") : out.getvalue().rindex("}") + 1])
+        self.assertEqual(3, results["users"])
+        self.assertEqual(30, results["logins"])
+        self.assertGreater(results["queries"], 0)
+        self.assertLessEqual(results["user_latency_ms"]["p50"], results["user_latency_ms"]["max"])
+        self.assertTrue(results["alerts"])
+        # the benchmark data are deleted at the end of the run
+        self.assertFalse(User.objects.filter(username__startswith="benchmark_user").exists())
+        self.assertFalse(Login.objects.filter(user__username__startswith="benchmark_user").exists())
+
+    def test_benchmark_keep_data(self):
+        call_command("benchmark_pipeline", "--allow-live", "--users", "2", "--logins-per-user", "5", "--seed", "1", "--keep-data", stdout=io.StringIO())
+        self.assertEqual(2, User.objects.filter(username__startswith="benchmark_user").count())
+
+    def test_benchmark_background_logins(self):
+        out = io.StringIO()
+        call_command(
+            "benchmark_pipeline", "--allow-live", "--users", "2", "--logins-per-user", "5", "--seed", "1", "--background-logins", "1500", "--json", stdout=out
+        )
+        results = json.loads(out.getvalue()[out.getvalue().index("{") : out.getvalue().rindex("}") + 1])
+        self.assertEqual(results["stored_logins"] + 1500, results["table_logins"])
+        # the background logins are deleted at the end of the run, together with their users
+        self.assertFalse(User.objects.filter(username__startswith="benchmark_background").exists())
+        self.assertFalse(Login.objects.filter(event_id__startswith="background_").exists())
+
+    def test_benchmark_not_allowed(self):
+        # the benchmark doesn't write in the database without an explicit confirmation
+        with self.assertRaisesRegex(CommandError, "--allow-live"):
+            call_command("benchmark_pipeline", "--users", "2", stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(username__startswith="benchmark_user").exists())
+
+    def test_benchmark_invalid_options(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_pipeline", "--allow-live", "--anomaly-rate", "2", stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command("benchmark_pipeline", "--allow-live", "--background-logins", "-1", stdout=io.StringIO())
+
+
+class RebuildUserCountersCommandTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="alice")
+        Login.objects.create(user=self.user, timestamp=datetime(2025, 1, 1, tzinfo=timezone.utc), index="cloud", country="Italy")
+        Login.objects.create(user=self.user, timestamp=datetime(2025, 1, 2, tzinfo=timezone.utc), index="cloud", country="France")
+        Alert.objects.create(user=self.user, name=AlertDetectionType.IMP_TRAVEL, login_raw_data={}, description="test")
+        Alert.objects.create(user=self.user, name=AlertDetectionType.ANONYMOUS_IP_LOGIN, login_raw_data={}, description="test")
+
+    def test_rebuild_counters(self):
+        out = io.StringIO()
+        call_command("rebuild_user_counters", stdout=out)
+        self.user.refresh_from_db()
+        self.assertEqual(2, self.user.login_count)
+        self.assertEqual(2, self.user.alert_count)
+        self.assertEqual(
+            len({AlertDetectionType.IMP_TRAVEL, AlertDetectionType.ANONYMOUS_IP_LOGIN} & set(Config.objects.get(id=1).risk_score_increment_alerts)),
+            self.user.risk_alert_count,
+        )
+        self.assertEqual(datetime(2025, 1, 2, tzinfo=timezone.utc), self.user.last_login)
+        self.assertIn("Successfully rebuilt the counters of 1 users.", out.getvalue())
+
+    def test_rebuild_counters_nonexistent_user(self):
+        with self.assertRaises(CommandError):
+            call_command("rebuild_user_counters", username="ghost")
@@ -0,0 +1,110 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from impossible_travel.constants import AlertDetectionType
+from impossible_travel.models import Alert, Config, Login, TaskSettings, User, UsersIP
+from impossible_travel.modules import retention
+from impossible_travel.tasks import clean_models_periodically
+
+
+@override_settings(CERTEGO_BUFFALOGS_RETENTION_BATCH_SIZE=2, CERTEGO_BUFFALOGS_RETENTION_SLEEP_SECONDS=0)
+class TestRetention(TestCase):
+    def setUp(self):
+        self.old_date = timezone.now() - timedelta(days=100)
+        self.user = User.objects.create(username="Lorena Goldoni")
+        for i in range(5):
+            Login.objects.create(user=self.user, index="cloud", event_id=f"event_{i}")
+            Alert.objects.create(user=self.user, name=AlertDetectionType.NEW_DEVICE, login_raw_data={}, description=f"alert_{i}")
+            UsersIP.objects.create(user=self.user, ip=f"192.0.2.{i}")
+
+    def test_delete_in_chunks(self):
+        chunks = []
+        with self.assertNumQueries(12):
+            # for each chunk of 2 logins: a SELECT of the primary keys and a DELETE, in a transaction (a savepoint in the tests)
+            deleted = retention.delete_in_chunks(Login.objects.all(), after_chunk=chunks.append)
+        self.assertEqual(5, deleted)
+        self.assertEqual(3, len(chunks))
+        self.assertEqual(max(chunks), chunks[-1])
+        self.assertFalse(Login.objects.exists())
+
+    def test_delete_in_chunks_cascade(self):
+        # the logins, alerts and IPs of the users are deleted in chunks before the users
+        with patch("impossible_travel.modules.retention.delete_rows", side_effect=retention.delete_rows) as mock_delete_rows:
+            self.assertEqual(1, retention.delete_in_chunks(User.objects.all()))
+        deleted_models = [call.args[0] for call in mock_delete_rows.call_args_list]
+        self.assertEqual(3, deleted_models.count(Login))
+        self.assertEqual(3, deleted_models.count(Alert))
+        self.assertEqual(3, deleted_models.count(UsersIP))
+        self.assertIs(User, deleted_models[-1])
+        self.assertFalse(Login.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_delete_expired_resume(self):
+        Login.objects.update(updated=self.old_date)
+        logins = list(Login.objects.order_by("id"))
+        checkpoint = {"Login": logins[1].id}
+        with patch("impossible_travel.modules.retention.time.sleep") as mock_sleep:
+            deleted = retention.delete_expired(Login, timezone.now() - timedelta(days=45), checkpoint)
+        # the logins before the checkpoint aren't considered
+        self.assertEqual(3, deleted)
+        self.assertListEqual([logins[0].id, logins[1].id], list(Login.objects.order_by("id").values_list("id", flat=True)))
+        self.assertEqual({}, checkpoint)
+        mock_sleep.assert_called_once_with(0)
+
+    def test_clean_models_ip_max_days(self):
+        old_ips = UsersIP.objects.filter(ip__in=["192.0.2.0", "192.0.2.1"])
+        old_ips.update(updated=self.old_date)
+        clean_models_periodically()
+        self.assertListEqual(["192.0.2.2", "192.0.2.3", "192.0.2.4"], sorted(UsersIP.objects.values_list("ip", flat=True)))
+        self.assertEqual(5, Login.objects.count())
+        self.assertEqual({}, TaskSettings.objects.get(task_name="BuffalogsCleanModelsPeriodicallyTask").checkpoint)
+
+    def test_clean_models_checkpoint(self):
+        Alert.objects.update(updated=self.old_date)
+        alerts = list(Alert.objects.order_by("id").values_list("id", flat=True))
+        # the run is interrupted after the first chunk of alerts
+        with patch("impossible_travel.modules.retention.delete_rows", side_effect=[2, DatabaseError("connection lost")]):
+            with self.assertRaises(DatabaseError):
+                clean_models_periodically()
+        self.assertEqual({"Alert": alerts[1]}, TaskSettings.objects.get(task_name="BuffalogsCleanModelsPeriodicallyTask").checkpoint)
+        # the next run resumes from the checkpoint
+        with patch("impossible_travel.modules.retention.delete_rows", side_effect=retention.delete_rows) as mock_delete_rows:
+            clean_models_periodically()
+        self.assertListEqual(alerts[2:4], mock_delete_rows.call_args_list[0].args[1])
+        self.assertEqual({}, TaskSettings.objects.get(task_name="BuffalogsCleanModelsPeriodicallyTask").checkpoint)
+
+    def test_clean_models_counters(self):
+        Login.objects.filter(event_id__in=["event_0", "event_1", "event_2"]).update(updated=self.old_date)
+        Alert.objects.filter(description="alert_0").update(updated=self.old_date)
+        Config.objects.update_or_create(id=1, defaults={"risk_score_increment_alerts": [AlertDetectionType.NEW_DEVICE]})
+        User.rebuild_counters()
+        other_user = User.objects.create(username="Aisha Delgado", login_count=10)
+        clean_models_periodically()
+        # the counters of the users of the deleted logins and alerts are updated
+        self.user.refresh_from_db()
+        self.assertEqual(2, self.user.login_count)
+        self.assertEqual(4, self.user.alert_count)
+        self.assertEqual(4, self.user.risk_alert_count)
+        self.assertEqual(self.user.login_set.latest("timestamp").timestamp, self.user.last_login)
+        # the users without deleted rows aren't updated
+        other_user.refresh_from_db()
+        self.assertEqual(10, other_user.login_count)
+
+    def test_track_deleted_rows(self):
+        # the counters are decreased by the deleted rows, without counting all the rows of the user again
+        User.objects.filter(id=self.user.id).update(login_count=105)
+        with patch("impossible_travel.models.User.rebuild_counters") as mock_rebuild_counters:
+            retention.delete_rows(Login, list(Login.objects.order_by("id").values_list("id", flat=True)[:2]), User.track_deleted_rows)
+        mock_rebuild_counters.assert_not_called()
+        self.user.refresh_from_db()
+        self.assertEqual(103, self.user.login_count)
+        # the counters are rolled back with the failed deletion
+        with patch("impossible_travel.modules.retention.Collector.can_fast_delete", side_effect=DatabaseError("connection lost")):
+            with self.assertRaises(DatabaseError):
+                retention.delete_rows(Login, list(Login.objects.values_list("id", flat=True)), User.track_deleted_rows)
+        self.user.refresh_from_db()
+        self.assertEqual(103, self.user.login_count)
+        self.assertEqual(3, Login.objects.count())
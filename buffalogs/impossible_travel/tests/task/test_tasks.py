@@ -1,12 +1,23 @@
-from datetime import timedelta
+import threading
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 
+from django.conf import settings
 from django.db import connection
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from impossible_travel.constants import AlertDetectionType
-from impossible_travel.models import Alert, Login, User, UsersIP
-from impossible_travel.tasks import clean_models_periodically, process_logs, scheduled_alert_summary
+from impossible_travel.models import Alert, Login, TaskSettings, User, UsersIP
+from impossible_travel.tasks import (
+    clean_models_periodically,
+    detect_user_batch,
+    get_user_shard,
+    manage_partitions,
+    notify_alerts,
+    process_logs,
+    process_logs_completed,
+    scheduled_alert_summary,
+)
 from impossible_travel.tests.utils import patched_components
 
 
@@ -67,6 +78,24 @@ class TestTasks(TestCase):
         with self.assertRaises(UsersIP.DoesNotExist):
             UsersIP.objects.get(user__username="Lorena")
 
+    @patch("impossible_travel.tasks.partitioning.delete_old_partitioned_data")
+    @patch("impossible_travel.tasks.partitioning.is_partitioned", side_effect=lambda model: model is Login)
+    def test_clear_models_periodically_partitioned(self, mock_is_partitioned, mock_delete_partitioned):
+        """The retention of the partitioned tables drops their expired partitions"""
+        user_obj = User.objects.create(username="Lorena")
+        Alert.objects.create(user=user_obj, name=AlertDetectionType.NEW_COUNTRY.value, login_raw_data=self.raw_data_NEW_COUNTRY)
+        Alert.objects.filter(user=user_obj).update(updated=timezone.now() + timedelta(days=-100))
+        clean_models_periodically()
+        mock_delete_partitioned.assert_called_once()
+        self.assertIs(Login, mock_delete_partitioned.call_args.args[0])
+        self.assertFalse(Alert.objects.filter(user=user_obj).exists())
+
+    @patch("impossible_travel.tasks.partitioning.ensure_partitions", return_value=[])
+    @patch("impossible_travel.tasks.partitioning.is_partitioned", side_effect=lambda model: model is Alert)
+    def test_manage_partitions(self, mock_is_partitioned, mock_ensure_partitions):
+        manage_partitions()
+        mock_ensure_partitions.assert_called_once_with(Alert)
+
     def _scheduled_alert_summary_setup(self):
         """Setup for ScheduledAlertSummaryTask tests"""
         now = timezone.now()
@@ -108,7 +137,7 @@ class TestTasks(TestCase):
         alert3.refresh_from_db()
         alert4.refresh_from_db()
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_scheduled_alert_summary_daily(self, mock_post):
         """Test ScheduledAlertSummaryTask for 'daily'"""
         self._scheduled_alert_summary_setup()
@@ -127,7 +156,7 @@ class TestTasks(TestCase):
         self.assertIn("BuffaLogs - Scheduled Alert Summary", attachment["title"])
         self.assertIn("Total Alerts: 2", attachment["text"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_scheduled_alert_summary_weekly(self, mock_post):
         """Test ScheduledAlertSummaryTask for 'weekly'"""
         self._scheduled_alert_summary_setup()
@@ -146,7 +175,7 @@ class TestTasks(TestCase):
         self.assertIn("BuffaLogs - Scheduled Alert Summary", attachment["title"])
         self.assertIn("Total Alerts: 4", attachment["text"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_scheduled_alert_summary_no_alert(self, mock_post):
         """Test ScheduledAlertSummaryTask when no alerts are there"""
         mock_response = MagicMock()
@@ -200,3 +229,215 @@ class TestTasks(TestCase):
 
         self.assertEqual(User.objects.count(), 1)
         self.assertEqual(User.objects.get().username, "usera")
+
+    def test_get_user_shard(self):
+        # the shard is stable and the same for all the case variants of the username
+        self.assertEqual(get_user_shard("UserA", 4), get_user_shard("usera", 4))
+        self.assertEqual(get_user_shard("usera", 4), get_user_shard("usera", 4))
+        self.assertTrue(all(0 <= get_user_shard(f"user{i}", 4) < 4 for i in range(100)))
+        self.assertEqual(4, len({get_user_shard(f"user{i}", 4) for i in range(100)}))
+
+    @override_settings(CERTEGO_BUFFALOGS_DETECTION_SHARDS=2)
+    @patch("impossible_travel.tasks.celery_chain")
+    def test_process_logs_fan_out(self, mock_chain):
+        # in fan-out mode, the users are dispatched to the shard subtasks, without running the detection in the task
+        User.objects.all().delete()
+        end_date = timezone.now()
+        start_date = end_date - timedelta(minutes=30)
+        usernames = [f"user{i}" for i in range(10)]
+        with patched_components(patch_ingestion=True, patch_detection=True, users_return=usernames) as (ingestion_mock, detection_mock, _):
+            process_logs(start_date, end_date)
+        detection_mock.assert_not_called()
+        ingestion_mock.process_users.assert_called_once_with(start_date, end_date)
+        mock_chain.return_value.apply_async.assert_called_once()
+        (range_chord,) = mock_chain.call_args.args
+        self.assertEqual("BuffalogsProcessLogsCompletedTask", range_chord.body.task)
+        self.assertTupleEqual((start_date.isoformat(), end_date.isoformat()), range_chord.body.args)
+        shards = [header_task.args[0] for header_task in range_chord.tasks]
+        self.assertEqual(2, len(shards))
+        self.assertCountEqual(usernames, [username for shard in shards for username in shard])
+        for shard in shards:
+            self.assertEqual(1, len({get_user_shard(username, 2) for username in shard}))
+
+    @override_settings(CERTEGO_BUFFALOGS_DETECTION_SHARDS=2)
+    @patch("impossible_travel.tasks.celery_chain")
+    def test_process_logs_fan_out_no_users(self, mock_chain):
+        end_date = timezone.now()
+        start_date = end_date - timedelta(minutes=30)
+        with patched_components(patch_ingestion=True, patch_detection=True, users_return=[]):
+            process_logs(start_date, end_date)
+        # just the callback, to advance the TaskSettings
+        (callback,) = mock_chain.call_args.args
+        self.assertEqual("BuffalogsProcessLogsCompletedTask", callback.task)
+
+    @override_settings(CERTEGO_BUFFALOGS_DETECTION_SHARDS=2, CERTEGO_BUFFALOGS_DETECTION_LEASE_SECONDS=3600)
+    @patch("impossible_travel.tasks.celery_chain")
+    def test_process_logs_fan_out_pending(self, mock_chain):
+        # the windows are claimed before the dispatch, so the next runs don't dispatch them again while the chord is still running
+        now = timezone.now()
+        TaskSettings.objects.create(task_name=process_logs.__name__, start_date=now - timedelta(hours=2), end_date=now - timedelta(hours=1))
+        with patched_components(patch_ingestion=True, patch_detection=True, users_return=["user1"]) as (ingestion_mock, _, _):
+            process_logs()
+            dispatched_ranges = ingestion_mock.process_users.call_count
+            process_logs()
+        mock_chain.return_value.apply_async.assert_called_once()
+        self.assertEqual(dispatched_ranges, ingestion_mock.process_users.call_count)
+        process_task = TaskSettings.objects.get(task_name=process_logs.__name__)
+        # the claim expires if the chord doesn't complete, e.g. because a shard has failed
+        process_task.checkpoint["dispatched_at"] = (now - timedelta(hours=2)).isoformat()
+        process_task.save()
+        with patched_components(patch_ingestion=True, patch_detection=True, users_return=["user1"]):
+            process_logs()
+        self.assertEqual(2, mock_chain.return_value.apply_async.call_count)
+        # the claim is released by the callback of the last dispatched window
+        dispatched_end_date = TaskSettings.objects.get(task_name=process_logs.__name__).checkpoint["dispatched_end_date"]
+        process_logs_completed((now - timedelta(minutes=30)).isoformat(), dispatched_end_date)
+        self.assertEqual({}, TaskSettings.objects.get(task_name=process_logs.__name__).checkpoint)
+
+    @override_settings(CERTEGO_BUFFALOGS_DETECTION_SHARDS=2, CERTEGO_BUFFALOGS_DETECTION_LEASE_SECONDS=3600)
+    @patch("impossible_travel.tasks.celery_chain")
+    def test_process_logs_fan_out_completed_shards(self, mock_chain):
+        # when the claim expires, the same windows are dispatched again without the shards already completed
+        now = timezone.now()
+        TaskSettings.objects.create(task_name=process_logs.__name__, start_date=now - timedelta(hours=2), end_date=now - timedelta(hours=1))
+        usernames = [f"user{i}" for i in range(10)]
+        with patched_components(patch_ingestion=True, patch_detection=True, users_return=usernames):
+            process_logs()
+        first_chord = mock_chain.call_args.args[0]
+        windows = TaskSettings.objects.get(task_name=process_logs.__name__).checkpoint["windows"]
+        # each shard is dispatched with the dates of its own window
+        self.assertListEqual([tuple(window) for window in windows], [range_chord.tasks[0].args[1:] for range_chord in mock_chain.call_args.args])
+        completed_task = first_chord.tasks[0]
+        with patched_components(patch_ingestion=True, patch_detection=True, logins_return=[]):
+            detect_user_batch(*completed_task.args, **completed_task.kwargs)
+        process_task = TaskSettings.objects.get(task_name=process_logs.__name__)
+        self.assertListEqual([f"{windows[0][0]}/{completed_task.kwargs['shard']}"], process_task.checkpoint["completed_shards"])
+        process_task.checkpoint["dispatched_at"] = (now - timedelta(hours=2)).isoformat()
+        process_task.save()
+        with patched_components(patch_ingestion=True, patch_detection=True, users_return=usernames) as (ingestion_mock, _, _):
+            with self.assertLogs("impossible_travel.tasks", level="WARNING"):
+                process_logs()
+        self.assertListEqual(windows, TaskSettings.objects.get(task_name=process_logs.__name__).checkpoint["windows"])
+        # the first window is dispatched with the other shard only
+        (dispatched_shard,) = mock_chain.call_args.args[0].tasks
+        self.assertListEqual(first_chord.tasks[1].args[0], dispatched_shard.args[0])
+        # the completed shards of a window are removed by its callback
+        process_logs_completed(*windows[0])
+        self.assertListEqual([], TaskSettings.objects.get(task_name=process_logs.__name__).checkpoint["completed_shards"])
+
+    def test_detect_user_batch(self):
+        User.objects.all().delete()
+        end_date = timezone.now()
+        start_date = end_date - timedelta(minutes=30)
+        with patched_components(patch_ingestion=True, patch_detection=True, logins_return=[{}], normalized_return=[{"id": "login_1"}]) as (
+            ingestion_mock,
+            detection_mock,
+            _,
+        ):
+            detect_user_batch(["UserA", "UserB"], start_date.isoformat(), end_date.isoformat())
+        ingestion_mock.process_users_logins.assert_called_once_with(start_date, end_date, ["UserA", "UserB"])
+        self.assertEqual(2, detection_mock.call_count)
+        self.assertListEqual(["usera", "userb"], list(User.objects.order_by("username").values_list("username", flat=True)))
+
+    def test_process_logs_completed(self):
+        end_date = timezone.now()
+        start_date = end_date - timedelta(minutes=30)
+        process_logs_completed(start_date.isoformat(), end_date.isoformat())
+        process_task = TaskSettings.objects.get(task_name=process_logs.__name__)
+        self.assertEqual(start_date, process_task.start_date)
+        self.assertEqual(end_date, process_task.end_date)
+
+    def test_process_logs_backlog(self):
+        # the backlog is drained by the next runs without losing data: the 2 days of backlog (96 windows of 30 minutes)
+        # are drained in CERTEGO_BUFFALOGS_BACKLOG_DRAIN_RUNS runs, 24 windows for each run
+        now = timezone.now()
+        TaskSettings.objects.create(task_name=process_logs.__name__, start_date=now - timedelta(days=2, minutes=30), end_date=now - timedelta(days=2))
+        with patched_components(patch_ingestion=True, patch_detection=True) as (ingestion_mock, _, _):
+            with self.assertLogs("impossible_travel.tasks", level="WARNING") as logs:
+                process_logs()
+        process_task = TaskSettings.objects.get(task_name=process_logs.__name__)
+        self.assertEqual(now - timedelta(days=2) + timedelta(minutes=690), process_task.start_date)
+        self.assertEqual(now - timedelta(days=2) + timedelta(minutes=720), process_task.end_date)
+        self.assertEqual(24, ingestion_mock.process_logins_bulk.call_count)
+        self.assertIn(f"Backlog of the logins from {process_task.end_date}", logs.output[0])
+
+    def test_process_logs_window_failed(self):
+        # a window whose logins can't be fetched isn't marked as processed, so it's processed again by the next run
+        now = timezone.now()
+        TaskSettings.objects.create(task_name=process_logs.__name__, start_date=now - timedelta(days=2, minutes=30), end_date=now - timedelta(days=2))
+        with patched_components(patch_ingestion=True, patch_detection=True) as (ingestion_mock, _, _):
+            ingestion_mock.process_logins_bulk.side_effect = [[], ConnectionError("connection lost")]
+            with self.assertRaises(ConnectionError):
+                process_logs()
+        process_task = TaskSettings.objects.get(task_name=process_logs.__name__)
+        self.assertEqual(now - timedelta(days=2) + timedelta(minutes=30), process_task.end_date)
+
+    def test_process_logs_backlog_no_cutoff(self):
+        # the whole backlog is processed, without any cutoff by default
+        now = timezone.now()
+        TaskSettings.objects.create(task_name=process_logs.__name__, start_date=now - timedelta(days=30, minutes=30), end_date=now - timedelta(days=30))
+        with patched_components(patch_ingestion=True, patch_detection=True) as (ingestion_mock, _, _):
+            with self.assertNoLogs("impossible_travel.tasks", level="ERROR"):
+                process_logs()
+        first_start_date, _ = ingestion_mock.process_logins_bulk.call_args_list[0].args
+        self.assertEqual(now - timedelta(days=30), first_start_date)
+
+    @override_settings(CELERY_RESULT_BACKEND="redis://localhost", CERTEGO_BUFFALOGS_BACKLOG_SHARDS=3)
+    @patch("impossible_travel.tasks.celery_chain")
+    def test_process_logs_backlog_fan_out(self, mock_chain):
+        # the backlog windows are dispatched to the shards, even if the fan-out isn't enabled
+        now = timezone.now()
+        TaskSettings.objects.create(task_name=process_logs.__name__, start_date=now - timedelta(days=2, minutes=30), end_date=now - timedelta(days=2))
+        with patched_components(patch_ingestion=True, patch_detection=True, users_return=[f"user{i}" for i in range(10)]) as (
+            ingestion_mock,
+            detection_mock,
+            _,
+        ):
+            process_logs()
+        detection_mock.assert_not_called()
+        ingestion_mock.process_logins_bulk.assert_not_called()
+        mock_chain.return_value.apply_async.assert_called_once()
+        range_chords = mock_chain.call_args.args
+        self.assertLess(settings.CERTEGO_BUFFALOGS_MAX_WINDOWS_PER_RUN, len(range_chords))
+        self.assertEqual(now - timedelta(days=2), datetime.fromisoformat(range_chords[0].body.args[0]))
+        self.assertTrue(all(len(range_chord.tasks) == 3 for range_chord in range_chords))
+        self.assertEqual(3, TaskSettings.objects.get(task_name=process_logs.__name__).checkpoint["shards"])
+
+    @override_settings(CERTEGO_BUFFALOGS_MAX_BACKLOG_DAYS=7)
+    def test_process_logs_data_lost(self):
+        # the backlog older than CERTEGO_BUFFALOGS_MAX_BACKLOG_DAYS is skipped, if set
+        now = timezone.now()
+        TaskSettings.objects.create(task_name=process_logs.__name__, start_date=now - timedelta(days=30, minutes=30), end_date=now - timedelta(days=30))
+        with patched_components(patch_ingestion=True, patch_detection=True) as (ingestion_mock, _, _):
+            with self.assertLogs("impossible_travel.tasks", level="INFO") as logs:
+                process_logs()
+        self.assertTrue(any(message.startswith("ERROR:impossible_travel.tasks:Data lost") for message in logs.output))
+        first_start_date, _ = ingestion_mock.process_logins_bulk.call_args_list[0].args
+        self.assertLess(now - timedelta(days=7, minutes=1), first_start_date)
+
+    @patch("impossible_travel.tasks.AlertFactory")
+    def test_notify_alerts_concurrent(self, mock_factory):
+        # the slow alerter waits for the fast one, so it completes only if they run concurrently
+        fast_done = threading.Event()
+        slow_alerter, fast_alerter, failing_alerter = MagicMock(), MagicMock(), MagicMock()
+        slow_alerter.notify_alerts.side_effect = lambda **kwargs: self.assertTrue(fast_done.wait(timeout=10))
+        fast_alerter.notify_alerts.side_effect = lambda **kwargs: fast_done.set()
+        failing_alerter.notify_alerts.side_effect = ValueError("endpoint unreachable")
+        mock_factory.return_value.get_alert_classes.return_value = [slow_alerter, failing_alerter, fast_alerter]
+        with self.assertLogs("impossible_travel.tasks", level="ERROR") as logs:
+            notify_alerts()
+        self.assertIn("endpoint unreachable", logs.output[0])
+        task_settings = TaskSettings.objects.get(task_name="NotifyAlertsTask")
+        for alerter in (slow_alerter, fast_alerter, failing_alerter):
+            alerter.notify_alerts.assert_called_once_with(start_date=task_settings.start_date - timedelta(minutes=30), end_date=task_settings.start_date)
+
+    @override_settings(CERTEGO_BUFFALOGS_NOTIFY_MAX_WORKERS=1)
+    @patch("impossible_travel.tasks.AlertFactory")
+    def test_notify_alerts_sequential(self, mock_factory):
+        threads = []
+        alerters = [MagicMock(), MagicMock()]
+        for alerter in alerters:
+            alerter.notify_alerts.side_effect = lambda **kwargs: threads.append(threading.current_thread())
+        mock_factory.return_value.get_alert_classes.return_value = alerters
+        notify_alerts()
+        self.assertListEqual([threading.main_thread()] * 2, threads)
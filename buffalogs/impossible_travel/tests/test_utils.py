@@ -1,6 +1,9 @@
 import unittest
+from unittest.mock import patch
 
-from impossible_travel.utils.utils import build_device_fingerprint
+from django.test import override_settings
+from impossible_travel.utils.utils import build_device_fingerprint, clear_user_agent_cache, get_user_agent_cache_info, parse_user_agent
+from ua_parser import user_agent_parser
 
 
 class TestBuildDeviceFingerprint(unittest.TestCase):
@@ -73,3 +76,37 @@ class TestBuildDeviceFingerprint(unittest.TestCase):
         # The parser should still return something, but likely unknown
         self.assertTrue(len(result) > 0)
         self.assertIn("unknown", result)
+
+
+class TestParseUserAgent(unittest.TestCase):
+
+    def setUp(self):
+        clear_user_agent_cache()
+
+    def test_cache_hits(self):
+        """The user-agent is parsed once, then the cached result is used by all the callers"""
+        ua = "Mozilla/5.0 (Linux; Android 13; SM-G998U) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Mobile Safari/537.36"
+        with patch("impossible_travel.utils.utils.user_agent_parser.Parse", wraps=user_agent_parser.Parse) as mock_parse:
+            parsed = parse_user_agent(ua)
+            self.assertEqual(parsed.fingerprint, build_device_fingerprint(ua))
+            self.assertEqual(parsed, parse_user_agent(ua))
+        mock_parse.assert_called_once_with(ua)
+        self.assertEqual("Android", parsed.os_family)
+        self.assertTrue(parsed.is_mobile)
+        cache_info = get_user_agent_cache_info()
+        self.assertEqual(2, cache_info["hits"])
+        self.assertEqual(1, cache_info["misses"])
+        self.assertEqual(1, cache_info["size"])
+
+    def test_not_mobile(self):
+        """Desktop, unknown and empty user-agents aren't mobile devices"""
+        for ua in ["Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36", "curl/8.0", ""]:
+            self.assertFalse(parse_user_agent(ua).is_mobile)
+        self.assertIsNone(parse_user_agent("").os_family)
+
+    def test_cache_size(self):
+        """The cache size is read from the settings when the cache is used, not when the module is imported"""
+        with override_settings(CERTEGO_BUFFALOGS_USER_AGENT_CACHE_SIZE=1):
+            parse_user_agent("curl/8.0")
+            parse_user_agent("Wget/1.21")
+            self.assertDictEqual({"hits": 0, "misses": 2, "size": 1, "max_size": 1}, get_user_agent_cache_info())
@@ -66,8 +66,14 @@ def patched_components(
     if patch_ingestion:
         ingestion_mock = MagicMock()
         ingestion_mock.process_users.return_value = users_return or []
+        ingestion_mock.count_logins.return_value = None
         ingestion_mock.process_user_logins.return_value = logins_return or []
         ingestion_mock.normalize_fields.return_value = normalized_return or []
+        ingestion_mock.process_logins_bulk.return_value = [(username, logins_return or []) for username in users_return or []]
+        ingestion_mock.iter_normalized_fields.side_effect = lambda logins: iter(normalized_return or [])
+        ingestion_mock.process_users_logins.side_effect = lambda start_date, end_date, usernames: (
+            (username, iter(logins_return or [])) for username in usernames
+        )
 
         p_ing = patch("impossible_travel.tasks.IngestionFactory")
 
@@ -0,0 +1,124 @@
+import random
+from datetime import datetime, timedelta
+
+# (country, latitude, longitude) of the synthetic logins
+COUNTRIES = [
+    ("Italy", 41.8919, 12.5113),
+    ("Germany", 52.5244, 13.4105),
+    ("France", 48.8534, 2.3488),
+    ("Spain", 40.4165, -3.7026),
+    ("United Kingdom", 51.5085, -0.1257),
+    ("United States", 40.7143, -74.006),
+    ("Canada", 45.4112, -75.6981),
+    ("Brazil", -15.7797, -47.9297),
+    ("Argentina", -34.6132, -58.3772),
+    ("Japan", 35.6895, 139.6917),
+    ("China", 39.9075, 116.3972),
+    ("India", 28.6358, 77.2245),
+    ("Australia", -33.8678, 151.2073),
+    ("South Africa", -25.7449, 28.1878),
+    ("Egypt", 30.0626, 31.2497),
+    ("Russia", 55.7522, 37.6156),
+    ("Turkey", 39.9199, 32.8543),
+    ("Mexico", 19.4285, -99.1277),
+    ("Nigeria", 9.0579, 7.4951),
+    ("Indonesia", -6.2146, 106.8451),
+]
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:109.0) Gecko/20100101 Firefox/109.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
+    "Mozilla/5.0 (iPad; CPU OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1",
+]
+
+
+class SyntheticLoginsGenerator:
+    """
+    Generator of synthetic login streams, with the same structure of the logins returned by the Elasticsearch ingestion.
+    Each user logs in from a home country with a couple of devices, while a share of the logins (anomaly_rate) are anomalies:
+    logins from another country (possible impossible travel), from a new device or from an anonymizer IP
+    """
+
+    ANOMALIES = ["country", "device", "anonymizer"]
+
+    def __init__(
+        self,
+        users: int,
+        logins_per_user: int,
+        countries: int = 5,
+        user_agents: int = 5,
+        anomaly_rate: float = 0.05,
+        seed: int = None,
+        username_prefix: str = "synthetic_user",
+    ):
+        self.users = users
+        self.logins_per_user = logins_per_user
+        self.countries = COUNTRIES[: max(1, min(countries, len(COUNTRIES)))]
+        self.user_agents = USER_AGENTS[: max(1, min(user_agents, len(USER_AGENTS)))]
+        self.anomaly_rate = anomaly_rate
+        self.username_prefix = username_prefix
+        self.random = random.Random(seed)
+
+    def generate(self, end_date: datetime) -> dict:
+        """Generate the logins of all the users, before the end_date
+
+        :param end_date: the datetime of the most recent login
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: the logins of each user {username: [login, ...]}, from the oldest to the most recent one
+        :rtype: dict
+        """
+        return {f"{self.username_prefix}_{user}": self.generate_user_logins(user, end_date) for user in range(self.users)}
+
+    def generate_user_logins(self, user: int, end_date: datetime) -> list:
+        """Generate the logins of a single user, one every 5-60 minutes
+
+        :param user: the user number
+        :type user: int
+        :param end_date: the datetime of the most recent login
+        :type end_date: datetime (with tzinfo=datetime.timezone.utc)
+
+        :return: the logins of the user, from the oldest to the most recent one
+        :rtype: list
+        """
+        home_country = self.random.choice(self.countries)
+        devices = self.random.sample(self.user_agents, k=min(2, len(self.user_agents)))
+        timestamp = end_date
+        logins = []
+        for login in range(self.logins_per_user):
+            country, agent, intelligence_category = home_country, self.random.choice(devices), ""
+            if self.random.random() < self.anomaly_rate:
+                match self.random.choice(self.ANOMALIES):
+                    case "country":
+                        country = self.random.choice(self.countries)
+                    case "device":
+                        agent = self.random.choice(self.user_agents)
+                    case "anonymizer":
+                        intelligence_category = "anonymizer"
+            logins.append(self._build_login(f"{self.username_prefix}_{user}", f"{user}_{login}", timestamp, country, agent, intelligence_category))
+            timestamp -= timedelta(minutes=self.random.randint(5, 60))
+        return logins[::-1]
+
+    def _build_login(self, username: str, event_id: str, timestamp: datetime, country: tuple, agent: str, intelligence_category: str) -> dict:
+        country_name, lat, lon = country
+        return {
+            "_index": "cloud",
+            "_id": f"synthetic_{event_id}",
+            "@timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+            "user": {"name": username},
+            "user_agent": {"original": agent},
+            "source": {
+                # a different IP for each country, to trigger the impossible travel check
+                "ip": f"198.51.{COUNTRIES.index(country)}.{self.random.randint(1, 254)}",
+                "as": {"organization": {"name": f"{country_name} ISP"}},
+                "geo": {"country_name": country_name, "location": {"lat": lat, "lon": lon}},
+                "intelligence_category": intelligence_category,
+            },
+        }
@@ -1,13 +1,73 @@
 import logging
+from functools import lru_cache
+from typing import NamedTuple
 
+from django.conf import settings
 from ua_parser import user_agent_parser
 
 logger = logging.getLogger(__name__)
 
 
+class ParsedUserAgent(NamedTuple):
+    """Result of the user-agent parsing, shared by the detection (device fingerprint) and the alert filters (mobile devices)"""
+
+    fingerprint: str
+    os_family: str | None
+
+    @property
+    def is_mobile(self) -> bool:
+        return self.os_family in settings.CERTEGO_BUFFALOGS_MOBILE_DEVICES
+
+
+# LRU cache of the parsed user-agents, built at the first parsing and not at import time, so the cache size is read from the loaded settings
+_user_agent_cache = None
+
+
+def _get_user_agent_cache():
+    """Return the cached parsing function, built again if CERTEGO_BUFFALOGS_USER_AGENT_CACHE_SIZE has changed"""
+    global _user_agent_cache
+    if _user_agent_cache is None or _user_agent_cache.cache_parameters()["maxsize"] != settings.CERTEGO_BUFFALOGS_USER_AGENT_CACHE_SIZE:
+        _user_agent_cache = lru_cache(maxsize=settings.CERTEGO_BUFFALOGS_USER_AGENT_CACHE_SIZE)(_parse_user_agent)
+    return _user_agent_cache
+
+
+def parse_user_agent(agent: str) -> ParsedUserAgent:
+    """
+    Parse the user-agent once, with an in-process LRU cache of the CERTEGO_BUFFALOGS_USER_AGENT_CACHE_SIZE most recent user-agents:
+    the logins have few distinct user-agents, so the ua_parser regexes are run once for each of them.
+    The cache hits and misses are returned by get_user_agent_cache_info()
+
+    :param agent: the user-agent string
+    :type agent: str
+
+    :return: the device fingerprint and the OS family
+    :rtype: ParsedUserAgent
+    """
+    return ParsedUserAgent(*_get_user_agent_cache()(agent))
+
+
+def get_user_agent_cache_info() -> dict:
+    """Return the statistics of the user-agent parsing cache"""
+    cache_info = _get_user_agent_cache().cache_info()
+    return {"hits": cache_info.hits, "misses": cache_info.misses, "size": cache_info.currsize, "max_size": cache_info.maxsize}
+
+
+def clear_user_agent_cache():
+    """Empty the user-agent parsing cache and reset its statistics"""
+    _get_user_agent_cache().cache_clear()
+
+
 def build_device_fingerprint(agent: str) -> str:
     """
-    Builds a normalized device fingerprint string: os-osversionmajor-device-browser.
+    Builds a normalized device fingerprint string: os-osversionmajor-device-browser, using the cached parsing of the user-agent.
+    Example output: 'windows-10-desktop-chrome'.
+    """
+    return parse_user_agent(agent).fingerprint
+
+
+def _parse_user_agent(agent: str) -> tuple:
+    """
+    Builds a normalized device fingerprint string: os-osversionmajor-device-browser, and returns it with the OS family of the user-agent.
     Example output: 'windows-10-desktop-chrome'.
 
     Fallbacks:
@@ -17,6 +77,9 @@ def build_device_fingerprint(agent: str) -> str:
     - Browser missing -> 'unknownbrowser'
 
     Returns 'unknownos-unknownosmajor-unknowndevice-unknownbrowser' if UA is empty or invalid.
+
+    :return: the device fingerprint and the OS family (None if it's not found)
+    :rtype: tuple(str, str)
     """
 
     UNKNOWN_OS = "unknownos"
@@ -28,13 +91,13 @@ def build_device_fingerprint(agent: str) -> str:
 
     # Check if the agent is provided
     if not agent:
-        return UNKNOWN_FINGERPRINT
+        return UNKNOWN_FINGERPRINT, None
 
     try:
         parsed = user_agent_parser.Parse(agent)
     except Exception:
         logger.exception(f"Error parsing user agent '{agent}'")
-        return UNKNOWN_FINGERPRINT
+        return UNKNOWN_FINGERPRINT, None
 
     # Get the relevant data, with fallbacks to empty dict if not found
     os_data = parsed.get("os", {}) or {}
@@ -42,7 +105,8 @@ def build_device_fingerprint(agent: str) -> str:
     device_data = parsed.get("device", {}) or {}
 
     # Extract values with fallbacks
-    os_family = (os_data.get("family") or UNKNOWN_OS).strip().lower()
+    raw_os_family = os_data.get("family")
+    os_family = (raw_os_family or UNKNOWN_OS).strip().lower()
     os_major = (os_data.get("major") or UNKNOWN_OS_MAJOR).strip().lower()
     device_family = (device_data.get("family") or UNKNOWN_DEVICE).strip().lower()
     browser_family = (ua_data.get("family") or UNKNOWN_BROWSER).strip().lower()
@@ -66,6 +130,6 @@ def build_device_fingerprint(agent: str) -> str:
 
     # if all values are unkwown, return the fallback string
     if fingerprint == UNKNOWN_FINGERPRINT:
-        return UNKNOWN_FINGERPRINT
+        return UNKNOWN_FINGERPRINT, raw_os_family
 
-    return fingerprint
+    return fingerprint, raw_os_family
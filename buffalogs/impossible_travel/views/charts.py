@@ -22,7 +22,7 @@ def aggregate_alerts_interval(start_date, end_date, interval, date_fmt):
 
     while current_date < end_date:
         next_date = current_date + interval
-        count = Alert.objects.filter(login_raw_data__timestamp__range=(current_date.isoformat(), next_date.isoformat())).count()
+        count = Alert.objects.filter(login_timestamp__range=(current_date, next_date)).count()
         aggregated_data[current_date.strftime(date_fmt)] = count
         current_date = next_date
     return aggregated_data
@@ -99,24 +99,17 @@ def world_map_chart_api(request):
     result = []
     tmp = []
     for key, value in countries.items():
-        country_alerts = Alert.objects.filter(
-            login_raw_data__timestamp__range=(start_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ"), end_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
-            login_raw_data__country__iexact=key,
-        )
+        country_alerts = Alert.objects.filter(login_timestamp__range=(start_date, end_date), country__iexact=key)
         if country_alerts:
             for alert in country_alerts:
-                if [alert.login_raw_data["country"], alert.login_raw_data["lat"], alert.login_raw_data["lon"]] not in tmp:
-                    tmp.append([alert.login_raw_data["country"], alert.login_raw_data["lat"], alert.login_raw_data["lon"]])
+                if [alert.country, alert.latitude, alert.longitude] not in tmp:
+                    tmp.append([alert.country, alert.latitude, alert.longitude])
                     result.append(
                         {
                             "country": value.lower(),
-                            "lat": alert.login_raw_data["lat"],
-                            "lon": alert.login_raw_data["lon"],
-                            "alerts": Alert.objects.filter(
-                                login_raw_data__country__iexact=key,
-                                login_raw_data__lat=alert.login_raw_data["lat"],
-                                login_raw_data__lon=alert.login_raw_data["lon"],
-                            ).count(),
+                            "lat": alert.latitude,
+                            "lon": alert.longitude,
+                            "alerts": Alert.objects.filter(country__iexact=key, latitude=alert.latitude, longitude=alert.longitude).count(),
                         }
                     )
     return HttpResponse(json.dumps(result), content_type="application/json")